@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_fix_batch_code_constraint'),
+        ('core', '0005_sequence'),
+        ('students', '0008_duplicatekey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batchattendance',
+            index=models.Index(fields=['batch', '-date', '-id'], name='batches_attendance_page'),
+        ),
+        migrations.AddIndex(
+            model_name='batchgrade',
+            index=models.Index(fields=['batch', '-updated_at', '-id'], name='batches_grade_page'),
+        ),
+    ]
@@ -87,6 +87,10 @@ class BatchAttendance(BaseModel):
     
     class Meta:
         unique_together = ['student', 'date', 'course']
+        indexes = [
+            # Keyset pagination of a batch's attendance, newest first
+            models.Index(fields=['batch', '-date', '-id'], name='batches_attendance_page'),
+        ]
     
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.date} - {self.status}"
@@ -120,6 +124,10 @@ class BatchGrade(BaseModel):
     
     class Meta:
         unique_together = ['student', 'course', 'semester']
+        indexes = [
+            # Keyset pagination of a batch's grades, most recently updated first
+            models.Index(fields=['batch', '-updated_at', '-id'], name='batches_grade_page'),
+        ]
     
     def __str__(self):
         return f"{self.student.user.get_full_name()} - {self.course.name} - {self.total_score}"
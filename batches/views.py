@@ -9,8 +9,10 @@ from django.views import View
 from django.core.paginator import Paginator
 from django.db.models import Q
 from .models import Batch, BatchSchedule, BatchAttendance, BatchGrade
-from students.models import Student
+from students.models import Student, StudentSummary
+from students.search import search
 from core.models import Course, Semester
+from core.pagination import CursorPaginator
 import json
 
 @login_required
@@ -245,27 +247,24 @@ def batch_detail(request, batch_id):
 def batch_students(request, batch_id):
     """Batch students view"""
     batch = get_object_or_404(Batch, id=batch_id, is_active=True)
-    students = batch.students.filter(is_active=True).select_related('user')
+    # Summary rows of active students, read off the (batch, student_code) index
+    students = StudentSummary.objects.filter(batch=batch).order_by('student_code')
     
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        students = students.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query)
-        )
+        students = search(students, search_query)
     
     # Pagination
-    paginator = Paginator(students, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(students, 20)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'title': f'Students - {batch.name}',
         'batch': batch,
         'page_obj': page_obj,
         'search_query': search_query,
+        'total_students': paginator.count,
     }
     
     return render(request, 'batches/batch_students.html', context)
@@ -311,9 +310,8 @@ def batch_attendance(request, batch_id):
         attendance_records = attendance_records.filter(course_id=course_filter)
     
     # Pagination
-    paginator = Paginator(attendance_records, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(attendance_records, 50, approximate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'title': f'Attendance - {batch.name}',
@@ -345,9 +343,8 @@ def batch_grades(request, batch_id):
         grades = grades.filter(semester_id=semester_filter)
     
     # Pagination
-    paginator = Paginator(grades, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(grades, 50, approximate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'title': f'Grades - {batch.name}',
@@ -22,6 +22,10 @@ class Contact(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the contact list
+            models.Index(fields=['-created_at', '-id'], name='contacts_contact_page'),
+        ]
         verbose_name = 'Contact'
         verbose_name_plural = 'Contacts'
     
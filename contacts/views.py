@@ -1,14 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
 from .models import Contact
+from students.search import search
+from core.pagination import CursorPaginator
 import json
 
 
@@ -20,22 +20,16 @@ def contact_list(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        contacts = contacts.filter(
-            Q(name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(phone__icontains=search_query) |
-            Q(notes__icontains=search_query)
-        )
+        contacts = search(contacts, search_query, kind='contact')
     
     # Pagination
-    paginator = Paginator(contacts, 20)  # Show 20 contacts per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(contacts, 20, approximate_count=True)  # Show 20 contacts per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
-        'total_contacts': contacts.count(),
+        'total_contacts': paginator.count,
     }
     
     return render(request, 'contacts/contact_list.html', context)
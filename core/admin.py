@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Currency, AcademicYear, Semester, Course, FeeStructure, Notification
+from .models import Currency, AcademicYear, Semester, Course, FeeStructure, Notification, BackgroundJob, Sequence
 
 @admin.register(Currency)
 class CurrencyAdmin(admin.ModelAdmin):
@@ -42,4 +42,16 @@ class NotificationAdmin(admin.ModelAdmin):
     list_filter = ['notification_type', 'is_read', 'created_at']
     search_fields = ['title', 'message', 'recipient__username']
     autocomplete_fields = ['recipient']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ['label', 'kind', 'status', 'progress_current', 'progress_total', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    search_fields = ['label', 'kind', 'created_by__username']
+    readonly_fields = ['created_at', 'updated_at', 'started_at', 'finished_at']
+
+@admin.register(Sequence)
+class SequenceAdmin(admin.ModelAdmin):
+    list_display = ['prefix', 'year', 'last_value']
+    list_filter = ['prefix', 'year']
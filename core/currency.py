@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.models import F, Value, Case, When, DecimalField, ExpressionWrapper
+from decimal import Decimal
+import threading
+import time
+
+from .models import Currency
+
+MONEY_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+class UnknownCurrency(ValueError):
+    """A currency code with no Currency row"""
+
+
+class CurrencyRates:
+    """Currency rows, with ``exchange_rate`` in units per US dollar, held in process memory"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._currencies = None
+        self._loaded_at = 0
+    
+    def _load(self):
+        # Every currency, active or not, since old payments may still point at retired ones
+        return {
+            currency['code']: currency
+            for currency in Currency.objects.values('id', 'code', 'name', 'symbol', 'exchange_rate', 'is_default')
+        }
+    
+    def currencies(self):
+        """Currency values by code, read from the database at most once per cache period"""
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > settings.CURRENCY_RATE_CACHE_SECONDS
+            if self._currencies is None or expired:
+                self._currencies = self._load()
+                self._loaded_at = time.monotonic()
+            return self._currencies
+    
+    def invalidate(self):
+        with self._lock:
+            self._currencies = None
+    
+    def rates(self):
+        return {code: currency['exchange_rate'] for code, currency in self.currencies().items()}
+    
+    def get(self, code):
+        currency = self.currencies().get(code)
+        if currency is None:
+            raise UnknownCurrency(f'Unknown currency: {code}')
+        return currency
+    
+    def rate(self, code):
+        rate = self.get(code)['exchange_rate']
+        if not rate:
+            raise UnknownCurrency(f'{code} has no exchange rate.')
+        return rate
+    
+    def reporting_currency(self):
+        """The currency aggregate figures are reported in: REPORTING_CURRENCY, else the default one"""
+        currencies = self.currencies()
+        code = settings.REPORTING_CURRENCY
+        if not code:
+            code = next((code for code, currency in currencies.items() if currency['is_default']), 'USD')
+        return self.get(code)
+    
+    def convert(self, amount, from_code, to_code):
+        return self.convert_many([amount], from_code, to_code)[0]
+    
+    def convert_many(self, amounts, from_code, to_code):
+        """Convert a list of amounts between two currencies with one rate lookup"""
+        if from_code == to_code:
+            self.get(from_code)
+            return [Decimal(str(amount)).quantize(Decimal('0.01')) for amount in amounts]
+        
+        from_rate = self.rate(from_code)
+        to_rate = self.rate(to_code)
+        return [
+            (Decimal(str(amount)) * to_rate / from_rate).quantize(Decimal('0.01'))
+            for amount in amounts
+        ]
+    
+    def converted(self, amount_field, currency_field='currency_id', to_code=None):
+        """SQL expression for ``amount_field`` in ``to_code`` (the reporting currency), for use inside Sum()"""
+        target = self.get(to_code) if to_code else self.reporting_currency()
+        
+        whens = []
+        for currency in self.currencies().values():
+            if currency['id'] == target['id']:
+                whens.append(When(**{currency_field: currency['id']}, then=F(amount_field)))
+            elif currency['exchange_rate']:
+                whens.append(When(
+                    **{currency_field: currency['id']},
+                    then=ExpressionWrapper(
+                        F(amount_field) * Value(target['exchange_rate']) / Value(currency['exchange_rate']),
+                        output_field=MONEY_FIELD
+                    )
+                ))
+        # Amounts in a currency without a rate count as nothing rather than as the wrong unit
+        return Case(*whens, default=Value(Decimal('0')), output_field=MONEY_FIELD)
+
+
+currency_rates = CurrencyRates()
@@ -73,29 +73,21 @@ class CurrencyConverter:
     
     @staticmethod
     def get_exchange_rates():
-        """Get current exchange rates (mock implementation)"""
-        # In production, integrate with a real currency API
-        return {
-            'USD': 1.0,
-            'BDT': 110.0,  # 1 USD = 110 BDT
-            'AUD': 1.5,    # 1 USD = 1.5 AUD
-            'INR': 83.0,   # 1 USD = 83 INR
-            'PKR': 280.0   # 1 USD = 280 PKR
-        }
+        """Current exchange rates (units per US dollar) from Currency.exchange_rate"""
+        from .currency import currency_rates
+        return {code: float(rate) for code, rate in currency_rates.rates().items()}
     
     @staticmethod
     def convert_currency(amount, from_currency, to_currency):
         """Convert amount from one currency to another"""
-        rates = CurrencyConverter.get_exchange_rates()
-        
-        if from_currency == to_currency:
-            return amount
-        
-        # Convert to USD first, then to target currency
-        usd_amount = amount / rates.get(from_currency, 1)
-        converted_amount = usd_amount * rates.get(to_currency, 1)
-        
-        return round(converted_amount, 2)
+        from .currency import currency_rates
+        return float(currency_rates.convert(amount, from_currency, to_currency))
+    
+    @staticmethod
+    def convert_amounts(amounts, from_currency, to_currency):
+        """Convert a list of amounts from one currency to another"""
+        from .currency import currency_rates
+        return [float(amount) for amount in currency_rates.convert_many(amounts, from_currency, to_currency)]
     
     @staticmethod
     def format_currency(amount, currency):
@@ -5,6 +5,8 @@ import uuid
 from datetime import datetime
 import json
 
+FIRESTORE_BATCH_LIMIT = 500
+
 class FirebaseManager:
     """Firebase operations manager"""
     
@@ -42,6 +44,24 @@ class FirebaseManager:
         doc_ref.update(data)
         return True
     
+    def create_documents(self, collection, documents):
+        """Create many documents from (doc_id, data) pairs using batched writes"""
+        count = 0
+        batch = self.db.batch()
+        for doc_id, data in documents:
+            data['created_at'] = datetime.utcnow()
+            data['updated_at'] = datetime.utcnow()
+            batch.set(self.db.collection(collection).document(doc_id), data)
+            count += 1
+            
+            # Firestore commits at most 500 writes per batch
+            if count % FIRESTORE_BATCH_LIMIT == 0:
+                batch.commit()
+                batch = self.db.batch()
+        if count % FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+        return count
+    
     def delete_document(self, collection, doc_id):
         """Delete a document from Firestore"""
         doc_ref = self.db.collection(collection).document(doc_id)
@@ -93,9 +113,9 @@ class FirebaseManager:
 class StudentFirebaseManager(FirebaseManager):
     """Student-specific Firebase operations"""
     
-    def sync_student_to_firestore(self, student):
-        """Sync Django student model to Firestore"""
-        data = {
+    def student_data(self, student):
+        """Firestore document for a Django Student"""
+        return {
             'student_id': student.student_id,
             'user_id': str(student.user.id),
             'first_name': student.user.first_name,
@@ -121,12 +141,47 @@ class StudentFirebaseManager(FirebaseManager):
             'emergency_contact_relationship': student.emergency_contact_relationship,
             'is_active': student.is_active,
         }
-        
-        return self.create_document('students', data, student.student_id)
     
-    def sync_payment_transaction_to_firestore(self, transaction):
-        """Sync Django PaymentTransaction model to Firestore"""
-        data = {
+    def sync_student_to_firestore(self, student):
+        """Sync Django student model to Firestore"""
+        return self.create_document('students', self.student_data(student), student.student_id)
+    
+    def sync_students_to_firestore(self, students):
+        """Sync many Student rows to Firestore in batched writes"""
+        return self.create_documents('students', (
+            (student.student_id, self.student_data(student)) for student in students
+        ))
+    
+    def user_profile_data(self, profile):
+        """Firestore document for a UserProfile"""
+        return {
+            'user_id': str(profile.user.id),
+            'username': profile.user.username,
+            'email': profile.user.email,
+            'first_name': profile.user.first_name,
+            'last_name': profile.user.last_name,
+            'role': profile.role,
+            'phone': profile.phone,
+            'address': profile.address,
+            'date_of_birth': profile.date_of_birth.isoformat() if profile.date_of_birth else None,
+            'bio': profile.bio,
+            'website': profile.website,
+            'language': profile.language,
+            'timezone': profile.timezone,
+            'theme': profile.theme,
+            'is_verified': profile.is_verified,
+            'is_active': profile.is_active,
+        }
+    
+    def sync_user_profiles_to_firestore(self, profiles):
+        """Sync many UserProfile rows to Firestore in batched writes"""
+        return self.create_documents('user_profiles', (
+            (str(profile.user.id), self.user_profile_data(profile)) for profile in profiles
+        ))
+    
+    def payment_transaction_data(self, transaction):
+        """Firestore document for a Django PaymentTransaction"""
+        return {
             'transaction_id': str(transaction.id),
             'payment_id': str(transaction.payment.id),
             'student_id': transaction.payment.student.student_id,
@@ -139,9 +194,19 @@ class StudentFirebaseManager(FirebaseManager):
             'notes': transaction.notes,
             'is_active': transaction.is_active,
         }
-        
+    
+    def sync_payment_transaction_to_firestore(self, transaction):
+        """Sync Django PaymentTransaction model to Firestore"""
+        data = self.payment_transaction_data(transaction)
         return self.create_document('payment_transactions', data, transaction.receipt_number)
     
+    def sync_payment_transactions_to_firestore(self, transactions):
+        """Sync many PaymentTransaction rows to Firestore in batched writes"""
+        return self.create_documents('payment_transactions', (
+            (transaction.receipt_number, self.payment_transaction_data(transaction))
+            for transaction in transactions
+        ))
+    
     def sync_payment_to_firestore(self, payment):
         """Sync Django StudentPayment model to Firestore"""
         data = {
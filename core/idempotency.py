@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+from datetime import timedelta
+import hashlib
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+class IdempotencyKeyReused(Exception):
+    """An Idempotency-Key sent again with a different request"""
+
+
+def request_fingerprint(request):
+    """Hash of what makes two requests the same: method, path and body"""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim_idempotency_key(key, request):
+    """Claim ``key`` inside the caller's transaction; returns (record, already_handled)"""
+    fingerprint = request_fingerprint(request)
+    user = request.user if request.user.is_authenticated else None
+    
+    for _ in range(2):
+        try:
+            # A concurrent request with the same key blocks here until the first one commits
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key,
+                    user=user,
+                    request_hash=fingerprint,
+                    expires_at=timezone.now() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+                )
+            return record, False
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(key=key, user=user).first()
+        
+        if record is None:
+            continue
+        if record.is_expired():
+            # Not purged yet, but no longer binding
+            record.delete()
+            continue
+        if record.request_hash != fingerprint:
+            raise IdempotencyKeyReused(f'{IDEMPOTENCY_HEADER} "{key}" was already used for a different request.')
+        return record, True
+    
+    raise IdempotencyKeyReused(f'{IDEMPOTENCY_HEADER} "{key}" is being used by another request.')
+
+
+def idempotent_json_response(request, handler):
+    """Run ``handler`` once per Idempotency-Key and answer retries with its stored JSON result"""
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return JsonResponse(handler())
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        return JsonResponse({'error': f'{IDEMPOTENCY_HEADER} is too long.'}, status=400)
+    
+    try:
+        # The key is only stored if the handler succeeds, so failed requests can be retried as they are
+        with transaction.atomic():
+            record, already_handled = claim_idempotency_key(key, request)
+            if already_handled:
+                response = JsonResponse(record.response, status=record.status_code, safe=False)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            
+            data = handler()
+            record.status_code = 200
+            record.response = data
+            record.save(update_fields=['status_code', 'response', 'updated_at'])
+    except IdempotencyKeyReused as e:
+        return JsonResponse({'error': str(e)}, status=422)
+    
+    return JsonResponse(data)
+
+
+def purge_expired_idempotency_keys():
+    """Delete stored responses past their TTL"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,129 @@
+from django.db import transaction, close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+from datetime import timedelta
+import logging
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# Job kind -> handler, filled by @register_job in each app's jobs.py
+JOB_HANDLERS = {}
+
+# Kinds that must not start over, like imports that commit chunk by chunk
+NO_RETRY_KINDS = set()
+
+# Running jobs are touched this often by their worker, and taken as orphaned after STALE_JOB_SECONDS untouched
+HEARTBEAT_SECONDS = 30
+STALE_JOB_SECONDS = 300
+
+
+def register_job(kind, retry=True):
+    """Register a function as the handler for a job kind; ``retry=False`` for handlers unsafe to run twice"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        if not retry:
+            NO_RETRY_KINDS.add(kind)
+        return func
+    return decorator
+
+
+def load_job_handlers():
+    """Import every installed app's jobs module so its handlers register"""
+    autodiscover_modules('jobs')
+
+
+def enqueue(kind, payload=None, user=None, label='', input_file=None):
+    """Queue a job for the workers and return it"""
+    job = BackgroundJob(
+        kind=kind,
+        label=label,
+        payload=payload or {},
+        created_by=user if user and user.is_authenticated else None,
+    )
+    if input_file is not None:
+        job.input_file.save(input_file.name, input_file, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    """Mark the oldest queued job as running and return it, or None"""
+    with transaction.atomic():
+        job = BackgroundJob.objects.select_for_update(skip_locked=True).filter(
+            status='queued',
+            is_active=True
+        ).order_by('created_at').first()
+        
+        if job is None:
+            return None
+        
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+    return job
+
+
+def touch_jobs(job_ids):
+    """Mark running jobs as still alive"""
+    if job_ids:
+        BackgroundJob.objects.filter(pk__in=job_ids, status='running').update(updated_at=timezone.now())
+
+
+def delete_input_file(job, save=False):
+    """Remove a job's upload from storage; it can carry personal data, even passwords, and is only read while the job runs"""
+    if not job.input_file:
+        return
+    try:
+        job.input_file.delete(save=save)
+    except Exception as e:
+        logger.warning(f'Could not delete the input file of job {job.id}: {e}')
+
+
+def release_jobs(jobs):
+    """Put jobs whose worker stopped mid-run back in the queue, or fail the ones that can't start over"""
+    now = timezone.now()
+    jobs = jobs.filter(status='running')
+    failing = jobs.filter(kind__in=NO_RETRY_KINDS)
+    for job in failing.exclude(input_file='').only('pk', 'input_file'):
+        delete_input_file(job, save=True)
+    failed = failing.update(
+        status='failed',
+        error='The worker stopped before the job finished; the rows it had committed were kept.',
+        finished_at=now,
+        updated_at=now
+    )
+    requeued = jobs.update(status='queued', started_at=None, updated_at=now)
+    return requeued, failed
+
+
+def release_stale_jobs(stale_after=STALE_JOB_SECONDS):
+    """Release running jobs no worker has touched lately, e.g. after a worker was killed"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return release_jobs(BackgroundJob.objects.filter(is_active=True, updated_at__lt=cutoff))
+
+
+def run_job(job_id):
+    """Run one claimed job; this is what the worker processes execute"""
+    close_old_connections()
+    job = BackgroundJob.objects.get(pk=job_id)
+    
+    try:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind "{job.kind}"')
+        handler(job)
+        job.status = 'completed'
+    except Exception as e:
+        logger.exception(f'Job {job.id} ({job.kind}) failed')
+        job.status = 'failed'
+        job.error = str(e)
+    
+    job.finished_at = timezone.now()
+    delete_input_file(job)
+    job.save(update_fields=[
+        'status', 'error', 'input_file', 'result_file', 'progress_current', 'progress_total', 'finished_at', 'updated_at'
+    ])
+    close_old_connections()
+    return job.status
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.idempotency import purge_expired_idempotency_keys
+
+class Command(BaseCommand):
+    help = 'Delete stored API responses whose Idempotency-Key has expired'
+
+    def handle(self, *args, **options):
+        try:
+            deleted_count = purge_expired_idempotency_keys()
+            
+            self.stdout.write(
+                self.style.SUCCESS(f'Deleted {deleted_count} expired idempotency keys.')
+            )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error purging idempotency keys: {str(e)}')
+            )
@@ -0,0 +1,143 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from concurrent.futures.process import BrokenProcessPool
+import signal
+import time
+
+from core.idempotency import purge_expired_idempotency_keys
+from core.jobs import (
+    claim_next_job, load_job_handlers, run_job, touch_jobs, release_jobs, release_stale_jobs, HEARTBEAT_SECONDS
+)
+from core.models import BackgroundJob
+from core.processes import django_process_pool, default_worker_count
+
+# Seconds between purges of expired Idempotency-Key responses, so no cron job is needed for them
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+class WorkerStopping(Exception):
+    """The platform asked the worker to stop (SIGTERM)"""
+
+
+def stop_on_sigterm(signum, frame):
+    raise WorkerStopping()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (imports, exports, PDFs) in a pool of worker processes'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=default_worker_count(),
+            help='Number of worker processes (default: CPU count, at most 4)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between queue checks when idle'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when the queue is empty instead of waiting for new jobs'
+        )
+    
+    def handle(self, *args, **options):
+        load_job_handlers()
+        workers = max(1, options['workers'])
+        
+        # Jobs left running by a worker that was killed would otherwise wait forever
+        requeued, failed = release_stale_jobs()
+        if requeued or failed:
+            self.stdout.write(f'Requeued {requeued} and failed {failed} job(s) orphaned by a stopped worker.')
+        
+        pool = self._start_pool(workers)
+        running = {}
+        last_heartbeat = time.monotonic()
+        last_purge = None
+        signal.signal(signal.SIGTERM, stop_on_sigterm)
+        
+        self.stdout.write(f'Starting {workers} worker process(es)...')
+        
+        try:
+            while True:
+                if time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                    touch_jobs([job.pk for job in running.values()])
+                    release_stale_jobs()
+                    last_heartbeat = time.monotonic()
+                
+                if last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL_SECONDS:
+                    self._purge_idempotency_keys()
+                    last_purge = time.monotonic()
+                
+                # Collect finished jobs
+                pool_broken = False
+                for future, job in list(running.items()):
+                    if not future.done():
+                        continue
+                    del running[future]
+                    try:
+                        status = future.result()
+                        style = self.style.SUCCESS if status == 'completed' else self.style.ERROR
+                        self.stdout.write(style(f'{job.label or job.kind} ({job.id}) -> {status}'))
+                    except Exception as e:
+                        # The worker process died (or the pool broke) before the job could record its outcome
+                        self._mark_failed(job, e)
+                        pool_broken = pool_broken or isinstance(e, BrokenProcessPool)
+                
+                if pool_broken:
+                    pool.shutdown(wait=False)
+                    pool = self._start_pool(workers)
+                
+                # Hand out queued jobs while there are idle workers
+                claimed = 0
+                while len(running) < workers:
+                    job = claim_next_job()
+                    if job is None:
+                        break
+                    self.stdout.write(f'Running {job.label or job.kind} ({job.id})')
+                    running[pool.submit(run_job, job.pk)] = job
+                    claimed += 1
+                
+                if options['once'] and not running and not claimed:
+                    break
+                
+                if not claimed:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers, waiting for running jobs to finish...')
+        except WorkerStopping:
+            # There is no time to let jobs finish; stop them so none runs on after being handed back
+            self.stdout.write('Stopping workers, releasing running jobs...')
+            for process in list(pool._processes.values()):
+                process.terminate()
+            release_jobs(BackgroundJob.objects.filter(pk__in=[job.pk for job in running.values()]))
+            pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            pool.shutdown(wait=True)
+        
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
+    
+    def _start_pool(self, workers):
+        return django_process_pool(workers, after_setup='core.jobs.load_job_handlers')
+    
+    def _purge_idempotency_keys(self):
+        try:
+            deleted = purge_expired_idempotency_keys()
+        except Exception as e:
+            # Only housekeeping; the next purge tries again
+            self.stdout.write(self.style.ERROR(f'Error purging idempotency keys: {str(e)}'))
+            return
+        if deleted:
+            self.stdout.write(f'Purged {deleted} expired idempotency key(s).')
+    
+    def _mark_failed(self, job, error):
+        BackgroundJob.objects.filter(pk=job.pk, status='running').update(
+            status='failed',
+            error=f'Worker process stopped unexpectedly: {error}',
+            finished_at=timezone.now()
+        )
+        self.stdout.write(self.style.ERROR(f'{job.label or job.kind} ({job.id}) -> failed: {error}'))
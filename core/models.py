@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 import uuid
 
 class BaseModel(models.Model):
@@ -103,4 +105,105 @@ class Notification(BaseModel):
     ])
     
     def __str__(self):
-        return f"{self.title} - {self.recipient.username}"
\ No newline at end of file
+        return f"{self.title} - {self.recipient.username}"
+
+def job_file_path(instance, filename):
+    """Keep each job's files in a folder of its own so names stay readable"""
+    return f'jobs/{instance.id}/{filename}'
+
+class BackgroundJob(BaseModel):
+    """Database-backed job picked up by ``manage.py run_workers``"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=100)  # e.g. "fees.import_payments"
+    label = models.CharField(max_length=200, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='background_jobs')
+    
+    # Progress, in whatever unit the job counts (rows, pages, ...)
+    progress_current = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    
+    input_file = models.FileField(upload_to=job_file_path, blank=True)
+    result_file = models.FileField(upload_to=job_file_path, blank=True)
+    error = models.TextField(blank=True)
+    
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.label or self.kind} ({self.status})"
+    
+    def is_finished(self):
+        """Check if the job has stopped running"""
+        return self.status in ('completed', 'failed')
+    
+    def get_progress_percentage(self):
+        """Get progress percentage"""
+        if self.status == 'completed':
+            return 100
+        if self.progress_total > 0:
+            return min(100, round((self.progress_current / self.progress_total) * 100, 1))
+        return 0
+    
+    def set_progress(self, current, total=None):
+        """Store progress straight away so pollers see it while the job runs"""
+        self.progress_current = current
+        if total is not None:
+            self.progress_total = total
+        BackgroundJob.objects.filter(pk=self.pk).update(
+            progress_current=self.progress_current,
+            progress_total=self.progress_total
+        )
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class IdempotencyKey(BaseModel):
+    """Stored response of an API request sent with an Idempotency-Key header"""
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='idempotency_keys')
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        # Keys are chosen by clients, so two users picking the same one must not collide;
+        # anonymous requests share one namespace, as NULL users never conflict in the first constraint
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='core_idempotencykey_user_key'),
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(user__isnull=True), name='core_idempotencykey_anonymous_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return self.key
+    
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+class Sequence(models.Model):
+    """Last number handed out per prefix and year, advanced atomically by core.sequences"""
+    prefix = models.CharField(max_length=10)
+    year = models.PositiveIntegerField()
+    last_value = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'year'], name='core_sequence_prefix_year'),
+        ]
+    
+    def __str__(self):
+        return f"{self.prefix}-{self.year}: {self.last_value}"
@@ -0,0 +1,188 @@
+from django.core import signing
+from django.db import connections
+from django.db.models import Q
+from datetime import date, datetime, time
+from decimal import Decimal
+import json
+import uuid
+
+CURSOR_SALT = 'core.pagination.cursor'
+
+# Below this many estimated rows an exact COUNT(*) is cheap enough to run instead
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+
+def cursor_value(value):
+    """JSON form of an ordering value; full-precision ISO datetimes, unlike DjangoJSONEncoder's"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    return value
+
+
+def encode_cursor(values, direction, position):
+    payload = {'v': [cursor_value(value) for value in values], 'd': direction, 'p': position}
+    return signing.dumps(payload, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """(values, direction, position) of a cursor, or None for a missing or tampered one"""
+    if not cursor:
+        return None
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+        return payload['v'], payload['d'], int(payload['p'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def estimated_count(queryset):
+    """Row estimate from the PostgreSQL planner's statistics, or None where there are none"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPage:
+    """One page of a CursorPaginator, with cursors to the pages either side"""
+    
+    def __init__(self, object_list, paginator, position, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.position = position
+        self._has_previous = has_previous
+        self._has_next = has_next
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __len__(self):
+        return len(self.object_list)
+    
+    def __bool__(self):
+        return bool(self.object_list)
+    
+    def has_previous(self):
+        return self._has_previous
+    
+    def has_next(self):
+        return self._has_next
+    
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+    
+    def start_index(self):
+        return self.position + 1 if self.object_list else 0
+    
+    def end_index(self):
+        return self.position + len(self.object_list)
+    
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor(
+            self.paginator.key(self.object_list[0]), 'previous', max(self.position - self.paginator.per_page, 0)
+        )
+    
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor(self.paginator.key(self.object_list[-1]), 'next', self.end_index())
+
+
+class CursorPaginator:
+    """Keyset pagination over a queryset's ordering plus its primary key, instead of OFFSET and COUNT(*)"""
+    
+    def __init__(self, queryset, per_page, approximate_count=False):
+        self.per_page = per_page
+        self.approximate_count = approximate_count
+        
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(field, str) and field != '?' for field in ordering):
+            raise ValueError('Cursor pagination needs an ordering of field names.')
+        # The primary key breaks ties, in the direction of the last field so one index serves both
+        fields = [field.lstrip('-') for field in ordering]
+        if 'pk' not in fields and 'id' not in fields:
+            ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+        
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+        self._count = None
+        self._count_is_approximate = False
+    
+    def key(self, obj):
+        """Values of the ordering fields on a row, as a cursor stores them"""
+        values = []
+        for field in self.ordering:
+            value = obj
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+    
+    def _after(self, values, reverse=False):
+        """Rows strictly after ``values`` in the ordering, or before them with ``reverse``"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= equal & Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+            equal &= Q(**{name: value})
+        return condition
+    
+    def get_page(self, cursor=None):
+        """The page a cursor points at; a missing or invalid cursor gives the first page"""
+        decoded = decode_cursor(cursor)
+        if decoded is None or len(decoded[0]) != len(self.ordering):
+            return self._first_page()
+        
+        values, direction, position = decoded
+        if direction == 'previous':
+            reverse_ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+            before = self.queryset.filter(self._after(values, reverse=True)).order_by(*reverse_ordering)
+            rows = list(before[:self.per_page + 1])
+            if len(rows) <= self.per_page:
+                # Back at the start, or rows went away; the first page is full and numbered right
+                return self._first_page()
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return CursorPage(rows, self, position, has_previous=True, has_next=True)
+        
+        rows = list(self.queryset.filter(self._after(values))[:self.per_page + 1])
+        return CursorPage(rows[:self.per_page], self, position, has_previous=True, has_next=len(rows) > self.per_page)
+    
+    def _first_page(self):
+        rows = list(self.queryset[:self.per_page + 1])
+        return CursorPage(rows[:self.per_page], self, 0, has_previous=False, has_next=len(rows) > self.per_page)
+    
+    def _load_count(self):
+        if self._count is not None:
+            return
+        estimate = estimated_count(self.queryset) if self.approximate_count else None
+        if estimate is not None and estimate >= APPROXIMATE_COUNT_THRESHOLD:
+            self._count = estimate
+            self._count_is_approximate = True
+        else:
+            self._count = self.queryset.count()
+    
+    @property
+    def count(self):
+        """Total rows: the planner's estimate for large approximate counts, else an exact COUNT(*)"""
+        self._load_count()
+        return self._count
+    
+    @property
+    def count_is_approximate(self):
+        self._load_count()
+        return self._count_is_approximate
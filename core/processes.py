@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from django.utils.module_loading import import_string
+import multiprocessing
+import os
+
+# Spawned processes unpickle their initializer before Django is set up, so this
+# module must not import models.
+
+
+def default_worker_count(limit=4):
+    """CPU count, capped so small instances aren't swamped"""
+    return max(1, min(limit, os.cpu_count() or 1))
+
+
+def init_django_process(after_setup=None):
+    """Set Django up inside a newly spawned worker process"""
+    import django
+    django.setup()
+    
+    if after_setup:
+        import_string(after_setup)()
+
+
+def django_process_pool(workers=None, after_setup=None):
+    """Process pool of freshly spawned workers with Django set up"""
+    # Spawned rather than forked, so no database connection is shared with the parent;
+    # after_setup is the dotted path of a function each worker runs once Django is ready
+    return ProcessPoolExecutor(
+        max_workers=workers or default_worker_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_django_process,
+        initargs=(after_setup,)
+    )
+
+
+def ordered_map(pool, func, items, window=None):
+    """Like pool.map, but keeps only ``window`` tasks in flight so memory stays bounded"""
+    window = window or pool._max_workers * 2
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,89 @@
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+import threading
+
+
+def reserve(prefix, year, count=1, using=None):
+    """Advance the (prefix, year) sequence by ``count`` in one statement and return its new value"""
+    from .models import Sequence
+    
+    using = using or connection
+    quote_name = using.ops.quote_name
+    table = quote_name(Sequence._meta.db_table)
+    prefix_column = quote_name('prefix')
+    year_column = quote_name('year')
+    last_value_column = quote_name('last_value')
+    
+    with using.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({prefix_column}, {year_column}, {last_value_column}) VALUES (%s, %s, %s) '
+            f'ON CONFLICT ({prefix_column}, {year_column}) DO UPDATE '
+            f'SET {last_value_column} = {table}.{last_value_column} + EXCLUDED.{last_value_column} '
+            f'RETURNING {last_value_column}',
+            [prefix, year, count]
+        )
+        return cursor.fetchone()[0]
+
+
+class SequenceAllocator:
+    """Hand out ``PREFIX-YYYY-NNNN`` numbers reserved from the Sequence table"""
+    
+    def __init__(self, prefix, width=4, block_size=1):
+        # Above 1, blocks are served from memory so most numbers cost no query, at the price
+        # of gaps; at 1 each number is reserved in the caller's transaction and stays gapless
+        self.prefix = prefix
+        self.width = width
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._local = threading.local()
+    
+    def format(self, year, number):
+        return f'{self.prefix}-{year}-{number:0{self.width}d}'
+    
+    def allocate(self, count=1, year=None):
+        """Reserve ``count`` consecutive-as-possible numbers for ``year`` (default: this year)"""
+        year = year or timezone.localdate().year
+        numbers = []
+        if count <= 0:
+            return numbers
+        
+        with self._lock:
+            while len(numbers) < count:
+                needed = count - len(numbers)
+                next_value, last_value = self._blocks.get(year, (1, 0))
+                
+                if next_value > last_value:
+                    if not self._reservation_is_durable():
+                        # The reservation would roll back with the caller's transaction,
+                        # so only take what is needed now and keep nothing for later
+                        last_value = reserve(self.prefix, year, needed)
+                        numbers.extend(range(last_value - needed + 1, last_value + 1))
+                        break
+                    size = max(needed, self.block_size)
+                    last_value = reserve(self.prefix, year, size, using=self._sequence_connection())
+                    next_value = last_value - size + 1
+                
+                taken = min(needed, last_value - next_value + 1)
+                numbers.extend(range(next_value, next_value + taken))
+                self._blocks[year] = (next_value + taken, last_value)
+        
+        return [self.format(year, number) for number in numbers]
+    
+    def _reservation_is_durable(self):
+        # Outside SQLite blocks are reserved on a separate autocommit connection; SQLite
+        # allows one writer at a time, so it has to share the caller's connection
+        if self.block_size <= 1:
+            return False
+        return connection.vendor != 'sqlite' or not connection.in_atomic_block
+    
+    def _sequence_connection(self):
+        if connection.vendor == 'sqlite':
+            return connection
+        
+        sequence_connection = getattr(self._local, 'connection', None)
+        if sequence_connection is None:
+            sequence_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+            self._local.connection = sequence_connection
+        sequence_connection.close_if_unusable_or_obsolete()
+        return sequence_connection
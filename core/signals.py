@@ -1,10 +1,21 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.db import transaction
 from django.contrib.auth.models import User
 from .firebase_utils import student_firebase_manager
 from students.models import Student, StudentApplication
-from fees.models import StudentPayment, PaymentTransaction
-from batches.models import BatchGrade, BatchAttendance
+from students.search import update_search_index
+from students.duplicates import update_duplicate_keys
+from students.summaries import refresh_summaries_on_commit, refresh_summaries_for_payments, queue_summary_rebuild
+from contacts.models import Contact
+from fees.models import StudentPayment, PaymentTransaction, payments_bulk_changed
+from fees.services import transactions_bulk_created
+from fees.reports import invalidate_ar_aging
+from fees.rollups import record_payment_revenue
+from .jobs import enqueue
+from .models import Currency, Semester, Course
+from .currency import currency_rates
+from batches.models import Batch, BatchGrade, BatchAttendance
 from accounts.models import UserProfile
 
 @receiver(post_save, sender=User)
@@ -107,7 +118,12 @@ def delete_student_from_firebase(sender, instance, **kwargs):
 
 @receiver(post_save, sender=PaymentTransaction)
 def sync_payment_transaction_to_firebase(sender, instance, created, **kwargs):
-    """Sync payment transaction data to Firebase when saved"""
+    """Sync payment transaction data to Firebase once the surrounding transaction commits"""
+    # Firestore calls are slow, so they must not run while the payment row is locked
+    transaction.on_commit(lambda: push_payment_transaction_to_firebase(instance, created))
+
+def push_payment_transaction_to_firebase(instance, created):
+    """Write a payment transaction to Firestore"""
     try:
         if created:
             student_firebase_manager.sync_payment_transaction_to_firestore(instance)
@@ -130,28 +146,53 @@ def sync_payment_transaction_to_firebase(sender, instance, created, **kwargs):
     except Exception as e:
         print(f"Error syncing payment transaction to Firebase: {e}")
 
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def invalidate_currency_rates(sender, **kwargs):
+    """Re-read exchange rates after a currency changes"""
+    try:
+        currency_rates.invalidate()
+        transaction.on_commit(currency_rates.invalidate)
+    except Exception as e:
+        print(f"Error invalidating currency rates: {e}")
+
+@receiver(post_save, sender=PaymentTransaction)
+@receiver(post_delete, sender=PaymentTransaction)
+@receiver(transactions_bulk_created)
+@receiver(post_save, sender=StudentPayment)
+@receiver(payments_bulk_changed)
+def invalidate_aging_report(sender, **kwargs):
+    """Drop the cached aging report once balances change"""
+    try:
+        transaction.on_commit(invalidate_ar_aging)
+    except Exception as e:
+        print(f"Error invalidating aging report: {e}")
+
+@receiver(pre_delete, sender=StudentPayment)
+def remove_payment_revenue(sender, instance, **kwargs):
+    """Take a deleted payment's transactions off the revenue rollup"""
+    # Its transactions go in the same cascade without PaymentTransaction.delete, which would otherwise do this;
+    # runs inside the delete's transaction, so errors roll the delete back rather than leaving the rollup behind
+    record_payment_revenue([instance.pk], sign=-1)
+
+@receiver(transactions_bulk_created)
+def handle_bulk_created_transactions(sender, transactions, **kwargs):
+    """Queue one Firebase sync for a bulk upload"""
+    try:
+        # Hundreds of Firestore writes don't belong in the request; the job commits with the upload
+        enqueue(
+            'fees.sync_transactions_to_firebase',
+            {'transaction_ids': [str(payment_transaction.id) for payment_transaction in transactions]},
+            label=f'Firebase sync of {len(transactions)} transactions'
+        )
+    except Exception as e:
+        print(f"Error handling bulk payment transactions: {e}")
+
 @receiver(post_save, sender=UserProfile)
 def sync_user_profile_to_firebase(sender, instance, created, **kwargs):
     """Sync user profile data to Firebase when saved"""
     try:
-        data = {
-            'user_id': str(instance.user.id),
-            'username': instance.user.username,
-            'email': instance.user.email,
-            'first_name': instance.user.first_name,
-            'last_name': instance.user.last_name,
-            'role': instance.role,
-            'phone': instance.phone,
-            'address': instance.address,
-            'date_of_birth': instance.date_of_birth.isoformat() if instance.date_of_birth else None,
-            'bio': instance.bio,
-            'website': instance.website,
-            'language': instance.language,
-            'timezone': instance.timezone,
-            'theme': instance.theme,
-            'is_verified': instance.is_verified,
-            'is_active': instance.is_active,
-        }
+        data = student_firebase_manager.user_profile_data(instance)
         
         if created:
             student_firebase_manager.create_document('user_profiles', data, str(instance.user.id))
@@ -214,3 +255,100 @@ def sync_attendance_to_firebase(sender, instance, created, **kwargs):
             student_firebase_manager.update_document('attendance', str(instance.id), data)
     except Exception as e:
         print(f"Error syncing attendance to Firebase: {e}")
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def index_student_for_search(sender, instance, **kwargs):
+    """Refresh a student's search document and duplicate keys once the change commits"""
+    try:
+        transaction.on_commit(lambda: update_search_index('student', [instance.pk]))
+        transaction.on_commit(lambda: update_duplicate_keys([instance.pk]))
+    except Exception as e:
+        print(f"Error indexing student for search: {e}")
+
+@receiver(post_save, sender=User)
+def index_user_for_search(sender, instance, created, update_fields=None, **kwargs):
+    """Names and email are part of the student's search document, names of its duplicate keys"""
+    if created or (update_fields is not None and not {'first_name', 'last_name', 'email'} & set(update_fields)):
+        return
+    try:
+        student_ids = list(Student.objects.filter(user=instance).values_list('pk', flat=True))
+        if student_ids:
+            transaction.on_commit(lambda: update_search_index('student', student_ids))
+            transaction.on_commit(lambda: update_duplicate_keys(student_ids))
+            refresh_summaries_on_commit(student_ids)
+    except Exception as e:
+        print(f"Error indexing user for search: {e}")
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def index_contact_for_search(sender, instance, **kwargs):
+    """Refresh a contact's search document once the change commits"""
+    try:
+        transaction.on_commit(lambda: update_search_index('contact', [instance.pk]))
+    except Exception as e:
+        print(f"Error indexing contact for search: {e}")
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=StudentPayment)
+@receiver(post_delete, sender=StudentPayment)
+@receiver(post_save, sender=BatchAttendance)
+@receiver(post_delete, sender=BatchAttendance)
+@receiver(post_save, sender=BatchGrade)
+@receiver(post_delete, sender=BatchGrade)
+def refresh_student_summary(sender, instance, **kwargs):
+    """Rewrite the summary row of the student a change belongs to once it commits"""
+    try:
+        refresh_summaries_on_commit([instance.pk if sender is Student else instance.student_id])
+    except Exception as e:
+        print(f"Error refreshing student summary: {e}")
+
+@receiver(post_save, sender=PaymentTransaction)
+@receiver(post_delete, sender=PaymentTransaction)
+def refresh_summary_for_transaction(sender, instance, **kwargs):
+    """A transaction moves its payment's balance and the student's last payment date"""
+    try:
+        refresh_summaries_for_payments([instance.payment_id])
+    except Exception as e:
+        print(f"Error refreshing student summary: {e}")
+
+@receiver(transactions_bulk_created)
+def refresh_summaries_for_bulk_transactions(sender, transactions, **kwargs):
+    """Refresh the students of a bulk upload in one go"""
+    try:
+        refresh_summaries_for_payments({payment_transaction.payment_id for payment_transaction in transactions})
+    except Exception as e:
+        print(f"Error refreshing student summaries: {e}")
+
+@receiver(payments_bulk_changed)
+def refresh_summaries_for_bulk_payments(sender, payment_ids, **kwargs):
+    """Refresh the students of bulk balance or status writes, or rebuild when they aren't listed"""
+    try:
+        if payment_ids is None:
+            queue_summary_rebuild()
+        else:
+            refresh_summaries_for_payments(payment_ids)
+    except Exception as e:
+        print(f"Error refreshing student summaries: {e}")
+
+@receiver(post_save, sender=Batch)
+def refresh_summaries_for_batch(sender, instance, created, **kwargs):
+    """The batch name is copied onto its students' summaries"""
+    if created:
+        return
+    try:
+        refresh_summaries_on_commit(list(instance.students.values_list('pk', flat=True)))
+    except Exception as e:
+        print(f"Error refreshing student summaries: {e}")
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=Semester)
+@receiver(post_save, sender=Course)
+def rebuild_student_summaries_later(sender, **kwargs):
+    """Rates, the current semester and course credits feed every summary, so a job rebuilds them all"""
+    try:
+        queue_summary_rebuild()
+    except Exception as e:
+        print(f"Error queueing student summary rebuild: {e}")
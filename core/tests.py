@@ -1,3 +1,143 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import date, timedelta
+from io import BytesIO
+from openpyxl import Workbook
+from unittest import mock
 
-# Create your tests here.
+from batches.models import Batch
+from students.models import Student
+from .jobs import JOB_HANDLERS, NO_RETRY_KINDS, register_job, enqueue, claim_next_job, run_job, release_stale_jobs
+from .models import Currency, BackgroundJob
+from .uploads import UploadReader, UploadFormatError
+from .views import get_student_dashboard_data
+
+
+class StudentDashboardTests(TestCase):
+    """Student dashboard data"""
+    
+    def setUp(self):
+        Currency.objects.create(code='USD', name='US Dollar', symbol='$', exchange_rate=1, is_default=True)
+        batch = Batch.objects.create(name='Batch 57', code='B57', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        user = User.objects.create_user('student1', 's1@example.com', 'pw', first_name='Rahim', last_name='Khan')
+        self.student = Student.objects.create(user=user, batch=batch, enrollment_date=date(2026, 1, 1))
+    
+    def test_loads_for_student(self):
+        # The currency_rates view once shadowed the rate service of the same name
+        data = get_student_dashboard_data(self.student.user)
+        self.assertNotIn('error', data)
+        self.assertEqual(data['student'], self.student)
+        self.assertEqual(data['reporting_currency']['code'], 'USD')
+        self.assertEqual(data['remaining_amount'], 0.0)
+
+
+class JobRunnerTests(TestCase):
+    """Jobs are claimed oldest first and end completed or failed"""
+    
+    def setUp(self):
+        def count_rows(job):
+            job.set_progress(job.payload['rows'], job.payload['rows'])
+        
+        def fail(job):
+            raise ValueError('Bad sheet')
+        
+        register_job('tests.count_rows')(count_rows)
+        register_job('tests.fail')(fail)
+        register_job('tests.import', retry=False)(count_rows)
+        for kind in ('tests.count_rows', 'tests.fail', 'tests.import'):
+            self.addCleanup(JOB_HANDLERS.pop, kind)
+        self.addCleanup(NO_RETRY_KINDS.discard, 'tests.import')
+        
+        # A worker closes stale connections between jobs; here that would be the test's own
+        patcher = mock.patch('core.jobs.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_claim_and_run(self):
+        first = enqueue('tests.count_rows', {'rows': 3})
+        enqueue('tests.count_rows', {'rows': 5})
+        
+        job = claim_next_job()
+        self.assertEqual(job, first)
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(run_job(job.pk), 'completed')
+        
+        job.refresh_from_db()
+        self.assertEqual((job.progress_current, job.progress_total), (3, 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(claim_next_job().payload, {'rows': 5})
+        self.assertIsNone(claim_next_job())
+    
+    def test_failure(self):
+        failing = enqueue('tests.fail')
+        unknown = enqueue('tests.unknown')
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(run_job(failing.pk), 'failed')
+            self.assertEqual(run_job(unknown.pk), 'failed')
+        self.assertEqual(BackgroundJob.objects.get(pk=failing.pk).error, 'Bad sheet')
+        self.assertIn('No handler', BackgroundJob.objects.get(pk=unknown.pk).error)
+    
+    def test_release_stale(self):
+        for kind in ('tests.count_rows', 'tests.import'):
+            enqueue(kind, {'rows': 1})
+            claim_next_job()
+        fresh = enqueue('tests.count_rows', {'rows': 1})
+        claim_next_job()
+        BackgroundJob.objects.exclude(pk=fresh.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        
+        # The retryable job goes back in the queue; the one committing as it goes can't start over
+        self.assertEqual(release_stale_jobs(), (1, 1))
+        statuses = dict(BackgroundJob.objects.values_list('kind', 'status').exclude(pk=fresh.pk))
+        self.assertEqual(statuses, {'tests.count_rows': 'queued', 'tests.import': 'failed'})
+        self.assertEqual(BackgroundJob.objects.get(pk=fresh.pk).status, 'running')
+
+
+class UploadReaderTests(SimpleTestCase):
+    """Uploaded sheets come out as row dicts, a chunk at a time"""
+    
+    def xlsx(self, rows):
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        upload = BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        return upload
+    
+    def test_csv(self):
+        upload = BytesIO('\ufeffStudent ID,Total Amount\nSTU-1,100\n,\nSTU-2,\nSTU-3,300\n,\n,\n'.encode())
+        with UploadReader(upload, 'fees.csv', required_columns=['Student ID'], chunk_size=2) as reader:
+            self.assertEqual(reader.columns, ['Student ID', 'Total Amount'])
+            self.assertEqual(reader.row_count_hint, 6)
+            chunks = list(reader.chunks())
+        
+        # The blank row between students is kept so row numbers line up; the trailing ones are dropped
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+        self.assertEqual(chunks[0][1], {'Student ID': None, 'Total Amount': None})
+        self.assertEqual(chunks[1], [
+            {'Student ID': 'STU-2', 'Total Amount': None},
+            {'Student ID': 'STU-3', 'Total Amount': '300'},
+        ])
+        self.assertFalse(upload.closed)
+    
+    def test_xlsx(self):
+        upload = self.xlsx([['Student ID', 'Total Amount', 'Notes'], ['STU-1', 100], ['STU-2', 200, 'Late']])
+        with UploadReader(upload, 'fees.xlsx') as reader:
+            self.assertEqual(reader.row_count_hint, 2)
+            self.assertEqual(list(reader.rows()), [
+                {'Student ID': 'STU-1', 'Total Amount': 100, 'Notes': None},
+                {'Student ID': 'STU-2', 'Total Amount': 200, 'Notes': 'Late'},
+            ])
+    
+    def test_rejected(self):
+        for upload, filename, message in [
+            (BytesIO(b'Student ID\nSTU-1\n'), 'fees.csv', 'Missing required columns: Total Amount'),
+            (BytesIO(b'Student ID,Total Amount\n'), 'fees.pdf', 'Unsupported file type'),
+            (BytesIO(b''), 'fees.csv', 'is empty'),
+            (BytesIO('Student ID,Total Amount\n'.encode('utf-16')), 'fees.csv', 'not a UTF-8'),
+            (BytesIO(b'not a workbook'), 'fees.xlsx', 'not a readable Excel workbook'),
+        ]:
+            with self.subTest(filename=filename, message=message):
+                with self.assertRaisesMessage(UploadFormatError, message):
+                    UploadReader(upload, filename, required_columns=['Student ID', 'Total Amount'])
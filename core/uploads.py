@@ -0,0 +1,125 @@
+from openpyxl import load_workbook
+import csv
+import io
+import os
+import zipfile
+
+# Rows handed out per chunk unless the caller asks otherwise
+DEFAULT_CHUNK_SIZE = 500
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xlsm', '.csv')
+
+
+class UploadFormatError(ValueError):
+    """An uploaded sheet that can't be read or lacks required columns"""
+
+
+class UploadReader:
+    """Stream the rows of an uploaded xlsx or CSV file in fixed-size chunks"""
+    
+    def __init__(self, fileobj, filename=None, required_columns=(), chunk_size=DEFAULT_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.filename = filename or getattr(fileobj, 'name', '') or ''
+        self.chunk_size = chunk_size
+        self.extension = os.path.splitext(self.filename)[1].lower()
+        self._workbook = None
+        self._text = None
+        self._row_count_hint = None
+        
+        if self.extension not in SUPPORTED_EXTENSIONS:
+            raise UploadFormatError(
+                f'Unsupported file type "{self.extension or self.filename}". '
+                f'Upload one of: {", ".join(SUPPORTED_EXTENSIONS)}'
+            )
+        
+        # Only the current chunk is ever held in memory
+        self._rows = self._xlsx_rows() if self.extension != '.csv' else self._csv_rows()
+        
+        # The header is checked straight away, before any row is read
+        try:
+            header = next(self._rows, None)
+        except UnicodeDecodeError:
+            self.close()
+            raise UploadFormatError(f'{self.filename} is not a UTF-8 encoded CSV file.')
+        if header is None:
+            self.close()
+            raise UploadFormatError(f'{self.filename} is empty.')
+        self.columns = [str(value).strip() if value is not None else '' for value in header]
+        
+        missing_columns = [col for col in required_columns if col not in self.columns]
+        if missing_columns:
+            self.close()
+            raise UploadFormatError(f'Missing required columns: {", ".join(missing_columns)}')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _xlsx_rows(self):
+        try:
+            self._workbook = load_workbook(self.fileobj, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, KeyError, OSError):
+            raise UploadFormatError(f'{self.filename} is not a readable Excel workbook.')
+        worksheet = self._workbook.active
+        if worksheet.max_row:
+            self._row_count_hint = max(worksheet.max_row - 1, 0)
+        return worksheet.iter_rows(values_only=True)
+    
+    def _csv_rows(self):
+        self._text = io.TextIOWrapper(self.fileobj, encoding='utf-8-sig', newline='')
+        return (
+            [value if value != '' else None for value in row]
+            for row in csv.reader(self._text)
+        )
+    
+    @property
+    def row_count_hint(self):
+        """Approximate number of data rows, for progress reporting"""
+        if self._row_count_hint is None and self._text is not None and self.fileobj.seekable():
+            # Count line breaks in raw blocks, then go back to where the reader was
+            position = self.fileobj.tell()
+            self.fileobj.seek(0)
+            lines = sum(block.count(b'\n') for block in iter(lambda: self.fileobj.read(1 << 20), b''))
+            self.fileobj.seek(position)
+            self._row_count_hint = max(lines - 1, 0)
+        return self._row_count_hint
+    
+    def rows(self):
+        """Yield each data row as a dict keyed by column name"""
+        width = len(self.columns)
+        blank_rows = 0
+        for values in self._rows:
+            values = list(values[:width]) + [None] * (width - len(values))
+            
+            # Blank rows only count when something follows them, so trailing
+            # formatted-but-empty rows at the end of a sheet are dropped
+            if all(value is None for value in values):
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                yield dict.fromkeys(self.columns)
+            blank_rows = 0
+            
+            yield dict(zip(self.columns, values))
+    
+    def chunks(self):
+        """Yield lists of up to ``chunk_size`` row dicts"""
+        chunk = []
+        for row in self.rows():
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    
+    def close(self):
+        """Release the workbook without closing the underlying upload"""
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+        if self._text is not None:
+            self._text.detach()
+            self._text = None
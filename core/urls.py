@@ -12,6 +12,9 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('notifications/', views.notifications, name='notifications'),
     path('notifications/<uuid:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/progress/', views.job_progress, name='job_progress'),
+    path('jobs/<uuid:job_id>/download/', views.job_download, name='job_download'),
     path('api/currency/convert/', views.CurrencyConverterView.as_view(), name='currency_convert'),
     path('api/currency/rates/', views.currency_rates, name='currency_rates'),
 ]
@@ -1,17 +1,20 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import Currency, AcademicYear, Semester
+from .models import Currency, AcademicYear, Semester, BackgroundJob
 from .firebase_config import CurrencyConverter, initialize_firebase, get_firestore_client
+from .currency import currency_rates as rate_service
 import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -142,7 +145,7 @@ def get_admin_dashboard_data():
     from students.models import Student, StudentApplication
     from batches.models import Batch
     from fees.models import StudentPayment
-
+    
     return {
         'total_students': Student.objects.filter(is_active=True).count(),
         'total_applications': StudentApplication.objects.filter(is_active=True).count(),
@@ -174,7 +177,7 @@ def get_teacher_dashboard_data(user):
 
 def get_student_dashboard_data(user):
     """Get student dashboard data"""
-    from students.models import Student
+    from students.models import Student, StudentSummary
     from batches.models import BatchGrade, BatchAttendance
     from fees.models import StudentPayment, PaymentTransaction
     from django.utils import timezone
@@ -190,9 +193,10 @@ def get_student_dashboard_data(user):
             payment__student=student
         ).order_by('-payment_date')[:5]
         
-        # Calculate payment status
-        total_paid = sum(payment.get_total_paid() for payment in payments)
-        total_due = sum(float(payment.total_amount) for payment in payments)
+        # Totals in the reporting currency and the GPA come precomputed on the summary row
+        summary = StudentSummary.objects.filter(student=student).first()
+        total_paid = float(summary.amount_paid) if summary else 0.0
+        total_due = float(summary.amount_billed) if summary else 0.0
         remaining_amount = total_due - total_paid
         
         return {
@@ -204,7 +208,8 @@ def get_student_dashboard_data(user):
             'total_paid': total_paid,
             'total_due': total_due,
             'remaining_amount': remaining_amount,
-            'current_gpa': getattr(student, 'get_current_gpa', lambda: 0.0)(),
+            'reporting_currency': rate_service.reporting_currency(),
+            'current_gpa': float(summary.current_gpa) if summary else 0.0,
         }
     except Exception as e:
         return {
@@ -227,10 +232,24 @@ class CurrencyConverterView(View):
     def post(self, request):
         try:
             data = json.loads(request.body)
-            amount = float(data.get('amount', 0))
             from_currency = data.get('from_currency', 'USD')
             to_currency = data.get('to_currency', 'USD')
             
+            # Batch mode: {"amounts": [...]} converts the whole list with one rate lookup
+            if 'amounts' in data:
+                amounts = data['amounts']
+                if not isinstance(amounts, list):
+                    raise ValueError('amounts must be a list')
+                converted_amounts = CurrencyConverter.convert_amounts(amounts, from_currency, to_currency)
+                return JsonResponse({
+                    'success': True,
+                    'original_amounts': amounts,
+                    'converted_amounts': converted_amounts,
+                    'from_currency': from_currency,
+                    'to_currency': to_currency,
+                })
+            
+            amount = float(data.get('amount', 0))
             converted_amount = CurrencyConverter.convert_currency(
                 amount, from_currency, to_currency
             )
@@ -243,7 +262,7 @@ class CurrencyConverterView(View):
                 'to_currency': to_currency,
                 'formatted_amount': CurrencyConverter.format_currency(converted_amount, to_currency)
             })
-            
+        
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -251,7 +270,22 @@ class CurrencyConverterView(View):
             }, status=400)
 
 def currency_rates(request):
-    """Get current currency exchange rates"""
+    """Get current currency exchange rates, or convert ?amount=...&amount=... from one currency to another"""
+    amounts = request.GET.getlist('amount')
+    if amounts:
+        from_currency = request.GET.get('from', 'USD')
+        to_currency = request.GET.get('to', 'USD')
+        try:
+            converted_amounts = CurrencyConverter.convert_amounts(amounts, from_currency, to_currency)
+        except (ValueError, ArithmeticError) as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse({
+            'from_currency': from_currency,
+            'to_currency': to_currency,
+            'original_amounts': [float(amount) for amount in amounts],
+            'converted_amounts': converted_amounts,
+        })
+    
     rates = CurrencyConverter.get_exchange_rates()
     return JsonResponse(rates)
 
@@ -279,6 +313,60 @@ def mark_notification_read(request, notification_id):
     except:
         return JsonResponse({'success': False}, status=404)
 
+def get_job_for_user(user, job_id):
+    """Fetch a background job the user is allowed to see"""
+    jobs = BackgroundJob.objects.all()
+    if not (user.is_superuser or user.is_staff):
+        jobs = jobs.filter(created_by=user)
+    return get_object_or_404(jobs, id=job_id)
+
+def job_progress_data(job):
+    """JSON-ready view of a job's progress"""
+    return {
+        'id': str(job.id),
+        'kind': job.kind,
+        'label': job.label,
+        'status': job.status,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'percentage': job.get_progress_percentage(),
+        'error': job.error,
+        'download_url': reverse('core:job_download', args=[job.id]) if job.result_file else None,
+    }
+
+@login_required
+def job_status(request, job_id):
+    """Progress page for a background job"""
+    job = get_job_for_user(request.user, job_id)
+    
+    context = {
+        'title': job.label or 'Background Job',
+        'job': job,
+        'progress': job_progress_data(job),
+    }
+    
+    return render(request, 'core/job_status.html', context)
+
+@login_required
+def job_progress(request, job_id):
+    """Poll the progress of a background job"""
+    job = get_job_for_user(request.user, job_id)
+    return JsonResponse(job_progress_data(job))
+
+@login_required
+def job_download(request, job_id):
+    """Download the file a finished job produced"""
+    job = get_job_for_user(request.user, job_id)
+    
+    if job.status != 'completed' or not job.result_file:
+        raise Http404('This job has no file to download.')
+    
+    return FileResponse(
+        job.result_file.open('rb'),
+        as_attachment=True,
+        filename=os.path.basename(job.result_file.name)
+    )
+
 @login_required
 def role_test(request):
     """Simple role test view"""
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import StudentPayment, PaymentTransaction, PaymentImport
+from .models import StudentPayment, PaymentTransaction, PaymentImport, FeeInstallment, DailyRevenue, BankStatement, BankStatementLine
 
 @admin.register(StudentPayment)
 class StudentPaymentAdmin(admin.ModelAdmin):
@@ -7,12 +7,16 @@ class StudentPaymentAdmin(admin.ModelAdmin):
     list_filter = ['currency', 'payment_method', 'status', 'created_at']
     search_fields = ['student__student_id', 'student__user__first_name', 'student__user__last_name']
     autocomplete_fields = ['student', 'batch', 'currency', 'created_by']
-    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['student', 'student__user', 'batch', 'currency']
+    readonly_fields = ['total_paid', 'remaining_amount', 'transaction_count', 'created_at', 'updated_at']
     
     fieldsets = (
         ('Payment Information', {
             'fields': ('student', 'batch', 'total_amount', 'currency', 'payment_method', 'status')
         }),
+        ('Balance', {
+            'fields': ('total_paid', 'remaining_amount', 'transaction_count')
+        }),
         ('Details', {
             'fields': ('notes', 'created_by')
         }),
@@ -22,6 +26,9 @@ class StudentPaymentAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_totals()
+    
     def get_total_paid(self, obj):
         return f"{obj.get_total_paid()} {obj.currency.code}"
     get_total_paid.short_description = 'Total Paid'
@@ -74,4 +81,34 @@ class PaymentImportAdmin(admin.ModelAdmin):
             'fields': ('import_date', 'is_active', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+@admin.register(FeeInstallment)
+class FeeInstallmentAdmin(admin.ModelAdmin):
+    list_display = ['student', 'batch', 'installment_number', 'due_date', 'amount', 'paid_amount', 'status']
+    list_filter = ['status', 'due_date', 'batch']
+    search_fields = ['student__student_id', 'student__user__first_name', 'student__user__last_name']
+    list_select_related = ['student', 'student__user', 'batch']
+    readonly_fields = ['cumulative_amount', 'paid_amount', 'created_at', 'updated_at']
+
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ['date', 'batch', 'currency', 'payment_method', 'total_amount', 'transaction_count']
+    list_filter = ['payment_method', 'currency', 'batch']
+    date_hierarchy = 'date'
+    list_select_related = ['batch', 'currency']
+    readonly_fields = ['date', 'batch', 'currency', 'payment_method', 'total_amount', 'transaction_count']
+
+@admin.register(BankStatement)
+class BankStatementAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'uploaded_by', 'status', 'total_lines', 'matched_lines', 'exception_lines', 'created_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['file_name']
+    readonly_fields = ['total_lines', 'matched_lines', 'exception_lines', 'ignored_lines', 'created_at', 'updated_at']
+
+@admin.register(BankStatementLine)
+class BankStatementLineAdmin(admin.ModelAdmin):
+    list_display = ['statement', 'line_number', 'value_date', 'amount', 'reference', 'status', 'match_method', 'transaction']
+    list_filter = ['status', 'match_method']
+    search_fields = ['reference', 'narrative', 'transaction__receipt_number']
+    list_select_related = ['statement', 'transaction']
+    raw_id_fields = ['transaction']
@@ -0,0 +1,157 @@
+from django.db.models import Prefetch
+from pypdf import PdfWriter
+from io import BytesIO
+from itertools import islice
+import zipfile
+
+from core.processes import django_process_pool, default_worker_count, ordered_map
+from .models import StudentPayment, PaymentTransaction
+from .pdf import get_receipt_pdf, get_payment_summary_pdf
+
+DOCUMENT_KINDS = [
+    ('receipts', 'Receipts'),
+    ('summaries', 'Payment summaries'),
+]
+
+OUTPUT_FORMATS = [
+    ('pdf', 'One merged PDF'),
+    ('zip', 'ZIP of separate PDFs'),
+]
+
+# Documents sent to a worker process per task
+DOCUMENTS_PER_TASK = 20
+
+# Below this many documents, spawning worker processes costs more than it saves
+PARALLEL_THRESHOLD = 40
+
+
+def receipts_queryset(batch=None, date_from=None, date_to=None):
+    """Active transactions of a batch and/or date range, with everything a receipt prints"""
+    transactions = PaymentTransaction.objects.filter(is_active=True, payment__is_active=True)
+    if batch is not None:
+        transactions = transactions.filter(payment__batch=batch)
+    if date_from:
+        transactions = transactions.filter(payment_date__date__gte=date_from)
+    if date_to:
+        transactions = transactions.filter(payment_date__date__lte=date_to)
+    
+    return transactions.select_related(
+        'payment', 'payment__student', 'payment__student__user', 'payment__batch', 'payment__currency'
+    ).order_by('payment__student__student_id', 'payment_date')
+
+
+def summaries_queryset(batch=None, date_from=None, date_to=None):
+    """Active payments of a batch (and/or with transactions in a date range), transactions prefetched"""
+    payments = StudentPayment.objects.filter(is_active=True)
+    if batch is not None:
+        payments = payments.filter(batch=batch)
+    if date_from or date_to:
+        in_range = PaymentTransaction.objects.filter(is_active=True)
+        if date_from:
+            in_range = in_range.filter(payment_date__date__gte=date_from)
+        if date_to:
+            in_range = in_range.filter(payment_date__date__lte=date_to)
+        payments = payments.filter(id__in=in_range.values('payment_id'))
+    
+    return payments.select_related('student', 'student__user', 'batch', 'currency').prefetch_related(
+        Prefetch(
+            'transactions',
+            queryset=PaymentTransaction.objects.order_by('payment_date'),
+            to_attr='ordered_transactions'
+        )
+    ).order_by('student__student_id')
+
+
+def documents_queryset(kind, batch=None, date_from=None, date_to=None):
+    if kind == 'receipts':
+        return receipts_queryset(batch, date_from, date_to)
+    return summaries_queryset(batch, date_from, date_to)
+
+
+def document_filename(kind, obj):
+    if kind == 'receipts':
+        return f'receipt_{obj.receipt_number}.pdf'
+    return f'payment_summary_{obj.student.student_id}.pdf'
+
+
+def render_documents(kind, objects):
+    """Render a list of receipts or summaries to (filename, PDF bytes) pairs; runs in worker processes"""
+    rendered = []
+    for obj in objects:
+        if kind == 'receipts':
+            pdf_content = get_receipt_pdf(obj)
+        else:
+            pdf_content = get_payment_summary_pdf(obj, transactions=obj.ordered_transactions)
+        rendered.append((document_filename(kind, obj), pdf_content))
+    return rendered
+
+
+def _render_task(args):
+    return render_documents(*args)
+
+
+def _chunks(items, size):
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def rendered_chunks(kind, objects, workers=None):
+    """Yield (filename, PDF bytes) lists in document order, rendered on worker processes when there are enough"""
+    chunks = ((kind, chunk) for chunk in _chunks(objects, DOCUMENTS_PER_TASK))
+    workers = workers or default_worker_count()
+    if workers <= 1 or len(objects) < PARALLEL_THRESHOLD:
+        for args in chunks:
+            yield render_documents(*args)
+        return
+    
+    pool = django_process_pool(workers)
+    try:
+        yield from ordered_map(pool, _render_task, chunks)
+    finally:
+        pool.shutdown()
+
+
+def write_zip(kind, objects, fileobj, workers=None, progress=None):
+    """Render every document in parallel and write them into a ZIP as they come back"""
+    count = 0
+    names = set()
+    # PDFs are already compressed, so entries are stored as they are
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for rendered in rendered_chunks(kind, objects, workers):
+            for filename, pdf_content in rendered:
+                # A student can have a summary in more than one batch
+                if filename in names:
+                    filename = filename.replace('.pdf', f'_{count + 1}.pdf')
+                names.add(filename)
+                archive.writestr(filename, pdf_content)
+                count += 1
+            if progress:
+                progress(count, len(objects))
+    return count
+
+
+def write_merged_pdf(kind, objects, fileobj, workers=None, progress=None):
+    """Render every document in parallel and append their pages to one PDF, each document starting on a new page"""
+    # The same per-document PDFs as the ZIP, so cached ones are reused and no process lays out the whole batch
+    merged = PdfWriter()
+    count = 0
+    for rendered in rendered_chunks(kind, objects, workers):
+        for _, pdf_content in rendered:
+            merged.append(BytesIO(pdf_content))
+            count += 1
+        if progress:
+            progress(count, len(objects))
+    
+    if count:
+        merged.write(fileobj)
+    return count
+
+
+def write_bulk_documents(kind, output_format, fileobj, batch=None, date_from=None, date_to=None, workers=None, progress=None):
+    """Write the receipts or summaries of a batch and/or date range to ``fileobj``, returning the count"""
+    # One query (plus one prefetch for summaries) for the whole run
+    objects = list(documents_queryset(kind, batch, date_from, date_to))
+    if output_format == 'zip':
+        return write_zip(kind, objects, fileobj, workers=workers, progress=progress)
+    return write_merged_pdf(kind, objects, fileobj, workers=workers, progress=progress)
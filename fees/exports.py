@@ -0,0 +1,156 @@
+from django.db.models import Prefetch
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+from itertools import islice
+
+from .models import StudentPayment, PaymentTransaction
+
+# Rows fetched (with their prefetched transactions) per database round trip
+EXPORT_CHUNK_SIZE = 500
+
+# Rows inspected up front to size the columns (write-only sheets can't be re-walked)
+WIDTH_SAMPLE_SIZE = 200
+
+BATCH_PAYMENT_COLUMNS = [
+    'Student ID',
+    'Student Name',
+    'Email',
+    'Phone',
+    'Batch',
+    'Total Amount',
+    'Currency',
+    'Payment Method',
+    'Status',
+    'First Installment Amount',
+    'First Installment Date',
+    'Second Installment Amount',
+    'Second Installment Date',
+    'Total Paid',
+    'Remaining Amount',
+    'Progress (%)',
+    'Notes',
+    'Created Date',
+]
+
+
+def batch_payments_queryset(batch):
+    """Active payments of a batch with everything the export needs"""
+    return StudentPayment.objects.filter(
+        batch=batch,
+        is_active=True
+    ).with_totals().select_related('student', 'student__user', 'currency').prefetch_related(
+        Prefetch(
+            'transactions',
+            queryset=PaymentTransaction.objects.filter(is_active=True).order_by('payment_date'),
+            to_attr='active_transactions'
+        )
+    ).order_by('student__student_id')
+
+
+def batch_payment_rows(batch, payments):
+    """Yield one export row per payment"""
+    for payment in payments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        student = payment.student
+        user = student.user
+        transactions = payment.active_transactions
+        
+        # First and second installments
+        first_transaction = transactions[0] if transactions else None
+        second_transaction = transactions[1] if len(transactions) > 1 else None
+        
+        yield [
+            student.student_id,
+            user.get_full_name(),
+            user.email if user.email else '',
+            student.phone if student.phone else '',
+            batch.name,
+            float(payment.total_amount),
+            payment.currency.code,
+            payment.get_payment_method_display(),
+            payment.get_status_display(),
+            float(first_transaction.amount) if first_transaction else 0.0,
+            first_transaction.payment_date.strftime('%Y-%m-%d') if first_transaction else '',
+            float(second_transaction.amount) if second_transaction else 0.0,
+            second_transaction.payment_date.strftime('%Y-%m-%d') if second_transaction else '',
+            payment.get_total_paid(),
+            payment.get_remaining_amount(),
+            round(payment.get_completion_percentage(), 2),
+            payment.notes if payment.notes else '',
+            payment.created_at.strftime('%Y-%m-%d'),
+        ]
+
+
+def _column_widths(header, sample):
+    """Column widths from the header and a sample of rows"""
+    widths = [len(str(value)) for value in header]
+    for row in sample:
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+    return [min(width + 2, 50) for width in widths]
+
+
+def _styled_header(worksheet, columns):
+    """Header row cells for a write-only sheet"""
+    header_font = Font(bold=True, color='FFFFFF')
+    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    
+    header = []
+    for value in columns:
+        cell = WriteOnlyCell(worksheet, value=value)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        header.append(cell)
+    return header
+
+
+def write_batch_payments(batch, fileobj, payments=None, progress=None):
+    """Write a batch's payments as an xlsx workbook into ``fileobj``, returning the row count"""
+    if payments is None:
+        payments = batch_payments_queryset(batch)
+    
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Batch Payments')
+    
+    rows = batch_payment_rows(batch, payments)
+    sample = list(islice(rows, WIDTH_SAMPLE_SIZE))
+    
+    for index, width in enumerate(_column_widths(BATCH_PAYMENT_COLUMNS, sample), start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+    
+    worksheet.append(_styled_header(worksheet, BATCH_PAYMENT_COLUMNS))
+    
+    row_count = 0
+    for row in sample:
+        worksheet.append(row)
+        row_count += 1
+    for row in rows:
+        worksheet.append(row)
+        row_count += 1
+        # Report after every chunk
+        if progress and row_count % EXPORT_CHUNK_SIZE == 0:
+            progress(row_count)
+    
+    workbook.save(fileobj)
+    if progress:
+        progress(row_count)
+    return row_count
+
+
+def write_table(columns, rows, fileobj, title):
+    """Write a small header-and-rows table as an xlsx workbook into ``fileobj``"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    
+    for index, width in enumerate(_column_widths(columns, rows), start=1):
+        worksheet.column_dimensions[get_column_letter(index)].width = width
+    
+    worksheet.append(_styled_header(worksheet, columns))
+    for row in rows:
+        worksheet.append(row)
+    
+    workbook.save(fileobj)
+    return len(rows)
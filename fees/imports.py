@@ -0,0 +1,238 @@
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.utils import timezone
+from collections import defaultdict
+from decimal import Decimal
+import pandas as pd
+import uuid
+
+from .models import StudentPayment, PaymentImport, payment_status_expression, payments_bulk_changed
+from .rollups import record_payment_revenue
+from students.models import Student
+from core.models import Currency
+
+REQUIRED_COLUMNS = ['Student ID', 'Total Amount']
+
+# Rows written per bulk_create/bulk_update statement
+BULK_BATCH_SIZE = 500
+
+
+class PaymentImporter:
+    """Set-based engine applying a payment sheet to one batch"""
+    
+    def __init__(self, import_record, user):
+        self.import_record = import_record
+        self.batch = import_record.batch
+        self.user = user
+        self.notes = f'Imported from {import_record.file_name}'
+        self.successful_imports = 0
+        self.failed_imports = 0
+        self.error_log = []
+        self.default_currency = None
+    
+    def run(self, frames, progress=None):
+        """Import frame by frame, committing and recording progress after each one"""
+        row_offset = 0
+        try:
+            for frame in frames:
+                # A failing frame leaves no trace, so keep what the earlier ones counted
+                counts = (self.successful_imports, self.failed_imports, len(self.error_log))
+                try:
+                    with transaction.atomic():
+                        self.process_frame(frame, row_offset)
+                except Exception:
+                    self.successful_imports, self.failed_imports = counts[:2]
+                    del self.error_log[counts[2]:]
+                    raise
+                row_offset += len(frame)
+                self._save_progress(row_offset)
+                if progress:
+                    progress(row_offset)
+        except Exception as e:
+            self.import_record.status = 'failed'
+            self.error_log.append(
+                f'Import stopped at row {row_offset + 2}; rows above it were saved: {str(e)}'
+            )
+            self._save_record(max(self.import_record.total_rows, row_offset))
+            raise
+        
+        self.import_record.status = 'completed'
+        self._save_record(row_offset)
+        return self.import_record
+    
+    def _save_progress(self, rows_done):
+        """Publish the running counts without touching the rest of the record"""
+        self.import_record.total_rows = max(self.import_record.total_rows, rows_done)
+        PaymentImport.objects.filter(pk=self.import_record.pk).update(
+            total_rows=self.import_record.total_rows,
+            successful_imports=self.successful_imports,
+            failed_imports=self.failed_imports,
+            updated_at=timezone.now()
+        )
+    
+    def _save_record(self, total_rows):
+        self.import_record.total_rows = total_rows
+        self.import_record.successful_imports = self.successful_imports
+        self.import_record.failed_imports = self.failed_imports
+        self.import_record.error_log = '\n'.join(self.error_log)
+        self.import_record.save()
+    
+    def _fail(self, rows, message):
+        """Record an error for every row in the frame slice"""
+        for row_number, student_id in zip(rows['row_number'], rows['student_id']):
+            self.error_log.append(f"Row {row_number}: {message.format(student_id=student_id)}")
+        self.failed_imports += len(rows)
+    
+    def process_frame(self, df, row_offset=0):
+        """Validate a frame with vectorized checks and apply it with bulk writes"""
+        frame = pd.DataFrame({
+            # Excel row numbers: header is row 1
+            'row_number': range(row_offset + 2, row_offset + 2 + len(df)),
+            'student_id': df['Student ID'].fillna('').astype(str).str.strip(),
+            'total_amount': pd.to_numeric(df['Total Amount'], errors='coerce'),
+            'currency': (
+                df['Currency ID'].fillna('').astype(str).str.strip()
+                if 'Currency ID' in df.columns else ''
+            ),
+        })
+        frame.loc[frame['currency'].isin(['', 'nan', 'None']), 'currency'] = ''
+        
+        # Amount checks
+        invalid_amount = frame['total_amount'].isna() | (frame['total_amount'] < 0)
+        self._fail(frame[invalid_amount], "Invalid total amount for student '{student_id}'")
+        frame = frame[~invalid_amount]
+        
+        # Later rows for the same student win
+        duplicated = frame.duplicated('student_id', keep='last')
+        self._fail(frame[duplicated], "Student ID '{student_id}' appears again further down the sheet")
+        frame = frame[~duplicated]
+        
+        # Students, in one query
+        students = dict(Student.objects.filter(
+            student_id__in=frame['student_id'].unique().tolist(),
+            is_active=True
+        ).values_list('student_id', 'id'))
+        missing_student = ~frame['student_id'].isin(list(students))
+        self._fail(frame[missing_student], "Student ID '{student_id}' not found")
+        frame = frame[~missing_student]
+        
+        # Currencies, by id or code, in one query
+        currencies = self._load_currencies(frame['currency'].unique().tolist())
+        frame = frame.assign(currency_id=frame['currency'].map(currencies))
+        missing_currency = frame['currency_id'].isna()
+        self._fail(frame[missing_currency], "Currency not found for student '{student_id}'")
+        frame = frame[~missing_currency]
+        
+        if frame.empty:
+            return
+        
+        student_pks = frame['student_id'].map(students)
+        existing = {
+            payment.student_id: payment
+            for payment in StudentPayment.objects.filter(batch=self.batch, student_id__in=student_pks.tolist())
+        }
+        
+        to_create = []
+        to_update = defaultdict(list)
+        for student_pk, total_amount, currency_id in zip(student_pks, frame['total_amount'], frame['currency_id']):
+            total_amount = Decimal(str(round(float(total_amount), 2)))
+            payment = existing.get(student_pk)
+            if payment is None:
+                to_create.append(StudentPayment(
+                    student_id=student_pk,
+                    batch=self.batch,
+                    total_amount=total_amount,
+                    remaining_amount=total_amount,
+                    currency_id=currency_id,
+                    created_by=self.user,
+                    notes=self.notes,
+                ))
+            else:
+                to_update[(total_amount, currency_id)].append(payment)
+        
+        StudentPayment.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        self._apply_updates(to_update)
+        payments_bulk_changed.send(
+            sender=StudentPayment,
+            payment_ids=[payment.pk for payment in to_create] + [
+                payment.pk for payments in to_update.values() for payment in payments
+            ]
+        )
+        
+        self.successful_imports += len(frame)
+    
+    def _apply_updates(self, to_update):
+        """Update existing payments, one statement per shared (amount, currency) value"""
+        now = timezone.now()
+        # The rollup files revenue under the payment's currency, so payments changing currency take theirs along
+        moved = [
+            payment.pk for (total_amount, currency_id), payments in to_update.items()
+            for payment in payments if payment.currency_id != currency_id
+        ]
+        record_payment_revenue(moved, sign=-1)
+        
+        singles = []
+        for (total_amount, currency_id), payments in to_update.items():
+            if len(payments) == 1:
+                payment = payments[0]
+                payment.total_amount = total_amount
+                payment.currency_id = currency_id
+                payment.created_by = self.user
+                payment.notes = self.notes
+                payment.updated_at = now
+                singles.append(payment)
+                continue
+            pks = [payment.pk for payment in payments]
+            for start in range(0, len(pks), BULK_BATCH_SIZE):
+                StudentPayment.objects.filter(pk__in=pks[start:start + BULK_BATCH_SIZE]).update(
+                    total_amount=total_amount,
+                    currency_id=currency_id,
+                    created_by=self.user,
+                    notes=self.notes,
+                    updated_at=now,
+                    remaining_amount=total_amount - F('total_paid'),
+                    status=payment_status_expression(F('total_paid'), Value(total_amount)),
+                )
+        
+        # Rows with a value of their own go through one bulk_update
+        if singles:
+            StudentPayment.objects.bulk_update(
+                singles,
+                ['total_amount', 'currency', 'created_by', 'notes', 'updated_at'],
+                batch_size=BULK_BATCH_SIZE
+            )
+            # Bring the stored balances in line with the new totals
+            StudentPayment.objects.filter(pk__in=[payment.pk for payment in singles]).update(
+                remaining_amount=F('total_amount') - F('total_paid'),
+                status=payment_status_expression(F('total_paid')),
+            )
+        
+        record_payment_revenue(moved)
+    
+    def _load_currencies(self, values):
+        """Map sheet currency values (blank, id or code) to currency ids"""
+        mapping = {}
+        if '' in values:
+            if self.default_currency is None:
+                self.default_currency = (
+                    Currency.objects.filter(is_default=True).first() or Currency.objects.first()
+                )
+            if self.default_currency:
+                mapping[''] = self.default_currency.id
+        
+        ids = []
+        for value in values:
+            try:
+                ids.append(uuid.UUID(value))
+            except ValueError:
+                pass
+        codes = [value.upper() for value in values if value]
+        
+        if ids or codes:
+            for currency_id, code in Currency.objects.filter(Q(id__in=ids) | Q(code__in=codes)).values_list('id', 'code'):
+                mapping[str(currency_id)] = currency_id
+                mapping[code] = currency_id
+            for value in values:
+                if value and value not in mapping and value.upper() in mapping:
+                    mapping[value] = mapping[value.upper()]
+        return mapping
@@ -0,0 +1,144 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, F
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal, ROUND_DOWN
+
+from .models import StudentPayment, FeeInstallment, payment_status_expression, payments_bulk_changed
+from .reports import invalidate_ar_aging
+
+# Installments written per bulk_create statement
+BULK_BATCH_SIZE = 1000
+
+# Payments read per chunk while building a schedule
+PAYMENT_CHUNK_SIZE = 2000
+
+
+def installment_due_dates(start_date, end_date, count):
+    """Spread ``count`` due dates evenly over a batch, the first one due on its start date"""
+    span = (end_date - start_date).days
+    return [start_date + timedelta(days=span * number // count) for number in range(count)]
+
+
+def split_amount(total, count):
+    """Split a total into ``count`` equal shares, putting the rounding difference on the last one"""
+    total = Decimal(str(total))
+    share = (total / count).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    return [share] * (count - 1) + [total - share * (count - 1)]
+
+
+def generate_installments(batch, fee_structure=None, replace=False):
+    """Create the installment schedule of every active payment in a batch with bulk inserts"""
+    fee_structure = fee_structure or batch.fee_structure
+    if fee_structure is None:
+        raise ValueError(f'{batch.name} has no fee structure to take the installment count from.')
+    if not batch.start_date or not batch.end_date:
+        raise ValueError(f'{batch.name} needs a start and end date to schedule installments.')
+    
+    count = max(fee_structure.installment_count, 1)
+    due_dates = installment_due_dates(batch.start_date, batch.end_date, count)
+    payments = StudentPayment.objects.filter(batch=batch, is_active=True, total_amount__gt=0)
+    
+    created = 0
+    with transaction.atomic():
+        if replace:
+            FeeInstallment.objects.filter(payment__in=payments).delete()
+        else:
+            # Payments that already have a schedule keep it
+            payments = payments.exclude(Exists(FeeInstallment.objects.filter(payment=OuterRef('pk'))))
+        
+        to_create = []
+        rows = payments.values('id', 'student_id', 'total_amount', 'currency_id').order_by()
+        for payment in rows.iterator(chunk_size=PAYMENT_CHUNK_SIZE):
+            cumulative_amount = Decimal('0')
+            amounts = split_amount(payment['total_amount'], count)
+            for number, (due_date, amount) in enumerate(zip(due_dates, amounts), start=1):
+                cumulative_amount += amount
+                to_create.append(FeeInstallment(
+                    payment_id=payment['id'],
+                    student_id=payment['student_id'],
+                    batch=batch,
+                    fee_structure=fee_structure,
+                    installment_number=number,
+                    due_date=due_date,
+                    amount=amount,
+                    currency_id=payment['currency_id'],
+                    cumulative_amount=cumulative_amount
+                ))
+            
+            if len(to_create) >= BULK_BATCH_SIZE:
+                FeeInstallment.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+                created += len(to_create)
+                to_create = []
+        
+        FeeInstallment.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+        created += len(to_create)
+        
+        # Count what has already been paid against the new schedule
+        FeeInstallment.objects.filter(batch=batch, is_active=True).refresh_from_payments()
+        transaction.on_commit(invalidate_ar_aging)
+    
+    return created
+
+
+def append_installments(payment, amount, count, currency, interval_days=30):
+    """Add ``count`` installments of ``amount`` to one payment's schedule, due every ``interval_days``"""
+    amount = Decimal(str(amount))
+    with transaction.atomic():
+        last = payment.installments.order_by('-installment_number').values(
+            'installment_number', 'cumulative_amount'
+        ).first() or {'installment_number': 0, 'cumulative_amount': Decimal('0')}
+        
+        today = timezone.localdate()
+        to_create = []
+        for offset in range(1, count + 1):
+            to_create.append(FeeInstallment(
+                payment=payment,
+                student_id=payment.student_id,
+                batch_id=payment.batch_id,
+                installment_number=last['installment_number'] + offset,
+                due_date=today + timedelta(days=interval_days * offset),
+                amount=amount,
+                currency=currency,
+                cumulative_amount=last['cumulative_amount'] + amount * offset
+            ))
+        FeeInstallment.objects.bulk_create(to_create)
+        FeeInstallment.objects.filter(payment=payment).refresh_from_payments()
+        transaction.on_commit(invalidate_ar_aging)
+    return to_create
+
+
+def sweep_overdue(today=None):
+    """Flag past-due installments and payments as overdue with a handful of set-based UPDATEs"""
+    today = today or timezone.localdate()
+    now = timezone.now()
+    
+    with transaction.atomic():
+        # Installments still fully covered by their payment's balance are left alone
+        installments = FeeInstallment.objects.filter(is_active=True).exclude(
+            status='paid',
+            payment__total_paid__gte=F('cumulative_amount')
+        )
+        refreshed = installments.refresh_from_payments(today)
+        
+        # Uncorrelated IN lists, so each statement reads the installments once
+        overdue_payment_ids = FeeInstallment.objects.filter(
+            status='overdue',
+            is_active=True
+        ).values('payment_id')
+        to_flag = StudentPayment.objects.filter(
+            pk__in=overdue_payment_ids,
+            is_active=True,
+            status__in=['pending', 'partial']
+        )
+        # Payments that caught up go back to the status their balance gives them
+        to_clear = StudentPayment.objects.filter(status='overdue').exclude(pk__in=overdue_payment_ids)
+        
+        # Read before the UPDATEs, which leave nothing to tell the changed rows apart by
+        changed_ids = list(to_flag.values_list('pk', flat=True)) + list(to_clear.values_list('pk', flat=True))
+        flagged = to_flag.update(status='overdue', updated_at=now)
+        cleared = to_clear.update(status=payment_status_expression(F('total_paid'), keep_overdue=False), updated_at=now)
+        if changed_ids:
+            payments_bulk_changed.send(sender=StudentPayment, payment_ids=changed_ids)
+    
+    return {'installments': refreshed, 'overdue': flagged, 'cleared': cleared}
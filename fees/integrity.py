@@ -0,0 +1,167 @@
+from django.db import connection
+from django.utils import timezone
+from decimal import Decimal
+
+from core.processes import django_process_pool
+from students.models import Student
+from .models import StudentPayment, PaymentTransaction
+
+# Payments recomputed per chunk when the work is split up
+PAYMENT_CHUNK_SIZE = 5000
+
+# Drifted payments listed by a check
+DRIFT_SAMPLE_SIZE = 20
+
+# Amounts closer than this are the same; SQLite sums money as floats
+MONEY_TOLERANCE = '0.005'
+
+
+def _names():
+    quote_name = connection.ops.quote_name
+    return {
+        'payment': quote_name(StudentPayment._meta.db_table),
+        'transaction': quote_name(PaymentTransaction._meta.db_table),
+        'student': quote_name(Student._meta.db_table),
+    }
+
+
+def _payment_filter(alias, batch_id=None, pk_from=None, pk_to=None):
+    """WHERE clause and params limiting payments to a batch and/or a primary key range"""
+    prep = StudentPayment._meta.pk.get_db_prep_value
+    clauses = ['1 = 1']
+    params = []
+    if batch_id is not None:
+        clauses.append(f'{alias}.batch_id = %s')
+        params.append(StudentPayment._meta.get_field('batch').target_field.get_db_prep_value(batch_id, connection))
+    if pk_from is not None:
+        clauses.append(f'{alias}.id >= %s')
+        params.append(prep(pk_from, connection))
+    if pk_to is not None:
+        clauses.append(f'{alias}.id < %s')
+        params.append(prep(pk_to, connection))
+    return ' AND '.join(clauses), params
+
+
+def _totals_sql(batch_id=None, pk_from=None, pk_to=None):
+    """Each payment's sum and count of active transactions, as a derived table"""
+    names = _names()
+    where, params = _payment_filter('p', batch_id, pk_from, pk_to)
+    sql = (
+        f'SELECT p.id AS payment_id, COALESCE(SUM(t.amount), 0) AS total_paid, COUNT(t.id) AS transaction_count '
+        f'FROM {names["payment"]} p '
+        f'LEFT JOIN {names["transaction"]} t ON t.payment_id = p.id AND t.is_active = %s '
+        f'WHERE {where} GROUP BY p.id'
+    )
+    return sql, [True] + params
+
+
+def _status_sql(payment):
+    # Overdue is owned by sweep_overdue, so it is kept until the balance is settled
+    return (
+        f"CASE WHEN {payment}.total_amount <= totals.total_paid THEN 'completed' "
+        f"WHEN {payment}.status = 'overdue' THEN 'overdue' "
+        f"WHEN totals.total_paid > 0 THEN 'partial' ELSE 'pending' END"
+    )
+
+
+def _drift_sql(payment):
+    return (
+        f'(ABS({payment}.total_paid - totals.total_paid) >= {MONEY_TOLERANCE} '
+        f'OR ABS({payment}.remaining_amount - ({payment}.total_amount - totals.total_paid)) >= {MONEY_TOLERANCE} '
+        f'OR {payment}.transaction_count <> totals.transaction_count '
+        f'OR {payment}.status <> {_status_sql(payment)})'
+    )
+
+
+def recompute_payments(batch_id=None, pk_from=None, pk_to=None):
+    """Rewrite balances and status of drifted payments with one UPDATE ... FROM (SELECT SUM ...)"""
+    payment = _names()['payment']
+    totals_sql, params = _totals_sql(batch_id, pk_from, pk_to)
+    sql = (
+        f'UPDATE {payment} SET '
+        f'total_paid = totals.total_paid, '
+        f'remaining_amount = {payment}.total_amount - totals.total_paid, '
+        f'transaction_count = totals.transaction_count, '
+        f'status = {_status_sql(payment)}, '
+        f'updated_at = %s '
+        f'FROM ({totals_sql}) AS totals '
+        f'WHERE {payment}.id = totals.payment_id AND {_drift_sql(payment)}'
+    )
+    updated_at = StudentPayment._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [updated_at] + params)
+        return cursor.rowcount
+
+
+def payment_drift(batch_id=None, pk_from=None, pk_to=None, sample_size=DRIFT_SAMPLE_SIZE):
+    """Count payments whose stored balances or status disagree with their transactions, without writing"""
+    names = _names()
+    totals_sql, params = _totals_sql(batch_id, pk_from, pk_to)
+    drifted = (
+        f'FROM {names["payment"]} p JOIN ({totals_sql}) AS totals ON totals.payment_id = p.id '
+        f'JOIN {names["student"]} s ON s.id = p.student_id '
+        f'WHERE {_drift_sql("p")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) {drifted}', params)
+        count = cursor.fetchone()[0]
+        sample = []
+        if count and sample_size:
+            cursor.execute(
+                f'SELECT s.student_id, p.total_paid, totals.total_paid, p.transaction_count, '
+                f'totals.transaction_count, p.status, {_status_sql("p")} {drifted} '
+                f'ORDER BY s.student_id LIMIT {int(sample_size)}',
+                params
+            )
+            columns = [
+                'student_id', 'stored_total_paid', 'total_paid', 'stored_transaction_count',
+                'transaction_count', 'stored_status', 'status'
+            ]
+            sample = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            for row in sample:
+                for key in ('stored_total_paid', 'total_paid'):
+                    row[key] = Decimal(str(row[key])).quantize(Decimal('0.01'))
+    return {'drifted': count, 'sample': sample}
+
+
+def payment_chunks(batch_id=None, chunk_size=PAYMENT_CHUNK_SIZE):
+    """(pk_from, pk_to) ranges of about ``chunk_size`` payments each, covering every payment"""
+    payments = StudentPayment.objects.all()
+    if batch_id is not None:
+        payments = payments.filter(batch_id=batch_id)
+    
+    boundaries = [None]
+    pks = payments.order_by('pk').values_list('pk', flat=True)
+    for position, pk in enumerate(pks.iterator(chunk_size=chunk_size)):
+        if position and position % chunk_size == 0:
+            boundaries.append(pk)
+    boundaries.append(None)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _run_chunk(args):
+    check, batch_id, pk_from, pk_to = args
+    if check:
+        return payment_drift(batch_id, pk_from, pk_to)
+    return recompute_payments(batch_id, pk_from, pk_to)
+
+
+def run_in_chunks(check=False, batch_id=None, chunk_size=PAYMENT_CHUNK_SIZE, workers=1):
+    """Check or recompute chunk by chunk, on ``workers`` processes; returns the combined result"""
+    tasks = [(check, batch_id, pk_from, pk_to) for pk_from, pk_to in payment_chunks(batch_id, chunk_size)]
+    
+    if workers > 1 and len(tasks) > 1:
+        # Each chunk commits on its own, so a failure leaves the finished chunks in place
+        with django_process_pool(workers) as pool:
+            results = list(pool.map(_run_chunk, tasks))
+    else:
+        results = [_run_chunk(task) for task in tasks]
+    
+    if not check:
+        return sum(results)
+    
+    sample = [row for result in results for row in result['sample']]
+    return {
+        'drifted': sum(result['drifted'] for result in results),
+        'sample': sorted(sample, key=lambda row: row['student_id'])[:DRIFT_SAMPLE_SIZE],
+    }
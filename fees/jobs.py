@@ -0,0 +1,131 @@
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.utils.dateparse import parse_date
+from datetime import datetime
+import pandas as pd
+import tempfile
+
+from core.jobs import register_job
+from core.uploads import UploadReader, UploadFormatError
+from core.firebase_utils import student_firebase_manager
+from .models import StudentPayment, PaymentTransaction, PaymentImport, BankStatement
+from .exports import batch_payments_queryset, write_batch_payments
+from .imports import PaymentImporter, REQUIRED_COLUMNS
+from .reconciliation import StatementReconciler, REQUIRED_COLUMNS as STATEMENT_COLUMNS
+from .pdf import get_payment_summary_pdf
+from .bulk_documents import write_bulk_documents
+from batches.models import Batch
+
+# Rows committed (and reported as progress) at a time
+IMPORT_CHUNK_SIZE = 500
+
+
+def fail_import(import_record, message):
+    """Close an import that could not start"""
+    import_record.status = 'failed'
+    import_record.error_log = message
+    import_record.save()
+
+
+@register_job('fees.import_payments')
+def import_payments(job):
+    """Apply an uploaded payment sheet to its batch"""
+    import_record = PaymentImport.objects.select_related('batch', 'imported_by').get(pk=job.payload['import_id'])
+    
+    with job.input_file.open('rb') as upload:
+        try:
+            reader = UploadReader(upload, import_record.file_name, REQUIRED_COLUMNS, chunk_size=IMPORT_CHUNK_SIZE)
+        except UploadFormatError as e:
+            fail_import(import_record, str(e))
+            raise
+        except Exception as e:
+            fail_import(import_record, f'Could not read {import_record.file_name}: {str(e)}')
+            raise
+        
+        with reader:
+            import_record.total_rows = reader.row_count_hint or 0
+            import_record.save(update_fields=['total_rows', 'updated_at'])
+            job.set_progress(0, import_record.total_rows)
+            
+            # One small DataFrame per chunk; the sheet is never loaded whole
+            frames = (pd.DataFrame.from_records(chunk, columns=reader.columns) for chunk in reader.chunks())
+            PaymentImporter(import_record, import_record.imported_by).run(frames, progress=job.set_progress)
+
+
+@register_job('fees.reconcile_statement')
+def reconcile_statement(job):
+    """Match an uploaded bank statement against unreconciled bank transfers"""
+    statement = BankStatement.objects.get(pk=job.payload['statement_id'])
+    
+    with job.input_file.open('rb') as upload:
+        try:
+            reader = UploadReader(upload, statement.file_name, STATEMENT_COLUMNS)
+        except Exception as e:
+            statement.status = 'failed'
+            statement.error_log = str(e)
+            statement.save()
+            raise
+        
+        with reader:
+            # Rows are read one at a time; only the parsed lines are kept
+            StatementReconciler(statement).run(reader.rows(), reader.columns, progress=job.set_progress)
+
+
+@register_job('fees.export_batch_payments')
+def export_batch_payments(job):
+    """Write a batch's payments to an xlsx file stored on the job"""
+    batch = Batch.objects.get(pk=job.payload['batch_id'])
+    payments = batch_payments_queryset(batch)
+    job.set_progress(0, payments.count())
+    
+    filename = f'batch_payments_{batch.name.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    with tempfile.TemporaryFile() as export_file:
+        write_batch_payments(batch, export_file, payments, progress=job.set_progress)
+        export_file.seek(0)
+        job.result_file.save(filename, File(export_file), save=False)
+
+
+@register_job('fees.payment_summary_pdf')
+def payment_summary_pdf(job):
+    """Render (or reuse) a student's payment summary and store the PDF on the job"""
+    payment = StudentPayment.objects.select_related(
+        'student', 'student__user', 'batch', 'currency'
+    ).get(pk=job.payload['payment_id'])
+    
+    pdf_content = get_payment_summary_pdf(payment)
+    job.result_file.save(f'payment_summary_{payment.student.student_id}.pdf', ContentFile(pdf_content), save=False)
+    job.set_progress(1, 1)
+
+
+@register_job('fees.bulk_documents')
+def bulk_documents(job):
+    """Render every receipt or summary of a batch and/or date range into one PDF or a ZIP"""
+    payload = job.payload
+    batch = Batch.objects.get(pk=payload['batch_id']) if payload.get('batch_id') else None
+    date_from = parse_date(payload['date_from']) if payload.get('date_from') else None
+    date_to = parse_date(payload['date_to']) if payload.get('date_to') else None
+    
+    scope = batch.name.replace(" ", "_") if batch else 'all_batches'
+    if date_from or date_to:
+        scope += f'_{date_from or "start"}_to_{date_to or "today"}'
+    filename = f'{payload["kind"]}_{scope}.{payload["format"]}'
+    
+    with tempfile.TemporaryFile() as output:
+        write_bulk_documents(
+            payload['kind'], payload['format'], output,
+            batch=batch, date_from=date_from, date_to=date_to,
+            progress=job.set_progress
+        )
+        output.seek(0)
+        job.result_file.save(filename, File(output), save=False)
+
+
+@register_job('fees.sync_transactions_to_firebase')
+def sync_transactions_to_firebase(job):
+    """Push a bulk upload's transactions to Firestore in batched writes"""
+    transactions = list(PaymentTransaction.objects.filter(pk__in=job.payload['transaction_ids']).select_related(
+        'payment', 'payment__student', 'payment__batch', 'processed_by'
+    ))
+    job.set_progress(0, len(transactions))
+    student_firebase_manager.sync_payment_transactions_to_firestore(transactions)
+    job.set_progress(len(transactions))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_date
+from batches.models import Batch
+from fees.bulk_documents import write_bulk_documents, DOCUMENT_KINDS, OUTPUT_FORMATS
+
+class Command(BaseCommand):
+    help = 'Render every receipt or payment summary of a batch and/or date range into one PDF or a ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write (e.g. receipts.pdf or summaries.zip)')
+        parser.add_argument('--kind', choices=[kind for kind, label in DOCUMENT_KINDS], default='receipts')
+        parser.add_argument('--format', choices=[fmt for fmt, label in OUTPUT_FORMATS], help='Defaults to the output file extension')
+        parser.add_argument('--batch', help='ID or code of the batch (e.g. B57)')
+        parser.add_argument('--from', dest='date_from', help='First payment date to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last payment date to include (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, help='Worker processes for ZIP output (default: CPU count, at most 4)')
+
+    def handle(self, *args, **options):
+        output_format = options['format'] or ('zip' if options['output'].lower().endswith('.zip') else 'pdf')
+        
+        try:
+            date_from = parse_date(options['date_from']) if options['date_from'] else None
+            date_to = parse_date(options['date_to']) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        
+        batch = None
+        if options['batch']:
+            batch = Batch.objects.filter(code=options['batch']).first()
+            if batch is None:
+                try:
+                    batch = Batch.objects.get(id=options['batch'])
+                except (Batch.DoesNotExist, ValidationError):
+                    raise CommandError(f'Batch "{options["batch"]}" not found')
+        elif not (date_from or date_to):
+            raise CommandError('Give a --batch, a --from/--to date range, or both')
+        
+        self.stdout.write(f'Generating {options["kind"]} as {output_format.upper()}...')
+        
+        try:
+            with open(options['output'], 'wb') as output:
+                count = write_bulk_documents(
+                    options['kind'], output_format, output,
+                    batch=batch, date_from=date_from, date_to=date_to,
+                    workers=options['workers'],
+                    progress=lambda done, total: self.stdout.write(f'  {done}/{total}')
+                )
+            
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully wrote {count} documents to {options["output"]}!')
+            )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error generating documents: {str(e)}')
+            )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from batches.models import Batch
+from fees.installments import generate_installments
+
+class Command(BaseCommand):
+    help = 'Create installment schedules from each batch\'s dates and fee structure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', help='ID or code of the batch (default: every batch with a fee structure)')
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Rebuild existing schedules too, e.g. after payment amounts changed'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch']:
+            batch = Batch.objects.filter(code=options['batch']).first()
+            if batch is None:
+                try:
+                    batch = Batch.objects.get(id=options['batch'])
+                except (Batch.DoesNotExist, ValidationError):
+                    raise CommandError(f'Batch "{options["batch"]}" not found')
+            batches = [batch]
+        else:
+            batches = Batch.objects.filter(
+                is_active=True,
+                fee_structure__isnull=False,
+                start_date__isnull=False,
+                end_date__isnull=False
+            ).select_related('fee_structure')
+        
+        for batch in batches:
+            try:
+                created_count = generate_installments(batch, replace=options['replace'])
+                self.stdout.write(
+                    self.style.SUCCESS(f'{batch.name}: created {created_count} installments')
+                )
+            except Exception as e:
+                self.stdout.write(
+                    self.style.ERROR(f'{batch.name}: error generating installments: {str(e)}')
+                )
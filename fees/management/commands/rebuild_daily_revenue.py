@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from fees.rollups import rebuild_daily_revenue
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue rollup from payment transactions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='First day to rebuild (YYYY-MM-DD); default: all history')
+        parser.add_argument('--to', dest='date_to', help='Last day to rebuild (YYYY-MM-DD); default: all history')
+    
+    def handle(self, *args, **options):
+        try:
+            date_from = parse_date(options['date_from']) if options['date_from'] else None
+            date_to = parse_date(options['date_to']) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        
+        self.stdout.write('Rebuilding daily revenue...')
+        
+        try:
+            created = rebuild_daily_revenue(date_from, date_to)
+            
+            self.stdout.write(
+                self.style.SUCCESS(f'Wrote {created} daily revenue rows.')
+            )
+        
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error rebuilding daily revenue: {str(e)}')
+            )
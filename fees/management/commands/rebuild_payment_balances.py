@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from fees.models import StudentPayment, payments_bulk_changed
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized paid/remaining balances of student payments from their transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', help='Only rebuild payments of the batch with this ID')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding payment balances...')
+        
+        try:
+            payments = StudentPayment.objects.all()
+            if options['batch']:
+                payments = payments.filter(batch_id=options['batch'])
+            
+            updated_count = payments.rebuild_balances()
+            if updated_count:
+                payments_bulk_changed.send(sender=StudentPayment, payment_ids=None)
+            
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully rebuilt balances for {updated_count} payments!')
+            )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error rebuilding payment balances: {str(e)}')
+            )
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from django.db import connection
+from batches.models import Batch
+from fees.models import StudentPayment, payments_bulk_changed
+from core.processes import default_worker_count
+from fees.integrity import run_in_chunks, PAYMENT_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Recompute the balances and status of student payments from their transactions, or report drift with --check'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', help='ID or code of the batch (default: every payment)')
+        parser.add_argument('--check', action='store_true', help='Only report payments that have drifted; write nothing')
+        parser.add_argument('--chunk-size', type=int, default=PAYMENT_CHUNK_SIZE, help='Payments per chunk')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=f'Chunks processed in parallel (0 = {default_worker_count()} on this machine)'
+        )
+    
+    def handle(self, *args, **options):
+        batch = None
+        if options['batch']:
+            batch = Batch.objects.filter(code=options['batch']).first()
+            if batch is None:
+                try:
+                    batch = Batch.objects.get(id=options['batch'])
+                except (Batch.DoesNotExist, ValidationError):
+                    raise CommandError(f'Batch "{options["batch"]}" not found')
+        
+        workers = options['workers'] or default_worker_count()
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite takes one writer at a time, so parallel chunks would only queue up
+            self.stdout.write('SQLite database: processing chunks one at a time.')
+            workers = 1
+        
+        scope = batch.name if batch else 'all payments'
+        self.stdout.write(f'{"Checking" if options["check"] else "Recomputing"} {scope}...')
+        
+        try:
+            result = run_in_chunks(
+                check=options['check'],
+                batch_id=batch.id if batch else None,
+                chunk_size=options['chunk_size'],
+                workers=workers
+            )
+        except Exception as e:
+            raise CommandError(f'Error recomputing payment status: {str(e)}')
+        
+        if not options['check']:
+            if result:
+                # Too many payments to list; the summaries are rebuilt as a whole
+                payments_bulk_changed.send(sender=StudentPayment, payment_ids=None)
+            self.stdout.write(self.style.SUCCESS(f'Recomputed {result} drifted payments.'))
+            return
+        
+        if not result['drifted']:
+            self.stdout.write(self.style.SUCCESS('No drift found.'))
+            return
+        
+        for row in result['sample']:
+            self.stdout.write(
+                f'  {row["student_id"]}: paid {row["stored_total_paid"]} -> {row["total_paid"]}, '
+                f'transactions {row["stored_transaction_count"]} -> {row["transaction_count"]}, '
+                f'status {row["stored_status"]} -> {row["status"]}'
+            )
+        self.stdout.write(self.style.ERROR(f'{result["drifted"]} payments have drifted.'))
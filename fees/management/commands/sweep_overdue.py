@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from fees.installments import sweep_overdue
+
+class Command(BaseCommand):
+    help = 'Mark installments and payments that are past due as overdue (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Treat this day as today (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        try:
+            today = parse_date(options['date']) if options['date'] else None
+        except ValueError as e:
+            raise CommandError(f'Invalid date: {e}')
+        
+        self.stdout.write('Sweeping overdue payments...')
+        
+        try:
+            result = sweep_overdue(today)
+            
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Refreshed {result["installments"]} installments; '
+                    f'{result["overdue"]} payments now overdue, {result["cleared"]} no longer overdue.'
+                )
+            )
+            
+        except Exception as e:
+            self.stdout.write(
+                self.style.ERROR(f'Error sweeping overdue payments: {str(e)}')
+            )
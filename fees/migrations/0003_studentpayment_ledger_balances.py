@@ -0,0 +1,58 @@
+# Generated by Django 5.2.7 on 2026-10-18 06:27
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_balances(apps, schema_editor):
+    """Populate the new balance columns from existing active transactions"""
+    StudentPayment = apps.get_model('fees', 'StudentPayment')
+    PaymentTransaction = apps.get_model('fees', 'PaymentTransaction')
+    
+    transactions = PaymentTransaction.objects.filter(
+        payment=OuterRef('pk'),
+        is_active=True
+    ).order_by().values('payment')
+    total_paid = Coalesce(
+        Subquery(transactions.annotate(total=Sum('amount')).values('total')),
+        Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+    transaction_count = Coalesce(
+        Subquery(transactions.annotate(count=Count('pk')).values('count')),
+        Value(0),
+    )
+    StudentPayment.objects.update(
+        total_paid=total_paid,
+        remaining_amount=F('total_amount') - total_paid,
+        transaction_count=transaction_count,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0002_remove_studentpayment_unique_student_batch_payment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentpayment',
+            name='remaining_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='studentpayment',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='studentpayment',
+            name='transaction_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
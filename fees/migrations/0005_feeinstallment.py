@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_fix_batch_code_constraint'),
+        ('core', '0004_idempotencykey'),
+        ('fees', '0004_receiptcounter'),
+        ('students', '0004_student_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeInstallment',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('installment_number', models.PositiveIntegerField()),
+                ('due_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cumulative_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('partial', 'Partial'), ('paid', 'Paid'), ('overdue', 'Overdue')], default='pending', max_length=20)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('paid_date', models.DateField(blank=True, null=True)),
+                ('late_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('notes', models.TextField(blank=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='batches.batch')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.currency')),
+                ('fee_structure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.feestructure')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='fees.studentpayment')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='students.student')),
+            ],
+            options={
+                'ordering': ['due_date', 'installment_number'],
+                'indexes': [models.Index(fields=['status', 'due_date'], name='fees_feeins_status_2ad581_idx')],
+                'unique_together': {('payment', 'installment_number')},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fees', '0006_dailyrevenue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('file_name', models.CharField(max_length=200)),
+                ('total_lines', models.PositiveIntegerField(default=0)),
+                ('matched_lines', models.PositiveIntegerField(default=0)),
+                ('exception_lines', models.PositiveIntegerField(default=0)),
+                ('ignored_lines', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing', max_length=20)),
+                ('error_log', models.TextField(blank=True)),
+                ('uploaded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BankStatementLine',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('line_number', models.PositiveIntegerField()),
+                ('value_date', models.DateField(blank=True, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('reference', models.CharField(blank=True, max_length=255)),
+                ('narrative', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('exception', 'Exception'), ('ignored', 'Ignored')], max_length=20)),
+                ('match_method', models.CharField(blank=True, choices=[('receipt', 'Receipt number'), ('student', 'Student ID and amount'), ('amount_date', 'Amount and date'), ('fuzzy', 'Fuzzy reference')], max_length=20)),
+                ('exception_reason', models.CharField(blank=True, max_length=255)),
+                ('statement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='fees.bankstatement')),
+                ('transaction', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statement_line', to='fees.paymenttransaction')),
+            ],
+            options={
+                'ordering': ['line_number'],
+                'indexes': [models.Index(fields=['statement', 'status'], name='fees_bankst_stateme_22d563_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:31
+
+from django.db import migrations
+
+
+def copy_counters(apps, schema_editor):
+    ReceiptCounter = apps.get_model('fees', 'ReceiptCounter')
+    Sequence = apps.get_model('core', 'Sequence')
+    for counter in ReceiptCounter.objects.all():
+        Sequence.objects.update_or_create(
+            prefix='RCP', year=counter.year,
+            defaults={'last_value': counter.last_value}
+        )
+
+
+def restore_counters(apps, schema_editor):
+    ReceiptCounter = apps.get_model('fees', 'ReceiptCounter')
+    Sequence = apps.get_model('core', 'Sequence')
+    for sequence in Sequence.objects.filter(prefix='RCP'):
+        ReceiptCounter.objects.update_or_create(
+            year=sequence.year,
+            defaults={'last_value': sequence.last_value}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_sequence'),
+        ('fees', '0007_bankstatement'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_counters, restore_counters),
+        migrations.DeleteModel(
+            name='ReceiptCounter',
+        ),
+    ]
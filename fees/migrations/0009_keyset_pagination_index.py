@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0007_keyset_pagination_indexes'),
+        ('core', '0005_sequence'),
+        ('fees', '0008_move_receiptcounter_to_sequence'),
+        ('students', '0008_duplicatekey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentpayment',
+            index=models.Index(fields=['-created_at', '-id'], name='fees_payment_page'),
+        ),
+    ]
@@ -1,10 +1,99 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Count, Value, Case, When, Subquery, OuterRef, ExpressionWrapper
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+from django.utils import timezone
+from decimal import Decimal
 from core.models import BaseModel, Currency
 from students.models import Student
 from batches.models import Batch
 import uuid
 
+# Sent with ``payment_ids`` after bulk writes to balances or statuses, which bypass post_save;
+# None stands for more payments than are worth listing
+payments_bulk_changed = Signal()
+
+
+def payment_status_expression(total_paid, total_amount=F('total_amount'), keep_overdue=True):
+    """SQL expression deriving a payment's status from its paid amount"""
+    # Overdue is owned by sweep_overdue, so balance changes keep it until the payment is settled
+    # (as fees.integrity does); only the sweep itself clears it
+    return Case(
+        When(LessThanOrEqual(total_amount, total_paid), then=Value('completed')),
+        *([When(status='overdue', then=Value('overdue'))] if keep_overdue else []),
+        When(GreaterThan(total_paid, 0), then=Value('partial')),
+        default=Value('pending'),
+    )
+
+
+def installment_paid_expression(total_paid):
+    """SQL expression for how much of an installment ``total_paid`` covers, paying installments off in due-date order"""
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+    # Whatever the earlier installments didn't use up goes to this one
+    available = ExpressionWrapper(total_paid - (F('cumulative_amount') - F('amount')), output_field=money)
+    return Least(Greatest(available, Value(Decimal('0')), output_field=money), F('amount'), output_field=money)
+
+
+class StudentPaymentQuerySet(models.QuerySet):
+    """Queryset owning the ledger write path for the denormalized balances"""
+    
+    def apply_transaction_delta(self, amount, count=1):
+        """Atomically add ``amount`` and ``count`` to the stored balances"""
+        amount = Decimal(str(amount))
+        total_paid = F('total_paid') + amount
+        return self.update(
+            total_paid=total_paid,
+            remaining_amount=F('remaining_amount') - amount,
+            transaction_count=F('transaction_count') + count,
+            status=payment_status_expression(total_paid),
+            updated_at=timezone.now(),
+        )
+    
+    def _active_transaction_totals(self):
+        """Correlated subqueries summing each payment's active transactions"""
+        transactions = PaymentTransaction.objects.filter(
+            payment=OuterRef('pk'),
+            is_active=True
+        ).order_by().values('payment')
+        total_paid = Coalesce(
+            Subquery(transactions.annotate(total=Sum('amount')).values('total')),
+            Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+        transaction_count = Coalesce(
+            Subquery(transactions.annotate(count=Count('pk')).values('count')),
+            Value(0),
+        )
+        return total_paid, transaction_count
+    
+    def with_totals(self):
+        """Annotate paid amount, remaining amount and completion percentage in the query"""
+        total_paid, _ = self._active_transaction_totals()
+        return self.annotate(
+            paid_amount=total_paid,
+            due_amount=F('total_amount') - F('paid_amount'),
+            paid_percentage=Case(
+                When(total_amount__gt=0, then=(
+                    Cast('paid_amount', models.FloatField()) * 100 / Cast('total_amount', models.FloatField())
+                )),
+                default=Value(0.0),
+                output_field=models.FloatField(),
+            ),
+        )
+    
+    def rebuild_balances(self):
+        """Recompute the stored balances from scratch from active transactions"""
+        total_paid, transaction_count = self._active_transaction_totals()
+        return self.update(
+            total_paid=total_paid,
+            remaining_amount=F('total_amount') - total_paid,
+            transaction_count=transaction_count,
+            status=payment_status_expression(total_paid),
+        )
+
+
 class StudentPayment(BaseModel):
     """Simple student payment model - tracks total amount and payments made"""
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='payments')
@@ -30,54 +119,149 @@ class StudentPayment(BaseModel):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    # Denormalized balance - only written by the ledger write path
+    total_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    remaining_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    transaction_count = models.PositiveIntegerField(default=0, editable=False)
+    
     # Additional Information
     notes = models.TextField(blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     
+    objects = StudentPaymentQuerySet.as_manager()
+    
+    LEDGER_FIELDS = ['total_paid', 'remaining_amount', 'transaction_count']
+    
     class Meta:
         unique_together = ['student', 'batch']  # One payment per student per batch
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the payment dashboard
+            models.Index(fields=['-created_at', '-id'], name='fees_payment_page'),
+        ]
     
     def __str__(self):
         return f"{self.student.student_id} - {self.batch.name} - {self.currency.code} {self.total_amount}"
     
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.remaining_amount = Decimal(str(self.total_amount)) - Decimal(str(self.total_paid))
+            super().save(*args, **kwargs)
+            return
+        
+        # Never write the ledger columns from a possibly stale instance
+        if kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LEDGER_FIELDS
+            ]
+        
+        from .rollups import record_payment_revenue
+        
+        # One transaction, so on_commit work queued by post_save sees the re-derived balance
+        with transaction.atomic(savepoint=False):
+            # The rollup files revenue under the payment's batch and currency, so a move takes it along
+            moved = False
+            if {'batch', 'currency'} & set(kwargs['update_fields']):
+                previous = StudentPayment.objects.select_for_update().filter(pk=self.pk).values('batch_id', 'currency_id').first()
+                moved = previous is not None and (previous['batch_id'], previous['currency_id']) != (self.batch_id, self.currency_id)
+            if moved:
+                record_payment_revenue([self.pk], sign=-1)
+            
+            super().save(*args, **kwargs)
+            
+            if moved:
+                record_payment_revenue([self.pk])
+            
+            if 'total_amount' in kwargs['update_fields']:
+                StudentPayment.objects.filter(pk=self.pk).update(
+                    remaining_amount=F('total_amount') - F('total_paid'),
+                    status=payment_status_expression(F('total_paid')),
+                )
+                self.refresh_from_db(fields=self.LEDGER_FIELDS + ['status'])
+    
     def get_total_paid(self):
         """Get total amount paid"""
-        from django.db.models import Sum
-        result = self.transactions.aggregate(total=Sum('amount'))['total']
-        total = result or 0
+        # Prefer the with_totals() annotation when the queryset provided it
+        total_paid = getattr(self, 'paid_amount', self.total_paid)
         # Round to 2 decimal places to avoid floating point precision issues
-        return round(float(total), 2)
+        return round(float(total_paid), 2)
     
     def get_remaining_amount(self):
         """Get remaining amount to be paid"""
-        remaining = float(self.total_amount) - float(self.get_total_paid())
+        remaining = getattr(self, 'due_amount', self.remaining_amount)
         # Round to 2 decimal places to avoid floating point precision issues
-        return round(remaining, 2)
+        return round(float(remaining), 2)
     
     def get_completion_percentage(self):
         """Get completion percentage"""
-        from decimal import Decimal
+        if hasattr(self, 'paid_percentage'):
+            return self.paid_percentage
         if self.total_amount > 0:
-            total_paid = Decimal(str(self.get_total_paid()))
+            total_paid = Decimal(str(self.total_paid))
             total_amount = Decimal(str(self.total_amount))
             return float((total_paid / total_amount) * 100)
         return 0
     
     def is_completed(self):
         """Check if payment is completed"""
-        return self.get_total_paid() >= self.total_amount
+        total_paid = getattr(self, 'paid_amount', self.total_paid)
+        return total_paid >= Decimal(str(self.total_amount))
     
     def update_status(self):
-        """Update status based on payments"""
-        total_paid = self.get_total_paid()
-        if total_paid >= self.total_amount:
+        """Update status based on the stored balance"""
+        self.refresh_from_db(fields=self.LEDGER_FIELDS)
+        if self.total_paid >= Decimal(str(self.total_amount)):
             self.status = 'completed'
-        elif total_paid > 0:
+        elif self.status == 'overdue':
+            # Left to sweep_overdue until the balance is settled
+            pass
+        elif self.total_paid > 0:
             self.status = 'partial'
         else:
             self.status = 'pending'
-        self.save()
+        self.save(update_fields=['status', 'updated_at'])
+
+
+class PaymentTransactionQuerySet(models.QuerySet):
+    """Queryset keeping payment balances in step with bulk changes"""
+    
+    def _reverse_balances(self):
+        """Take the active transactions in the queryset off their payments' balances and the revenue rollup"""
+        from .rollups import apply_revenue_deltas, revenue_deltas
+        
+        active = self.filter(is_active=True).order_by()
+        totals = active.values('payment_id').annotate(
+            total=Sum('amount'),
+            count=Count('pk')
+        )
+        payment_ids = []
+        for row in totals:
+            StudentPayment.objects.filter(pk=row['payment_id']).apply_transaction_delta(
+                -row['total'], -row['count']
+            )
+            payment_ids.append(row['payment_id'])
+        apply_revenue_deltas(revenue_deltas(
+            active.values_list('payment_id', 'payment_date', 'payment_method', 'amount'), sign=-1
+        ))
+        return payment_ids
+    
+    def deactivate(self):
+        """Soft-delete transactions and update their payments' balances"""
+        with transaction.atomic():
+            pks = list(self.filter(is_active=True).select_for_update().values_list('pk', flat=True))
+            if not pks:
+                return 0
+            active = PaymentTransaction.objects.filter(pk__in=pks)
+            payment_ids = active._reverse_balances()
+            updated = active.update(is_active=False, updated_at=timezone.now())
+            payments_bulk_changed.send(sender=StudentPayment, payment_ids=payment_ids)
+            return updated
+    
+    def delete(self):
+        with transaction.atomic():
+            self._reverse_balances()
+            return super().delete()
 
 class PaymentTransaction(BaseModel):
     """Individual payment transactions"""
@@ -104,6 +288,8 @@ class PaymentTransaction(BaseModel):
     notes = models.TextField(blank=True)
     processed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     
+    objects = PaymentTransactionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-payment_date']
     
@@ -112,15 +298,147 @@ class PaymentTransaction(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.receipt_number:
-            # Generate receipt number
-            import random
-            import string
-            self.receipt_number = f"RCP{''.join(random.choices(string.ascii_uppercase + string.digits, k=8))}"
+            # Taken from this process's reserved block, outside the save's own transaction
+            from .receipts import next_receipt_number
+            self.receipt_number = next_receipt_number()
+        
+        from .rollups import apply_revenue_deltas, revenue_deltas, merge_deltas
         
-        super().save(*args, **kwargs)
+        # No savepoint of its own: callers like record_payment already hold a transaction
+        with transaction.atomic(savepoint=False):
+            previous = None
+            if not self._state.adding:
+                previous = PaymentTransaction.objects.select_for_update().filter(
+                    pk=self.pk
+                ).values('payment_id', 'amount', 'is_active', 'payment_date', 'payment_method').first()
+            
+            super().save(*args, **kwargs)
+            
+            # Move the transaction between rollup rows, if it moved at all
+            revenue = []
+            if previous and previous['is_active']:
+                revenue.append(revenue_deltas([(
+                    previous['payment_id'], previous['payment_date'], previous['payment_method'], previous['amount']
+                )], sign=-1))
+            if self.is_active:
+                revenue.append(revenue_deltas([(self.payment_id, self.payment_date, self.payment_method, self.amount)]))
+            apply_revenue_deltas(merge_deltas(*revenue))
+            
+            # Move the balance delta onto the affected payment(s)
+            deltas = {}
+            if previous and previous['is_active']:
+                deltas[previous['payment_id']] = (-Decimal(str(previous['amount'])), -1)
+            if self.is_active:
+                amount, count = deltas.get(self.payment_id, (Decimal('0'), 0))
+                deltas[self.payment_id] = (amount + Decimal(str(self.amount)), count + 1)
+            for payment_id, (amount, count) in deltas.items():
+                if amount or count:
+                    StudentPayment.objects.filter(pk=payment_id).apply_transaction_delta(amount, count)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            if self.is_active:
+                from .rollups import record_revenue
+                StudentPayment.objects.filter(pk=self.payment_id).apply_transaction_delta(-self.amount, -1)
+                record_revenue([self], sign=-1)
+        return result
+
+class DailyRevenue(models.Model):
+    """Collections per day, batch, currency and payment method, kept in step by fees.rollups"""
+    date = models.DateField()
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='daily_revenue')
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
+    payment_method = models.CharField(max_length=20, choices=PaymentTransaction.PAYMENT_METHOD_CHOICES)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'batch', 'currency', 'payment_method'],
+                name='fees_dailyrevenue_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.batch} {self.payment_method}: {self.currency.code} {self.total_amount}"
+
+class FeeInstallmentQuerySet(models.QuerySet):
+    """Queryset deriving installment progress from the payments' stored balances"""
+    
+    def refresh_from_payments(self, today=None):
+        """Recompute paid amounts and statuses in one UPDATE, paying installments off in due-date order"""
+        today = today or timezone.localdate()
+        total_paid = Subquery(
+            StudentPayment.objects.filter(pk=OuterRef('payment_id')).order_by().values('total_paid')[:1],
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+        paid_amount = installment_paid_expression(total_paid)
+        is_paid = LessThanOrEqual(F('amount'), paid_amount)
         
-        # Update payment status
-        self.payment.update_status()
+        return self.update(
+            paid_amount=paid_amount,
+            status=Case(
+                When(is_paid, then=Value('paid')),
+                When(due_date__lt=today, then=Value('overdue')),
+                When(GreaterThan(paid_amount, 0), then=Value('partial')),
+                default=Value('pending'),
+            ),
+            paid_date=Case(
+                When(is_paid, then=Coalesce(F('paid_date'), Value(today))),
+                default=Value(None),
+                output_field=models.DateField(),
+            ),
+            updated_at=timezone.now(),
+        )
+
+
+class FeeInstallment(BaseModel):
+    """One scheduled installment of a student's payment"""
+    payment = models.ForeignKey(StudentPayment, on_delete=models.CASCADE, related_name='installments')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='installments')
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='installments')
+    fee_structure = models.ForeignKey('core.FeeStructure', on_delete=models.SET_NULL, null=True, blank=True)
+    
+    installment_number = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE)
+    # Amount of this and all earlier installments, so payments can be spread in one UPDATE
+    cumulative_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('partial', 'Partial'),
+        ('paid', 'Paid'),
+        ('overdue', 'Overdue'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    paid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    paid_date = models.DateField(null=True, blank=True)
+    late_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    notes = models.TextField(blank=True)
+    
+    objects = FeeInstallmentQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = ['payment', 'installment_number']
+        ordering = ['due_date', 'installment_number']
+        indexes = [
+            models.Index(fields=['status', 'due_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.student_id} - Installment {self.installment_number} due {self.due_date}"
+    
+    def get_remaining_amount(self):
+        """Get amount of this installment still to be paid"""
+        return self.amount - self.paid_amount
+    
+    def is_paid(self):
+        return self.status == 'paid'
 
 class PaymentImport(BaseModel):
     """Track Excel imports for payments"""
@@ -152,4 +470,81 @@ class PaymentImport(BaseModel):
         """Get success rate percentage"""
         if self.total_rows > 0:
             return (self.successful_imports / self.total_rows) * 100
-        return 0
\ No newline at end of file
+        return 0
+
+
+class BankStatement(BaseModel):
+    """An uploaded bank statement reconciled against bank-transfer transactions"""
+    file_name = models.CharField(max_length=200)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    
+    # Reconciliation Statistics
+    total_lines = models.PositiveIntegerField(default=0)
+    matched_lines = models.PositiveIntegerField(default=0)
+    exception_lines = models.PositiveIntegerField(default=0)
+    ignored_lines = models.PositiveIntegerField(default=0)
+    
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    error_log = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Statement {self.file_name} ({self.status})"
+    
+    def get_match_rate(self):
+        """Share of credit lines that were matched, in percent"""
+        credit_lines = self.matched_lines + self.exception_lines
+        if credit_lines > 0:
+            return (self.matched_lines / credit_lines) * 100
+        return 0
+
+
+class BankStatementLine(BaseModel):
+    """One statement line with the transaction it was matched to, or why it wasn't"""
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name='lines')
+    line_number = models.PositiveIntegerField()
+    value_date = models.DateField(null=True, blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    reference = models.CharField(max_length=255, blank=True)
+    narrative = models.TextField(blank=True)
+    
+    STATUS_CHOICES = [
+        ('matched', 'Matched'),
+        ('exception', 'Exception'),
+        ('ignored', 'Ignored'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    
+    MATCH_METHOD_CHOICES = [
+        ('receipt', 'Receipt number'),
+        ('student', 'Student ID and amount'),
+        ('amount_date', 'Amount and date'),
+        ('fuzzy', 'Fuzzy reference'),
+    ]
+    match_method = models.CharField(max_length=20, choices=MATCH_METHOD_CHOICES, blank=True)
+    
+    # A transaction is reconciled once, by at most one line
+    transaction = models.OneToOneField(
+        PaymentTransaction,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='statement_line'
+    )
+    exception_reason = models.CharField(max_length=255, blank=True)
+    
+    class Meta:
+        ordering = ['line_number']
+        indexes = [
+            models.Index(fields=['statement', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"Line {self.line_number}: {self.amount} ({self.status})"
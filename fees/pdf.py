@@ -0,0 +1,376 @@
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from PIL import Image as PILImage
+from functools import lru_cache
+from io import BytesIO
+import hashlib
+import os
+
+from .pdf_cache import pdf_cache
+
+LOGO_PATH = os.path.join(settings.BASE_DIR, 'static', 'images', 'sma-logo.jpg')
+
+
+@lru_cache(maxsize=None)
+def get_styles():
+    """Title, heading and body styles, built once per process"""
+    styles = getSampleStyleSheet()
+    
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.darkblue
+    )
+    
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        spaceAfter=12,
+        alignment=TA_LEFT,
+        textColor=colors.darkblue
+    )
+    
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=12,
+        spaceAfter=6,
+        alignment=TA_LEFT
+    )
+    
+    return title_style, heading_style, normal_style
+
+
+@lru_cache(maxsize=None)
+def get_logo():
+    """Logo scaled down to print size, prepared once per process (None when there is no logo)"""
+    try:
+        with PILImage.open(LOGO_PATH) as logo:
+            # 2 x 1 inch at 300 dpi is all the page can show
+            logo = logo.convert('RGB')
+            logo.thumbnail((600, 300))
+            buffer = BytesIO()
+            logo.save(buffer, format='JPEG', quality=90)
+            return buffer.getvalue()
+    except OSError:
+        return None  # Logo is optional
+
+
+def letterhead():
+    """Academy name and logo flowables for the top of every document"""
+    title_style = get_styles()[0]
+    story = [
+        Paragraph("Shahriar's Medical Academy", title_style),
+        Spacer(1, 12),
+    ]
+    
+    logo_bytes = get_logo()
+    if logo_bytes:
+        # Flowables hold layout state, so each document gets its own
+        logo = Image(BytesIO(logo_bytes), width=2*inch, height=1*inch)
+        logo.hAlign = 'CENTER'
+        story.append(logo)
+        story.append(Spacer(1, 12))
+    return story
+
+
+def build_pdf(story):
+    """Lay a story out on letter pages, returning the PDF bytes"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    doc.build(story)
+    
+    # Get PDF content
+    pdf_content = buffer.getvalue()
+    buffer.close()
+    
+    return pdf_content
+
+
+def receipt_story(transaction):
+    """Flowables of the receipt for a payment transaction"""
+    payment = transaction.payment
+    student = payment.student
+    
+    title_style, heading_style, normal_style = get_styles()
+    
+    # Build PDF content
+    story = []
+    
+    # Company Header
+    story.extend(letterhead())
+    
+    story.append(Paragraph("PAYMENT RECEIPT", heading_style))
+    story.append(Spacer(1, 12))
+    
+    # Receipt details
+    receipt_data = [
+        ['Receipt Number:', transaction.receipt_number],
+        ['Date:', transaction.payment_date.strftime('%B %d, %Y at %I:%M %p')],
+        ['Student ID:', student.student_id],
+        ['Student Name:', student.user.get_full_name()],
+        ['Batch:', payment.batch.name],
+        ['Phone:', student.phone if student.phone else 'N/A'],
+        ['Address:', student.address if student.address else 'N/A'],
+    ]
+    
+    # Payment details table
+    payment_table = Table(receipt_data, colWidths=[2*inch, 4*inch])
+    payment_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(payment_table)
+    story.append(Spacer(1, 20))
+    
+    # Payment summary
+    story.append(Paragraph("PAYMENT SUMMARY", heading_style))
+    
+    payment_summary_data = [
+        ['Description', 'Amount'],
+        ['Total Course Fee', f"{payment.currency.code} {payment.total_amount:,.2f}"],
+        ['Amount Paid Previously', f"{payment.currency.code} {payment.get_total_paid() - float(transaction.amount):,.2f}"],
+        ['Current Payment', f"{payment.currency.code} {transaction.amount:,.2f}"],
+        ['Total Paid', f"{payment.currency.code} {payment.get_total_paid():,.2f}"],
+        ['Remaining Balance', f"{payment.currency.code} {payment.get_remaining_amount():,.2f}"],
+    ]
+    
+    summary_table = Table(payment_summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(summary_table)
+    story.append(Spacer(1, 20))
+    
+    # Payment method and notes
+    story.append(Paragraph(f"Payment Method: {transaction.get_payment_method_display()}", normal_style))
+    if transaction.notes:
+        story.append(Paragraph(f"Notes: {transaction.notes}", normal_style))
+    
+    story.append(Spacer(1, 30))
+    
+    # Footer
+    story.append(Paragraph("Thank you for your payment!", normal_style))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("Shahriar's Medical Academy", normal_style))
+    story.append(Paragraph("Contact: info@shahriaracademy.com", normal_style))
+    
+    return story
+
+
+def payment_summary_story(payment, transactions=None):
+    """Flowables of a student's payment summary"""
+    student = payment.student
+    if transactions is None:
+        transactions = payment.transactions.all().order_by('payment_date')
+    
+    title_style, heading_style, normal_style = get_styles()
+    
+    # Build PDF content
+    story = []
+    
+    # Company Header
+    story.extend(letterhead())
+    
+    story.append(Paragraph("PAYMENT SUMMARY REPORT", heading_style))
+    story.append(Spacer(1, 12))
+    
+    # Student details
+    student_data = [
+        ['Student ID:', student.student_id],
+        ['Student Name:', student.user.get_full_name()],
+        ['Batch:', payment.batch.name],
+        ['Phone:', student.phone if student.phone else 'N/A'],
+        ['Address:', student.address if student.address else 'N/A'],
+        ['Enrollment Date:', payment.student.enrollment_date.strftime('%B %d, %Y')],
+    ]
+    
+    student_table = Table(student_data, colWidths=[2*inch, 4*inch])
+    student_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(student_table)
+    story.append(Spacer(1, 20))
+    
+    # Payment transactions table
+    story.append(Paragraph("PAYMENT TRANSACTIONS", heading_style))
+    
+    transaction_data = [['Receipt #', 'Date', 'Amount', 'Method', 'Notes']]
+    
+    for transaction in transactions:
+        transaction_data.append([
+            transaction.receipt_number,
+            transaction.payment_date.strftime('%B %d, %Y'),
+            f"{payment.currency.code} {transaction.amount:,.2f}",
+            transaction.get_payment_method_display(),
+            transaction.notes[:30] + '...' if len(transaction.notes) > 30 else transaction.notes
+        ])
+    
+    transaction_table = Table(transaction_data, colWidths=[1.2*inch, 1.2*inch, 1*inch, 1*inch, 1.6*inch])
+    transaction_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(transaction_table)
+    story.append(Spacer(1, 20))
+    
+    # Payment summary
+    story.append(Paragraph("PAYMENT SUMMARY", heading_style))
+    
+    summary_data = [
+        ['Total Course Fee', f"{payment.currency.code} {payment.total_amount:,.2f}"],
+        ['Total Paid', f"{payment.currency.code} {payment.get_total_paid():,.2f}"],
+        ['Remaining Balance', f"{payment.currency.code} {payment.get_remaining_amount():,.2f}"],
+        ['Payment Progress', f"{payment.get_completion_percentage():.1f}%"],
+    ]
+    
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(summary_table)
+    story.append(Spacer(1, 30))
+    
+    # Footer
+    # The time of the data shown rather than of the rendering, as the PDF may be served from the cache later
+    data_as_of = timezone.localtime(summary_version_time(payment, transactions))
+    story.append(Paragraph("Generated on: " + data_as_of.strftime('%B %d, %Y at %I:%M %p'), normal_style))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("Shahriar's Medical Academy", normal_style))
+    
+    return story
+
+
+def render_receipt_pdf(transaction):
+    """Render the receipt for a payment transaction, returning the PDF bytes"""
+    return build_pdf(receipt_story(transaction))
+
+
+def render_payment_summary_pdf(payment, transactions=None):
+    """Render a student's payment summary, returning the PDF bytes"""
+    return build_pdf(payment_summary_story(payment, transactions))
+
+
+# Bump when the layout changes so documents cached under the old one are not served
+RENDER_VERSION = 1
+
+
+def _digest(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in (RENDER_VERSION,) + parts).encode()).hexdigest()
+
+
+def _printed_names(payment):
+    """Names a document prints from rows whose own changes don't touch the payment or student"""
+    return payment.student.user.get_full_name(), payment.batch.name, payment.currency.code
+
+
+def receipt_etag(transaction):
+    """Version tag of a receipt: changes whenever anything printed on it can"""
+    payment = transaction.payment
+    return _digest(
+        transaction.id, transaction.updated_at.isoformat(),
+        payment.updated_at.isoformat(), payment.transaction_count,
+        payment.student.updated_at.isoformat(), *_printed_names(payment)
+    )
+
+
+def _transactions_version(payment, transactions=None):
+    """Latest change and row count of the transactions a summary lists"""
+    # A transaction edit that moves no money (notes, method, date) doesn't touch the payment row
+    if transactions is None:
+        version = payment.transactions.aggregate(changed=Max('updated_at'), rows=Count('pk'))
+        return version['changed'], version['rows']
+    return max((payment_transaction.updated_at for payment_transaction in transactions), default=None), len(transactions)
+
+
+def payment_summary_etag(payment, transactions=None):
+    """Version tag of a payment summary"""
+    changed, rows = _transactions_version(payment, transactions)
+    return _digest(
+        payment.id, payment.updated_at.isoformat(), payment.transaction_count,
+        changed.isoformat() if changed else '', rows,
+        payment.student.updated_at.isoformat(), *_printed_names(payment)
+    )
+
+
+def summary_version_time(payment, transactions):
+    """Latest change to the rows a payment summary prints"""
+    return max(
+        [payment.updated_at, payment.student.updated_at, payment.batch.updated_at]
+        + [payment_transaction.updated_at for payment_transaction in transactions]
+    )
+
+
+def get_receipt_pdf(transaction, render=True):
+    """Receipt PDF bytes from the cache, rendering and storing them on a miss"""
+    name = f'receipt-{transaction.id}-{receipt_etag(transaction)}'
+    pdf_content = pdf_cache.get(transaction.payment_id, name)
+    if pdf_content is None and render:
+        pdf_content = render_receipt_pdf(transaction)
+        pdf_cache.set(transaction.payment_id, name, pdf_content)
+    return pdf_content
+
+
+def get_payment_summary_pdf(payment, render=True, transactions=None):
+    """Payment summary PDF bytes from the cache, rendering and storing them on a miss"""
+    name = f'summary-{payment_summary_etag(payment, transactions)}'
+    pdf_content = pdf_cache.get(payment.id, name)
+    if pdf_content is None and render:
+        pdf_content = render_payment_summary_pdf(payment, transactions)
+        pdf_cache.set(payment.id, name, pdf_content)
+    return pdf_content
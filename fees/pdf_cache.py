@@ -0,0 +1,41 @@
+from django.core.cache import caches
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cache alias holding rendered PDFs; a database table so every web and worker instance shares it
+PDF_CACHE_ALIAS = 'pdf'
+
+
+class PDFCache:
+    """Rendered PDFs in the shared cache, keyed by payment and document version"""
+    
+    def __init__(self, alias=PDF_CACHE_ALIAS):
+        self.alias = alias
+    
+    @property
+    def cache(self):
+        return caches[self.alias]
+    
+    def _key(self, payment_id, name):
+        return f'fees:pdf:{payment_id}:{name}'
+    
+    def get(self, payment_id, name):
+        """Cached PDF bytes, or None"""
+        try:
+            return self.cache.get(self._key(payment_id, name))
+        except Exception as e:
+            logger.warning(f'Could not read cached {name}: {e}')
+            return None
+    
+    def set(self, payment_id, name, content):
+        """Store PDF bytes; a failed write only costs a re-render"""
+        try:
+            self.cache.set(self._key(payment_id, name), content)
+        except Exception as e:
+            logger.warning(f'Could not cache {name}: {e}')
+            return False
+        return True
+
+
+pdf_cache = PDFCache()
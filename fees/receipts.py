@@ -0,0 +1,20 @@
+from core.sequences import SequenceAllocator
+
+RECEIPT_PREFIX = 'RCP'
+
+# Numbers reserved from the sequence table per round trip
+RECEIPT_BLOCK_SIZE = 100
+
+receipt_numbers = SequenceAllocator(RECEIPT_PREFIX, width=6, block_size=RECEIPT_BLOCK_SIZE)
+
+
+def next_receipt_number():
+    return receipt_numbers.allocate(1)[0]
+
+
+def assign_receipt_numbers(transactions):
+    """Fill in missing receipt numbers on unsaved transactions, e.g. before bulk_create"""
+    missing = [payment_transaction for payment_transaction in transactions if not payment_transaction.receipt_number]
+    for payment_transaction, receipt_number in zip(missing, receipt_numbers.allocate(len(missing))):
+        payment_transaction.receipt_number = receipt_number
+    return transactions
@@ -0,0 +1,315 @@
+from django.db import transaction
+from django.utils import timezone
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from difflib import SequenceMatcher
+import re
+
+from .models import PaymentTransaction, BankStatementLine
+from .receipts import RECEIPT_PREFIX
+from .rollups import revenue_day
+
+REQUIRED_COLUMNS = ['Date', 'Amount']
+
+# Free-text columns searched for receipt numbers and student IDs, whichever the bank provides
+REFERENCE_COLUMNS = ['Reference', 'Description', 'Narrative', 'Details', 'Particulars']
+
+# A transfer may clear this many days before or after it was recorded
+DATE_WINDOW_DAYS = 3
+
+# Lowest similarity between a statement token and a receipt number/student ID for a fuzzy match
+FUZZY_THRESHOLD = 0.85
+
+# Above this many same-amount transactions in the window, fuzzy matching is not attempted
+MAX_FUZZY_CANDIDATES = 50
+
+# Statement lines written per bulk_create statement
+LINE_BATCH_SIZE = 1000
+
+# Day-first formats are tried before month-first ones
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%d-%b-%Y', '%d %B %Y', '%m/%d/%Y']
+
+TOKEN_PATTERN = re.compile(r'[A-Z0-9]+(?:[-/][A-Z0-9]+)*')
+RECEIPT_PATTERN = re.compile(rf'{RECEIPT_PREFIX}\d{{10}}')
+
+
+def normalize_reference(value):
+    """Upper-case alphanumerics only, so "rcp-2026 000123" and "RCP2026000123" compare equal"""
+    return re.sub(r'[^A-Z0-9]', '', str(value).upper())
+
+
+def reference_tokens(text):
+    """Normalized tokens of a narrative, plus receipt numbers split across several tokens"""
+    text = text.upper()
+    tokens = {normalize_reference(token) for token in TOKEN_PATTERN.findall(text)}
+    tokens.update(RECEIPT_PATTERN.findall(normalize_reference(text)))
+    tokens.discard('')
+    return tokens
+
+
+def parse_statement_amount(value):
+    """Statement amount as a Decimal; "(1,200.00)" and "1,200.00 DR" are debits"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    
+    text = str(value).strip().upper()
+    negative = text.startswith('(') and text.endswith(')') or text.endswith('DR')
+    text = re.sub(r'[^0-9.\-]', '', text.removesuffix('DR').removesuffix('CR'))
+    try:
+        amount = Decimal(text).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+    return -abs(amount) if negative else amount
+
+
+def parse_statement_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value is None:
+        return None
+    
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+class CandidateIndex:
+    """Unreconciled transactions hashed by receipt number, student ID and (amount, day)"""
+    
+    def __init__(self, candidates, date_window=DATE_WINDOW_DAYS):
+        self.date_window = date_window
+        self.by_receipt = {}
+        self.by_student = defaultdict(list)
+        self.by_amount_day = defaultdict(list)
+        self.taken = set()
+        
+        for candidate in candidates:
+            self.by_receipt[candidate['receipt']] = candidate
+            self.by_student[candidate['student']].append(candidate)
+            self.by_amount_day[(candidate['amount'], candidate['day'])].append(candidate)
+    
+    def take(self, candidate):
+        self.taken.add(candidate['pk'])
+    
+    def available(self, candidate):
+        return candidate is not None and candidate['pk'] not in self.taken
+    
+    def in_window(self, amount, day, candidates):
+        return [
+            candidate for candidate in candidates
+            if self.available(candidate) and candidate['amount'] == amount
+            and abs((candidate['day'] - day).days) <= self.date_window
+        ]
+    
+    def window(self, amount, day):
+        """Untaken transactions of exactly ``amount`` recorded within the date window of ``day``"""
+        candidates = []
+        for offset in range(-self.date_window, self.date_window + 1):
+            candidates.extend(
+                candidate for candidate in self.by_amount_day.get((amount, day + timedelta(days=offset)), ())
+                if self.available(candidate)
+            )
+        return candidates
+
+
+def closest(candidates, day):
+    return min(candidates, key=lambda candidate: (abs((candidate['day'] - day).days), candidate['receipt']))
+
+
+def similarity(tokens, candidate):
+    """Best similarity between any narrative token and the candidate's receipt number or student ID"""
+    best = 0
+    for token in tokens:
+        # Receipt numbers and student IDs always carry digits
+        if len(token) < 4 or not any(character.isdigit() for character in token):
+            continue
+        for reference in (candidate['receipt'], candidate['student']):
+            if not reference:
+                continue
+            matcher = SequenceMatcher(None, token, reference)
+            # The cheap upper bounds rule most pairs out before the full comparison
+            if matcher.real_quick_ratio() > best and matcher.quick_ratio() > best:
+                best = max(best, matcher.ratio())
+    return best
+
+
+class StatementReconciler:
+    """Match a streamed bank statement against unreconciled bank-transfer transactions in linear time"""
+    
+    def __init__(self, statement, date_window=DATE_WINDOW_DAYS):
+        self.statement = statement
+        self.date_window = date_window
+    
+    def parse(self, rows, columns):
+        """Turn statement rows into line dicts, setting aside debits and unreadable rows"""
+        narrative_columns = [column for column in REFERENCE_COLUMNS[1:] if column in columns]
+        lines = []
+        for line_number, row in enumerate(rows, start=2):
+            reference = str(row.get('Reference') or '').strip()
+            narrative = ' '.join(str(row[column]).strip() for column in narrative_columns if row.get(column) is not None)
+            line = {
+                'line_number': line_number,
+                'value_date': parse_statement_date(row.get('Date')),
+                'amount': parse_statement_amount(row.get('Amount')),
+                'reference': reference[:255],
+                'narrative': narrative,
+                'tokens': reference_tokens(f'{reference} {narrative}'),
+                'status': 'exception',
+                'match_method': '',
+                'transaction_id': None,
+                'exception_reason': '',
+            }
+            if line['value_date'] is None or line['amount'] is None:
+                line['exception_reason'] = 'Unreadable date or amount.'
+                line['tokens'] = None
+            elif line['amount'] <= 0:
+                line['status'] = 'ignored'
+                line['exception_reason'] = 'Not a credit.'
+                line['tokens'] = None
+            lines.append(line)
+        return lines
+    
+    def candidates(self, lines):
+        """Unreconciled bank transfers around the statement's dates, in one query"""
+        days = [line['value_date'] for line in lines if line['tokens'] is not None]
+        if not days:
+            return []
+        window = timedelta(days=self.date_window + 1)
+        rows = PaymentTransaction.objects.filter(
+            is_active=True,
+            payment_method='bank_transfer',
+            statement_line__isnull=True,
+            payment_date__gte=timezone.make_aware(datetime.combine(min(days) - window, datetime.min.time())),
+            payment_date__lt=timezone.make_aware(datetime.combine(max(days) + window, datetime.min.time())),
+        ).values_list('pk', 'amount', 'payment_date', 'receipt_number', 'payment__student__student_id')
+        return [
+            {
+                'pk': pk,
+                'amount': amount,
+                'day': revenue_day(payment_date),
+                'receipt': normalize_reference(receipt_number),
+                'student': normalize_reference(student_id),
+            }
+            for pk, amount, payment_date, receipt_number, student_id in rows.iterator(chunk_size=LINE_BATCH_SIZE)
+        ]
+    
+    def match_reference(self, line, index):
+        """First pass: a receipt number or student ID named in the narrative"""
+        for token in line['tokens']:
+            candidate = index.by_receipt.get(token)
+            if not index.available(candidate):
+                continue
+            if candidate['amount'] == line['amount']:
+                return candidate, 'receipt'
+            line['exception_reason'] = f'Receipt {token} was recorded for {candidate["amount"]}, not {line["amount"]}.'
+        
+        for token in line['tokens']:
+            candidates = index.in_window(line['amount'], line['value_date'], index.by_student.get(token, ()))
+            if candidates:
+                return closest(candidates, line['value_date']), 'student'
+        return None, None
+    
+    def match_amount(self, line, index):
+        """Second pass: the amount within the date window, fuzzy references breaking ties"""
+        candidates = index.window(line['amount'], line['value_date'])
+        if not candidates:
+            if not line['exception_reason']:
+                line['exception_reason'] = (
+                    f'No bank transfer of {line["amount"]} within {self.date_window} days.'
+                )
+            return None, None
+        
+        if len(candidates) == 1:
+            return candidates[0], 'amount_date'
+        if len(candidates) > MAX_FUZZY_CANDIDATES:
+            line['exception_reason'] = f'{len(candidates)} bank transfers of {line["amount"]} within {self.date_window} days.'
+            return None, None
+        
+        # The window is small, so comparing against each candidate stays cheap
+        scored = sorted(
+            ((similarity(line['tokens'], candidate), candidate) for candidate in candidates),
+            key=lambda item: -item[0]
+        )
+        best_score, best = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0
+        if best_score >= FUZZY_THRESHOLD and best_score > runner_up:
+            return best, 'fuzzy'
+        
+        line['exception_reason'] = f'{len(candidates)} bank transfers of {line["amount"]} within {self.date_window} days.'
+        return None, None
+    
+    def match(self, lines, index):
+        pending = [line for line in lines if line['tokens'] is not None]
+        for match_pass in (self.match_reference, self.match_amount):
+            unmatched = []
+            for line in pending:
+                candidate, method = match_pass(line, index)
+                if candidate is None:
+                    unmatched.append(line)
+                    continue
+                index.take(candidate)
+                line.update(
+                    status='matched',
+                    match_method=method,
+                    transaction_id=candidate['pk'],
+                    exception_reason=''
+                )
+            pending = unmatched
+    
+    def run(self, rows, columns, progress=None):
+        """Parse, match and store every line of the statement"""
+        try:
+            lines = self.parse(rows, columns)
+            if progress:
+                progress(0, len(lines))
+            
+            index = CandidateIndex(self.candidates(lines), self.date_window)
+            self.match(lines, index)
+            
+            with transaction.atomic():
+                to_create = []
+                for line in lines:
+                    to_create.append(BankStatementLine(
+                        statement=self.statement,
+                        line_number=line['line_number'],
+                        value_date=line['value_date'],
+                        amount=line['amount'],
+                        reference=line['reference'],
+                        narrative=line['narrative'],
+                        status=line['status'],
+                        match_method=line['match_method'],
+                        transaction_id=line['transaction_id'],
+                        exception_reason=line['exception_reason']
+                    ))
+                    if len(to_create) >= LINE_BATCH_SIZE:
+                        BankStatementLine.objects.bulk_create(to_create)
+                        to_create = []
+                        if progress:
+                            progress(line['line_number'] - 1, len(lines))
+                BankStatementLine.objects.bulk_create(to_create)
+                
+                statuses = [line['status'] for line in lines]
+                self.statement.total_lines = len(lines)
+                self.statement.matched_lines = statuses.count('matched')
+                self.statement.exception_lines = statuses.count('exception')
+                self.statement.ignored_lines = statuses.count('ignored')
+                self.statement.status = 'completed'
+                self.statement.save()
+        except Exception as e:
+            self.statement.status = 'failed'
+            self.statement.error_log = f'Reconciliation failed: {str(e)}'
+            self.statement.save()
+            raise
+        
+        if progress:
+            progress(len(lines), len(lines))
+        return self.statement
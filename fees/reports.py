@@ -0,0 +1,175 @@
+from django.core.cache import caches
+from django.db.models import Q, F, Sum, Count, Max, Value, DecimalField, ExpressionWrapper, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from .models import StudentPayment, PaymentTransaction, FeeInstallment, installment_paid_expression
+
+# Cache alias holding the report; a database table so a write in any process invalidates it for all of them
+AGING_CACHE_ALIAS = 'reports'
+
+AGING_CACHE_KEY = 'fees:ar-aging'
+
+# Seconds a computed aging report is served before it is recomputed
+AGING_CACHE_TTL = 300
+
+# (key, label, lower bound in days, upper bound in days or None)
+AGING_BUCKETS = [
+    ('current', '0-30 days', 0, 30),
+    ('days_31_60', '31-60 days', 31, 60),
+    ('days_61_90', '61-90 days', 61, 90),
+    ('days_over_90', '90+ days', 91, None),
+]
+
+AGING_COLUMNS = ['Batch', 'Batch Code', 'Currency', 'Students'] + [label for _, label, _, _ in AGING_BUCKETS] + ['Total Outstanding']
+
+# Columns a report row is grouped by
+AGING_GROUP = ['batch_id', 'batch__name', 'batch__code', 'currency__code']
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _money_sum(**filters):
+    return Coalesce(
+        Sum('outstanding', filter=Q(**filters) if filters else None),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _bucket_sums(field, bound):
+    """Conditional sums per bucket; ``bound(days)`` is the value of ``field`` that many days ago"""
+    buckets = {}
+    for key, label, lower, upper in AGING_BUCKETS:
+        # "31-60 days" means 31 to 60 days old; amounts not yet due count as current
+        filters = {}
+        if lower:
+            filters[f'{field}__lt'] = bound(lower - 1)
+        if upper is not None:
+            filters[f'{field}__gte'] = bound(upper)
+        buckets[key] = _money_sum(**filters)
+    return buckets
+
+
+def _scheduled_rows(today):
+    """Unpaid installments, bucketed by days past due"""
+    money = DecimalField(max_digits=10, decimal_places=2)
+    # Paid amounts come from the payment's stored total_paid, so they are current without waiting for a sweep
+    installments = FeeInstallment.objects.filter(is_active=True, payment__is_active=True).annotate(
+        outstanding=ExpressionWrapper(F('amount') - installment_paid_expression(F('payment__total_paid')), output_field=money)
+    ).filter(outstanding__gt=0)
+    
+    return installments.order_by().values(
+        'payment__batch_id', 'payment__batch__name', 'payment__batch__code', 'payment__currency__code'
+    ).annotate(
+        students=Count('payment', distinct=True),
+        total_outstanding=_money_sum(),
+        **_bucket_sums('due_date', lambda days: today - timedelta(days=days))
+    )
+
+
+def _unscheduled_rows(today):
+    """Balances of payments without an installment schedule, bucketed by days since the last payment"""
+    # A balance ages from its last active transaction, or from when the payment was opened
+    last_payment_date = Subquery(
+        PaymentTransaction.objects.filter(payment=OuterRef('pk'), is_active=True).order_by().values(
+            'payment'
+        ).annotate(last=Max('payment_date')).values('last')
+    )
+    payments = StudentPayment.objects.filter(is_active=True, remaining_amount__gt=0).exclude(
+        Exists(FeeInstallment.objects.filter(payment=OuterRef('pk'), is_active=True))
+    ).annotate(
+        aged_from=Coalesce(last_payment_date, 'created_at'),
+        outstanding=F('remaining_amount'),
+    )
+    
+    return payments.order_by().values(*AGING_GROUP).annotate(
+        students=Count('pk'),
+        total_outstanding=_money_sum(),
+        **_bucket_sums('aged_from', lambda days: _day_start(today - timedelta(days=days)))
+    )
+
+
+def ar_aging_rows(today=None):
+    """Outstanding balances per batch and currency in 0-30/31-60/61-90/90+ day buckets, in two grouped queries"""
+    today = today or timezone.localdate()
+    
+    rows = {}
+    for row in _unscheduled_rows(today):
+        rows[row['batch_id'], row['currency__code']] = row
+    for scheduled in _scheduled_rows(today):
+        row = {field: scheduled[f'payment__{field}'] for field in AGING_GROUP}
+        row = rows.setdefault((row['batch_id'], row['currency__code']), dict(
+            row, students=0, total_outstanding=Decimal('0'), **{key: Decimal('0') for key, _, _, _ in AGING_BUCKETS}
+        ))
+        # A payment is either scheduled or not, so the two sets of students never overlap
+        row['students'] += scheduled['students']
+        row['total_outstanding'] += scheduled['total_outstanding']
+        for key, _, _, _ in AGING_BUCKETS:
+            row[key] += scheduled[key]
+    return sorted(rows.values(), key=lambda row: (row['batch__name'], row['currency__code']))
+
+
+def ar_aging_totals(rows):
+    """Totals per currency; amounts in different currencies are never added together"""
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['currency__code'], {
+            'currency__code': row['currency__code'],
+            'students': 0,
+            'total_outstanding': Decimal('0'),
+            **{key: Decimal('0') for key, _, _, _ in AGING_BUCKETS},
+        })
+        total['students'] += row['students']
+        total['total_outstanding'] += row['total_outstanding']
+        for key, _, _, _ in AGING_BUCKETS:
+            total[key] += row[key]
+    return sorted(totals.values(), key=lambda total: total['currency__code'])
+
+
+def _aging_cache_key(today):
+    # Keyed by day, so a report cached before midnight isn't served with yesterday's ages
+    return f'{AGING_CACHE_KEY}:{today.isoformat()}'
+
+
+def get_ar_aging():
+    """The aging report from the cache, computing it when missing or expired"""
+    cache = caches[AGING_CACHE_ALIAS]
+    today = timezone.localdate()
+    report = cache.get(_aging_cache_key(today))
+    if report is None:
+        rows = ar_aging_rows(today)
+        report = {
+            'rows': rows,
+            'totals': ar_aging_totals(rows),
+            'as_of': today,
+            'generated_at': timezone.now(),
+        }
+        cache.set(_aging_cache_key(today), report, AGING_CACHE_TTL)
+    return report
+
+
+def invalidate_ar_aging():
+    caches[AGING_CACHE_ALIAS].delete(_aging_cache_key(timezone.localdate()))
+
+
+def ar_aging_table(report):
+    """Header and rows of the report as plain values, for CSV and Excel"""
+    table = []
+    for row in report['rows']:
+        table.append(
+            [row['batch__name'], row['batch__code'], row['currency__code'], row['students']]
+            + [float(row[key]) for key, _, _, _ in AGING_BUCKETS]
+            + [float(row['total_outstanding'])]
+        )
+    for total in report['totals']:
+        table.append(
+            ['All batches', '', total['currency__code'], total['students']]
+            + [float(total[key]) for key, _, _, _ in AGING_BUCKETS]
+            + [float(total['total_outstanding'])]
+        )
+    return AGING_COLUMNS, table
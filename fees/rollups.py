@@ -0,0 +1,230 @@
+from django.db import connection, transaction
+from django.db.models import F, Sum, Count, Min
+from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal
+import math
+
+from .models import StudentPayment, PaymentTransaction, DailyRevenue
+
+GRANULARITIES = ['day', 'week', 'month']
+
+# Points per currency a series is downsampled to unless the caller asks for fewer
+MAX_SERIES_POINTS = 400
+
+# Rollup rows written per bulk_create statement during a rebuild
+REBUILD_BATCH_SIZE = 1000
+
+
+def revenue_day(payment_date):
+    """The local day a transaction counts towards"""
+    if timezone.is_aware(payment_date):
+        return timezone.localdate(payment_date)
+    return payment_date.date()
+
+
+def revenue_deltas(transactions, sign=1):
+    """Fold (payment_id, payment_date, payment_method, amount) tuples into rollup deltas"""
+    deltas = {}
+    for payment_id, payment_date, payment_method, amount in transactions:
+        key = (revenue_day(payment_date), payment_id, payment_method)
+        total, count = deltas.get(key, (Decimal('0'), 0))
+        deltas[key] = (total + sign * Decimal(str(amount)), count + sign)
+    return deltas
+
+
+def merge_deltas(*deltas):
+    merged = {}
+    for delta in deltas:
+        for key, (amount, count) in delta.items():
+            total, total_count = merged.get(key, (Decimal('0'), 0))
+            merged[key] = (total + amount, total_count + count)
+    return {key: value for key, value in merged.items() if value != (Decimal('0'), 0)}
+
+
+def apply_revenue_deltas(deltas):
+    """Add deltas keyed by (day, payment_id, payment_method) onto the rollup, creating rows as needed"""
+    if not deltas:
+        return 0
+    
+    quote_name = connection.ops.quote_name
+    table = quote_name(DailyRevenue._meta.db_table)
+    payment_table = quote_name(StudentPayment._meta.db_table)
+    columns = {field: quote_name(DailyRevenue._meta.get_field(field).column) for field in [
+        'date', 'batch', 'currency', 'payment_method', 'total_amount', 'transaction_count'
+    ]}
+    total_amount = columns['total_amount']
+    transaction_count = columns['transaction_count']
+    
+    # The batch and currency come from the payment inside the statement, so callers only need its id
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns.values())}) '
+        f'SELECT %s, {quote_name("batch_id")}, {quote_name("currency_id")}, %s, %s, %s '
+        f'FROM {payment_table} WHERE {quote_name("id")} = %s '
+        f'ON CONFLICT ({columns["date"]}, {columns["batch"]}, {columns["currency"]}, {columns["payment_method"]}) '
+        f'DO UPDATE SET {total_amount} = {table}.{total_amount} + EXCLUDED.{total_amount}, '
+        f'{transaction_count} = {table}.{transaction_count} + EXCLUDED.{transaction_count}'
+    )
+    payment_pk = StudentPayment._meta.pk
+    params = []
+    # Sorted so concurrent writers take the rollup rows' locks in the same order
+    for (day, payment_id, payment_method), (amount, count) in sorted(deltas.items(), key=lambda item: str(item[0])):
+        params.append([
+            connection.ops.adapt_datefield_value(day),
+            payment_method,
+            connection.ops.adapt_decimalfield_value(amount, 14, 2),
+            count,
+            payment_pk.get_db_prep_value(payment_id, connection),
+        ])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    
+    # Rows whose last transaction moved away are dropped, as a rebuild would not write them
+    emptied_days = {day for (day, _, _), (_, count) in deltas.items() if count < 0}
+    if emptied_days:
+        DailyRevenue.objects.filter(date__in=emptied_days, transaction_count=0).delete()
+    return len(params)
+
+
+def record_revenue(transactions, sign=1):
+    """Add (or with ``sign=-1`` take off) saved PaymentTransaction instances on the rollup"""
+    return apply_revenue_deltas(revenue_deltas(
+        [(t.payment_id, t.payment_date, t.payment_method, t.amount) for t in transactions if t.is_active],
+        sign
+    ))
+
+
+def record_payment_revenue(payment_ids, sign=1):
+    """Add (or with ``sign=-1`` take off) every active transaction of the payments, under their current batch and currency"""
+    return apply_revenue_deltas(revenue_deltas(
+        PaymentTransaction.objects.filter(payment_id__in=payment_ids, is_active=True).order_by().values_list(
+            'payment_id', 'payment_date', 'payment_method', 'amount'
+        ),
+        sign
+    ))
+
+
+def rebuild_daily_revenue(date_from=None, date_to=None):
+    """Recompute the rollup from the transaction table, for the whole history or a date range"""
+    transactions = PaymentTransaction.objects.filter(is_active=True)
+    existing = DailyRevenue.objects.all()
+    if date_from:
+        transactions = transactions.filter(payment_date__date__gte=date_from)
+        existing = existing.filter(date__gte=date_from)
+    if date_to:
+        transactions = transactions.filter(payment_date__date__lte=date_to)
+        existing = existing.filter(date__lte=date_to)
+    
+    rows = transactions.order_by().values(
+        'payment_method',
+        day=TruncDate('payment_date'),
+        batch_id=F('payment__batch_id'),
+        currency_id=F('payment__currency_id'),
+    ).annotate(total=Sum('amount'), count=Count('pk'))
+    
+    created = 0
+    with transaction.atomic():
+        existing.delete()
+        to_create = []
+        for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            to_create.append(DailyRevenue(
+                date=row['day'],
+                batch_id=row['batch_id'],
+                currency_id=row['currency_id'],
+                payment_method=row['payment_method'],
+                total_amount=row['total'],
+                transaction_count=row['count']
+            ))
+            if len(to_create) >= REBUILD_BATCH_SIZE:
+                DailyRevenue.objects.bulk_create(to_create)
+                created += len(to_create)
+                to_create = []
+        DailyRevenue.objects.bulk_create(to_create)
+        created += len(to_create)
+    return created
+
+
+def period_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start + timedelta(days=1)
+
+
+def downsample(points, max_points):
+    """Merge runs of consecutive periods so at most ``max_points`` remain; each keeps its first period"""
+    if not max_points or len(points) <= max_points:
+        return points
+    size = math.ceil(len(points) / max_points)
+    merged = []
+    for index in range(0, len(points), size):
+        run = points[index:index + size]
+        merged.append({
+            'period': run[0]['period'],
+            'amount': sum((point['amount'] for point in run), Decimal('0')),
+            'count': sum(point['count'] for point in run),
+        })
+    return merged
+
+
+def revenue_series(granularity='day', date_from=None, date_to=None, batch_id=None, currency_code=None, payment_method=None, max_points=MAX_SERIES_POINTS):
+    """Collections per period and currency from the rollup alone, gaps filled with zeros"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularity must be one of: {", ".join(GRANULARITIES)}')
+    
+    rollup = DailyRevenue.objects.all()
+    if batch_id:
+        rollup = rollup.filter(batch_id=batch_id)
+    if currency_code:
+        rollup = rollup.filter(currency__code=currency_code)
+    if payment_method:
+        rollup = rollup.filter(payment_method=payment_method)
+    
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or rollup.aggregate(first=Min('date'))['first'] or date_to
+    rollup = rollup.filter(date__gte=date_from, date__lte=date_to)
+    
+    period = {'day': F('date'), 'week': TruncWeek('date'), 'month': TruncMonth('date')}[granularity]
+    rows = rollup.order_by().values('currency__code', period=period).annotate(
+        amount=Sum('total_amount'),
+        count=Sum('transaction_count')
+    ).order_by('currency__code', 'period')
+    
+    by_currency = {}
+    for row in rows:
+        by_currency.setdefault(row['currency__code'], {})[row['period']] = row
+    
+    periods = []
+    start = period_start(date_from, granularity)
+    while start <= date_to:
+        periods.append(start)
+        start = next_period(start, granularity)
+    
+    series = []
+    for currency_code, values in by_currency.items():
+        points = [
+            {
+                'period': start,
+                'amount': values[start]['amount'] if start in values else Decimal('0'),
+                'count': values[start]['count'] if start in values else 0,
+            }
+            for start in periods
+        ]
+        series.append({'currency': currency_code, 'points': downsample(points, max_points)})
+    
+    return {
+        'granularity': granularity,
+        'date_from': date_from,
+        'date_to': date_to,
+        'series': series,
+    }
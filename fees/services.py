@@ -0,0 +1,259 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, Sum, Count, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from core.currency import currency_rates
+from .models import StudentPayment, PaymentTransaction
+from .receipts import next_receipt_number, receipt_numbers
+from .rollups import record_revenue
+
+# A payment may exceed the remaining balance by this much (rounding on the cashier's side)
+OVERPAYMENT_TOLERANCE = Decimal('0.01')
+
+# Most transactions accepted by one record_payments() call
+MAX_BULK_TRANSACTIONS = 500
+
+# Sent with ``transactions`` after record_payments(), which bypasses post_save
+transactions_bulk_created = Signal()
+
+
+class PaymentRejected(ValueError):
+    """A payment amount that can't be recorded against the balance"""
+
+
+class PaymentBatchRejected(PaymentRejected):
+    """A bulk upload with invalid entries; none of it was recorded"""
+    
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} transaction(s) could not be recorded; nothing was saved.')
+
+
+MONEY_KEYS = ['total_amount', 'total_paid', 'total_remaining']
+
+
+def _money_sum(field):
+    """Sum of a money column, converted to the reporting currency, that is 0 instead of NULL for empty groups"""
+    return Coalesce(
+        Sum(currency_rates.converted(field)),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def _summary_aggregates():
+    """Conditional aggregates making up a payment summary"""
+    aggregates = {
+        'total_students': Count('pk'),
+        'total_amount': _money_sum('total_amount'),
+        'total_paid': _money_sum('total_paid'),
+        'total_remaining': _money_sum('remaining_amount'),
+    }
+    for status, _ in StudentPayment.STATUS_CHOICES:
+        aggregates[f'{status}_payments'] = Count('pk', filter=Q(status=status))
+    return aggregates
+
+
+def _empty_summary():
+    summary = {
+        'total_students': 0,
+        'total_amount': Decimal('0'),
+        'total_paid': Decimal('0'),
+        'total_remaining': Decimal('0'),
+    }
+    for status, _ in StudentPayment.STATUS_CHOICES:
+        summary[f'{status}_payments'] = 0
+    return summary
+
+
+def _add_completion(summary):
+    """Round the converted amounts, name their currency and derive the completion percentage"""
+    for key in MONEY_KEYS:
+        summary[key] = summary[key].quantize(Decimal('0.01'))
+    summary['currency'] = currency_rates.reporting_currency()['code']
+    if summary['total_amount'] > 0:
+        summary['completion_percentage'] = float(summary['total_paid'] / summary['total_amount'] * 100)
+    else:
+        summary['completion_percentage'] = 0
+    return summary
+
+
+def payment_summary(payments=None):
+    """Summarize a set of payments (all active payments by default) in one query"""
+    if payments is None:
+        payments = StudentPayment.objects.filter(is_active=True)
+    return _add_completion(payments.order_by().aggregate(**_summary_aggregates()))
+
+
+def batch_payment_summaries(batch_ids, payments=None):
+    """Summarize the payments of several batches in one grouped query, keyed by batch id"""
+    if payments is None:
+        payments = StudentPayment.objects.filter(is_active=True)
+    
+    # Normalize ids coming from query strings to the UUIDs the query returns
+    to_python = StudentPayment._meta.get_field('batch').target_field.to_python
+    batch_ids = [to_python(batch_id) for batch_id in batch_ids]
+    
+    rows = payments.filter(batch_id__in=batch_ids).order_by().values('batch_id').annotate(
+        **_summary_aggregates()
+    )
+    
+    summaries = {batch_id: _empty_summary() for batch_id in batch_ids}
+    for row in rows:
+        summaries[row.pop('batch_id')] = row
+    
+    return {batch_id: _add_completion(summary) for batch_id, summary in summaries.items()}
+
+
+def batch_payment_summary(batch_id, payments=None):
+    """Summarize the payments of a single batch"""
+    return batch_payment_summaries([batch_id], payments)[batch_id]
+
+
+def parse_payment_amount(amount):
+    """Validate a submitted payment amount and return it as a Decimal"""
+    try:
+        amount = Decimal(str(amount).strip())
+    except (InvalidOperation, ValueError):
+        raise PaymentRejected('Invalid payment amount.')
+    if not amount.is_finite():
+        raise PaymentRejected('Invalid payment amount.')
+    if amount <= 0:
+        raise PaymentRejected('Payment amount must be greater than 0.')
+    return amount.quantize(Decimal('0.01'))
+
+
+def _mirror_balance(payment, amount, count):
+    """Apply a recorded amount to an instance the way apply_transaction_delta() did in the database"""
+    payment.total_paid += amount
+    payment.remaining_amount -= amount
+    payment.transaction_count += count
+    if payment.total_paid >= payment.total_amount:
+        payment.status = 'completed'
+    elif payment.status != 'overdue':
+        payment.status = 'partial'
+
+
+def record_payment(payment, amount, payment_method='cash', notes='', processed_by=None):
+    """Record a transaction against a payment (instance or id) without ever overpaying its balance"""
+    amount = parse_payment_amount(amount)
+    payment_id = getattr(payment, 'pk', payment)
+    
+    # Taken before the row lock so a block reservation never happens while holding it
+    receipt_number = next_receipt_number()
+    
+    with transaction.atomic():
+        # Concurrent payments against the same balance queue up here
+        locked = StudentPayment.objects.select_for_update().get(pk=payment_id)
+        if amount > locked.remaining_amount + OVERPAYMENT_TOLERANCE:
+            raise PaymentRejected(
+                f'Payment amount cannot exceed remaining amount of {locked.remaining_amount:.2f}.'
+            )
+        
+        # save() inserts the row and moves the stored balance with F-expressions
+        payment_transaction = PaymentTransaction(
+            payment=locked,
+            amount=amount,
+            payment_method=payment_method,
+            notes=notes,
+            processed_by=processed_by,
+            receipt_number=receipt_number
+        )
+        payment_transaction.save()
+    
+    _mirror_balance(locked, amount, 1)
+    if isinstance(payment, StudentPayment):
+        for field in StudentPayment.LEDGER_FIELDS + ['status']:
+            setattr(payment, field, getattr(locked, field))
+    return payment_transaction
+
+
+def _parse_bulk_entry(entry):
+    """Validate one entry of a bulk upload into (payment_id, amount, payment_method, notes)"""
+    if not isinstance(entry, dict):
+        raise PaymentRejected('Each transaction must be an object.')
+    
+    try:
+        payment_id = StudentPayment._meta.pk.to_python(entry.get('payment_id'))
+    except ValidationError:
+        raise PaymentRejected('Invalid payment_id.')
+    if payment_id is None:
+        raise PaymentRejected('payment_id is required.')
+    
+    payment_method = entry.get('payment_method') or 'cash'
+    if payment_method not in dict(PaymentTransaction.PAYMENT_METHOD_CHOICES):
+        raise PaymentRejected(f'Unknown payment method "{payment_method}".')
+    
+    return payment_id, parse_payment_amount(entry.get('amount')), payment_method, str(entry.get('notes') or '')
+
+
+def record_payments(entries, processed_by=None):
+    """Record many transactions together: one lock query, bulk inserts and one balance update per payment"""
+    if not entries:
+        raise PaymentRejected('No transactions to record.')
+    if len(entries) > MAX_BULK_TRANSACTIONS:
+        raise PaymentRejected(f'At most {MAX_BULK_TRANSACTIONS} transactions can be recorded at once.')
+    
+    errors = []
+    parsed = []
+    for index, entry in enumerate(entries):
+        try:
+            parsed.append((index, *_parse_bulk_entry(entry)))
+        except PaymentRejected as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        raise PaymentBatchRejected(errors)
+    
+    numbers = receipt_numbers.allocate(len(parsed))
+    
+    with transaction.atomic():
+        # Locked in primary key order so concurrent uploads can't deadlock each other
+        payment_ids = {payment_id for _, payment_id, *_ in parsed}
+        payments = {
+            payment.pk: payment
+            for payment in StudentPayment.objects.select_for_update().filter(pk__in=payment_ids).order_by('pk')
+        }
+        
+        totals = defaultdict(Decimal)
+        counts = defaultdict(int)
+        to_create = []
+        for (index, payment_id, amount, payment_method, notes), receipt_number in zip(parsed, numbers):
+            payment = payments.get(payment_id)
+            if payment is None:
+                errors.append({'index': index, 'error': 'Payment not found.'})
+                continue
+            
+            totals[payment_id] += amount
+            counts[payment_id] += 1
+            if totals[payment_id] > payment.remaining_amount + OVERPAYMENT_TOLERANCE:
+                errors.append({
+                    'index': index,
+                    'error': f'Payments exceed the remaining amount of {payment.remaining_amount:.2f}.'
+                })
+                continue
+            
+            to_create.append(PaymentTransaction(
+                payment=payment,
+                amount=amount,
+                payment_method=payment_method,
+                notes=notes,
+                processed_by=processed_by,
+                receipt_number=receipt_number
+            ))
+        if errors:
+            raise PaymentBatchRejected(errors)
+        
+        PaymentTransaction.objects.bulk_create(to_create)
+        for payment_id, amount in totals.items():
+            StudentPayment.objects.filter(pk=payment_id).apply_transaction_delta(amount, counts[payment_id])
+        record_revenue(to_create)
+        
+        transactions_bulk_created.send(sender=PaymentTransaction, transactions=to_create)
+    
+    for payment_id, amount in totals.items():
+        _mirror_balance(payments[payment_id], amount, counts[payment_id])
+    return to_create
@@ -1,3 +1,735 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO
+from openpyxl import load_workbook
+from pypdf import PdfReader
+from unittest import mock
+import json
+import threading
+import zipfile
+import pandas as pd
 
-# Create your tests here.
+from batches.models import Batch
+from core.currency import currency_rates
+from core.sequences import SequenceAllocator
+from core.models import Currency, IdempotencyKey
+from students.models import Student
+from .installments import sweep_overdue
+from .integrity import payment_drift, recompute_payments, run_in_chunks
+from .models import StudentPayment, PaymentTransaction, FeeInstallment, DailyRevenue, PaymentImport, BankStatement
+from .pdf import payment_summary_etag, get_payment_summary_pdf, get_receipt_pdf
+from .reports import ar_aging_rows, get_ar_aging
+from .receipts import assign_receipt_numbers
+from .rollups import rebuild_daily_revenue
+from .bulk_documents import write_bulk_documents
+from .imports import PaymentImporter
+from .reconciliation import StatementReconciler
+from .exports import BATCH_PAYMENT_COLUMNS, write_batch_payments, write_table
+from .services import PaymentRejected, PaymentBatchRejected, record_payment, record_payments, batch_payment_summaries
+
+
+class PaymentTestCase(TestCase):
+    """Students with a 1000 USD payment each"""
+    
+    def setUp(self):
+        self.currency = Currency.objects.create(code='USD', name='US Dollar', symbol='$', exchange_rate=1, is_default=True)
+        self.batch = Batch.objects.create(name='Batch 57', code='B57', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.payment = self.make_payment(1)
+    
+    def make_payment(self, number, total_amount=1000):
+        user = User.objects.create_user(f'student{number}', f's{number}@example.com', 'pw', first_name='Rahim', last_name='Khan')
+        student = Student.objects.create(user=user, batch=self.batch, enrollment_date=date(2026, 1, 1))
+        # The payment record itself is created by a signal, with nothing billed yet
+        payment = StudentPayment.objects.get(student=student)
+        payment.total_amount = total_amount
+        payment.save()
+        return payment
+    
+    def assertLedger(self, payment, total_paid, transaction_count, status):
+        payment.refresh_from_db()
+        self.assertEqual(payment.total_paid, Decimal(total_paid))
+        self.assertEqual(payment.remaining_amount, payment.total_amount - Decimal(total_paid))
+        self.assertEqual(payment.transaction_count, transaction_count)
+        self.assertEqual(payment.status, status)
+        self.assertEqual(payment_drift()['drifted'], 0)
+
+
+class LedgerTests(PaymentTestCase):
+    """Stored balances follow every way a transaction can change"""
+    
+    def test_save(self):
+        payment_transaction = record_payment(self.payment, '300')
+        self.assertLedger(self.payment, '300', 1, 'partial')
+        
+        payment_transaction.amount = Decimal('1000')
+        payment_transaction.save()
+        self.assertLedger(self.payment, '1000', 1, 'completed')
+    
+    def test_deactivate(self):
+        record_payment(self.payment, '300')
+        record_payment(self.payment, '200')
+        
+        PaymentTransaction.objects.filter(payment=self.payment, amount=Decimal('300')).deactivate()
+        self.assertLedger(self.payment, '200', 1, 'partial')
+        
+        payment_transaction = PaymentTransaction.objects.get(payment=self.payment, is_active=True)
+        payment_transaction.is_active = False
+        payment_transaction.save()
+        self.assertLedger(self.payment, '0', 0, 'pending')
+    
+    def test_delete(self):
+        payment_transaction = record_payment(self.payment, '300')
+        record_payment(self.payment, '200')
+        
+        payment_transaction.delete()
+        self.assertLedger(self.payment, '200', 1, 'partial')
+        
+        PaymentTransaction.objects.filter(payment=self.payment).delete()
+        self.assertLedger(self.payment, '0', 0, 'pending')
+    
+    def test_total_amount_change(self):
+        record_payment(self.payment, '300')
+        self.payment.total_amount = Decimal('300')
+        self.payment.save()
+        self.assertLedger(self.payment, '300', 1, 'completed')
+
+
+class OverpaymentTests(PaymentTestCase):
+    """A payment is never paid beyond its balance"""
+    
+    def test_rejected(self):
+        record_payment(self.payment, '900')
+        with self.assertRaises(PaymentRejected):
+            record_payment(self.payment, '200')
+        self.assertLedger(self.payment, '900', 1, 'partial')
+    
+    def test_exact_balance(self):
+        record_payment(self.payment, '900')
+        record_payment(self.payment, '100')
+        self.assertLedger(self.payment, '1000', 2, 'completed')
+    
+    def test_invalid_amount(self):
+        for amount in ['0', '-5', 'abc', 'NaN']:
+            with self.assertRaises(PaymentRejected):
+                record_payment(self.payment, amount)
+        self.assertLedger(self.payment, '0', 0, 'pending')
+
+
+class BulkPaymentTests(PaymentTestCase):
+    """record_payments records every entry or none"""
+    
+    def setUp(self):
+        super().setUp()
+        self.other_payment = self.make_payment(2)
+    
+    def test_records_all(self):
+        transactions = record_payments([
+            {'payment_id': str(self.payment.pk), 'amount': '400'},
+            {'payment_id': str(self.payment.pk), 'amount': '600', 'payment_method': 'bank_transfer'},
+            {'payment_id': str(self.other_payment.pk), 'amount': '250'},
+        ], processed_by=self.admin)
+        self.assertEqual(len(transactions), 3)
+        self.assertEqual(len({payment_transaction.receipt_number for payment_transaction in transactions}), 3)
+        self.assertLedger(self.payment, '1000', 2, 'completed')
+        self.assertLedger(self.other_payment, '250', 1, 'partial')
+    
+    def test_overpayment_rejects_all(self):
+        # Each entry fits the balance alone; together the second payment's entries overpay it
+        with self.assertRaises(PaymentBatchRejected) as raised:
+            record_payments([
+                {'payment_id': str(self.payment.pk), 'amount': '400'},
+                {'payment_id': str(self.other_payment.pk), 'amount': '600'},
+                {'payment_id': str(self.other_payment.pk), 'amount': '600'},
+            ])
+        self.assertEqual([error['index'] for error in raised.exception.errors], [2])
+        self.assertFalse(PaymentTransaction.objects.exists())
+        self.assertLedger(self.payment, '0', 0, 'pending')
+        self.assertLedger(self.other_payment, '0', 0, 'pending')
+    
+    def test_invalid_entry_rejects_all(self):
+        with self.assertRaises(PaymentBatchRejected) as raised:
+            record_payments([
+                {'payment_id': str(self.payment.pk), 'amount': '400'},
+                {'payment_id': 'not-a-payment', 'amount': '100'},
+                {'payment_id': str(self.other_payment.pk), 'amount': '100', 'payment_method': 'barter'},
+            ])
+        self.assertEqual([error['index'] for error in raised.exception.errors], [1, 2])
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+
+class IdempotencyTests(PaymentTestCase):
+    """Retries of the payment API with an Idempotency-Key"""
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+        self.url = reverse('fees:payment_api')
+    
+    def post(self, data, key):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_replay(self):
+        data = {'payment_id': str(self.payment.pk), 'amount': '300'}
+        first = self.post(data, 'key-1')
+        second = self.post(data, 'key-1')
+        
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json()['receipt_number'], second.json()['receipt_number'])
+        self.assertLedger(self.payment, '300', 1, 'partial')
+    
+    def test_mismatched_body(self):
+        self.post({'payment_id': str(self.payment.pk), 'amount': '300'}, 'key-1')
+        response = self.post({'payment_id': str(self.payment.pk), 'amount': '400'}, 'key-1')
+        
+        self.assertEqual(response.status_code, 422)
+        self.assertLedger(self.payment, '300', 1, 'partial')
+    
+    def test_keys_per_user(self):
+        # Another client picking the same key is a different request, not a replay
+        self.post({'payment_id': str(self.payment.pk), 'amount': '300'}, 'key-1')
+        self.client.force_login(User.objects.create_superuser('cashier', 'cashier@example.com', 'pw'))
+        response = self.post({'payment_id': str(self.payment.pk), 'amount': '300'}, 'key-1')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertLedger(self.payment, '600', 2, 'partial')
+    
+    def test_failed_request_not_stored(self):
+        data = {'payment_id': str(self.payment.pk), 'amount': '5000'}
+        self.assertEqual(self.post(data, 'key-1').status_code, 400)
+        
+        # The overpayment was rejected, so the same key can carry a corrected request
+        response = self.post({'payment_id': str(self.payment.pk), 'amount': '500'}, 'key-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertLedger(self.payment, '500', 1, 'partial')
+    
+    def test_deleted_user_keys_removed(self):
+        cashier = User.objects.create_superuser('cashier', 'cashier@example.com', 'pw')
+        self.client.force_login(cashier)
+        self.post({'payment_id': str(self.payment.pk), 'amount': '300'}, 'key-1')
+        self.client.force_login(User.objects.create_superuser('cashier2', 'cashier2@example.com', 'pw'))
+        self.post({'payment_id': str(self.payment.pk), 'amount': '300'}, 'key-1')
+        
+        # Keys of a deleted user go with them instead of turning into anonymous ones anyone could replay
+        cashier.delete()
+        self.assertEqual(list(IdempotencyKey.objects.values_list('user__username', flat=True)), ['cashier2'])
+
+
+class SweepOverdueTests(PaymentTestCase):
+    """sweep_overdue flags past-due payments and clears them once they catch up"""
+    
+    def setUp(self):
+        super().setUp()
+        self.today = date(2026, 6, 1)
+        for number, due_date, cumulative_amount in [
+            (1, self.today - timedelta(days=10), 500),
+            (2, self.today + timedelta(days=20), 1000),
+        ]:
+            FeeInstallment.objects.create(
+                payment=self.payment, student=self.payment.student, batch=self.batch, currency=self.currency,
+                installment_number=number, due_date=due_date, amount=500, cumulative_amount=cumulative_amount
+            )
+    
+    def test_flag(self):
+        result = sweep_overdue(self.today)
+        self.assertEqual(result['overdue'], 1)
+        self.assertLedger(self.payment, '0', 0, 'overdue')
+        self.assertEqual(FeeInstallment.objects.get(installment_number=1).status, 'overdue')
+        self.assertEqual(FeeInstallment.objects.get(installment_number=2).status, 'pending')
+    
+    def test_clear(self):
+        sweep_overdue(self.today)
+        
+        # Paying off the late installment keeps the flag until the next sweep
+        record_payment(self.payment, '500')
+        self.assertLedger(self.payment, '500', 1, 'overdue')
+        
+        result = sweep_overdue(self.today)
+        self.assertEqual(result['cleared'], 1)
+        self.assertLedger(self.payment, '500', 1, 'partial')
+        self.assertEqual(FeeInstallment.objects.get(installment_number=1).status, 'paid')
+    
+    def test_settled(self):
+        sweep_overdue(self.today)
+        record_payment(self.payment, '1000')
+        self.assertLedger(self.payment, '1000', 1, 'completed')
+
+
+class DailyRevenueTests(PaymentTestCase):
+    """The rollup kept up by writes matches one rebuilt from the transactions"""
+    
+    def rollup(self):
+        return sorted(DailyRevenue.objects.values_list(
+            'date', 'batch_id', 'currency_id', 'payment_method', 'total_amount', 'transaction_count'
+        ))
+    
+    def test_matches_rebuild(self):
+        other_payment = self.make_payment(2)
+        record_payment(self.payment, '100', payment_method='cash')
+        edited = record_payment(self.payment, '200', payment_method='cash')
+        deactivated = record_payment(self.payment, '50', payment_method='bank_transfer')
+        deleted = record_payment(other_payment, '75', payment_method='check')
+        record_payments([
+            {'payment_id': str(self.payment.pk), 'amount': '30', 'payment_method': 'cash'},
+            {'payment_id': str(other_payment.pk), 'amount': '40', 'payment_method': 'bank_transfer'},
+        ])
+        
+        edited.amount = Decimal('250')
+        edited.payment_method = 'credit_card'
+        edited.save()
+        PaymentTransaction.objects.filter(pk=deactivated.pk).deactivate()
+        deleted.delete()
+        
+        kept = self.rollup()
+        self.assertTrue(kept)
+        rebuild_daily_revenue()
+        self.assertEqual(kept, self.rollup())
+    
+    def assertMatchesRebuild(self):
+        kept = self.rollup()
+        rebuild_daily_revenue()
+        self.assertEqual(kept, self.rollup())
+    
+    def test_payment_moved(self):
+        euro = Currency.objects.create(code='EUR', name='Euro', symbol='€', exchange_rate=1)
+        other_batch = Batch.objects.create(name='Batch 58', code='B58', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        record_payment(self.payment, '100')
+        
+        self.payment.batch = other_batch
+        self.payment.currency = euro
+        self.payment.save()
+        self.assertEqual(self.rollup()[0][1:3], (other_batch.pk, euro.pk))
+        self.assertMatchesRebuild()
+    
+    def test_import_changes_currency(self):
+        euro = Currency.objects.create(code='EUR', name='Euro', symbol='€', exchange_rate=1)
+        payments = [self.payment, self.make_payment(2), self.make_payment(3)]
+        for payment in payments:
+            record_payment(payment, '100')
+        # One row with an amount of its own, two sharing one statement
+        frame = pd.DataFrame({
+            'Student ID': [payment.student.student_id for payment in payments],
+            'Total Amount': [1500, 1200, 1200],
+            'Currency ID': ['EUR'] * 3,
+        })
+        import_record = PaymentImport.objects.create(batch=self.batch, file_name='fees.xlsx', imported_by=self.admin)
+        
+        PaymentImporter(import_record, self.admin).run([frame])
+        self.assertEqual({row[2] for row in self.rollup()}, {euro.pk})
+        self.assertMatchesRebuild()
+    
+    def test_cascading_delete(self):
+        other_payment = self.make_payment(2)
+        record_payment(self.payment, '100')
+        record_payment(other_payment, '200')
+        
+        StudentPayment.objects.filter(pk=self.payment.pk).delete()
+        self.assertEqual([row[4] for row in self.rollup()], [Decimal('200')])
+        other_payment.student.delete()
+        self.assertEqual(self.rollup(), [])
+
+
+class AgingReportTests(PaymentTestCase):
+    """Outstanding balances land in the right age bucket as soon as payments are recorded"""
+    
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        for number, due_date, cumulative_amount in [
+            (1, self.today - timedelta(days=45), 500),
+            (2, self.today + timedelta(days=20), 1000),
+        ]:
+            FeeInstallment.objects.create(
+                payment=self.payment, student=self.payment.student, batch=self.batch, currency=self.currency,
+                installment_number=number, due_date=due_date, amount=500, cumulative_amount=cumulative_amount
+            )
+        # No schedule: the whole balance ages from when the payment was opened
+        self.unscheduled = self.make_payment(2)
+    
+    def buckets(self, row):
+        return [row[key] for key in ['students', 'current', 'days_31_60', 'days_61_90', 'days_over_90', 'total_outstanding']]
+    
+    def test_buckets(self):
+        record_payment(self.payment, '300')
+        # Without a sweep refreshing the installments, the payment still counts against the oldest one
+        [row] = ar_aging_rows(self.today)
+        self.assertEqual(self.buckets(row), [2, Decimal('1500'), Decimal('200'), 0, 0, Decimal('1700')])
+    
+    def test_settled_dropped(self):
+        record_payment(self.payment, '1000')
+        record_payment(self.unscheduled, '1000')
+        self.assertEqual(ar_aging_rows(self.today), [])
+    
+    def test_cache_invalidated(self):
+        self.assertEqual(get_ar_aging()['totals'][0]['total_outstanding'], Decimal('2000'))
+        with self.captureOnCommitCallbacks(execute=True):
+            record_payment(self.unscheduled, '400')
+        self.assertEqual(get_ar_aging()['totals'][0]['total_outstanding'], Decimal('1600'))
+
+
+class PaymentSummaryCacheTests(PaymentTestCase):
+    """A cached payment summary is served until something it prints changes"""
+    
+    def test_cached(self):
+        pdf_content = get_payment_summary_pdf(self.payment)
+        self.assertTrue(pdf_content.startswith(b'%PDF'))
+        self.assertEqual(get_payment_summary_pdf(self.payment, render=False), pdf_content)
+    
+    def test_transaction_edit_changes_etag(self):
+        payment_transaction = record_payment(self.payment, '300', notes='First installment')
+        self.payment.refresh_from_db()
+        etag = payment_summary_etag(self.payment)
+        get_payment_summary_pdf(self.payment)
+        
+        # Notes move no money, so the payment row itself is untouched
+        payment_transaction.notes = 'Paid by the guardian'
+        payment_transaction.save()
+        self.payment.refresh_from_db()
+        self.assertNotEqual(payment_summary_etag(self.payment), etag)
+        self.assertIsNone(get_payment_summary_pdf(self.payment, render=False))
+    
+    def test_prefetched_transactions(self):
+        record_payment(self.payment, '300')
+        self.payment.refresh_from_db()
+        transactions = list(self.payment.transactions.order_by('payment_date'))
+        self.assertEqual(payment_summary_etag(self.payment, transactions), payment_summary_etag(self.payment))
+
+
+class WithTotalsTests(PaymentTestCase):
+    """with_totals() annotates each payment's figures in the query that loads it"""
+    
+    def test_annotations(self):
+        record_payment(self.payment, '250')
+        PaymentTransaction.objects.filter(pk=record_payment(self.payment, '100').pk).deactivate()
+        
+        payment = StudentPayment.objects.with_totals().get(pk=self.payment.pk)
+        self.assertEqual(payment.paid_amount, Decimal('250'))
+        self.assertEqual(payment.due_amount, Decimal('750'))
+        self.assertEqual(payment.paid_percentage, 25.0)
+        self.assertEqual((payment.get_total_paid(), payment.get_remaining_amount()), (250.0, 750.0))
+    
+    def test_overview_queries_constant(self):
+        self.client.force_login(self.admin)
+        url = reverse('fees:batch_payment_overview', args=[self.batch.pk])
+        record_payment(self.payment, '100')
+        self.client.get(url)
+        
+        with CaptureQueriesContext(connection) as one_payment:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for number in range(2, 6):
+            record_payment(self.make_payment(number), '100')
+        with CaptureQueriesContext(connection) as five_payments:
+            response = self.client.get(url)
+        self.assertContains(response, 'STU-2026-0005')
+        self.assertEqual(len(five_payments), len(one_payment))
+
+
+class BatchSummaryTests(PaymentTestCase):
+    """Batch totals and status counts come from one grouped query"""
+    
+    def setUp(self):
+        super().setUp()
+        self.empty_batch = Batch.objects.create(name='Batch 58', code='B58', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        record_payment(self.payment, '400')
+        record_payment(self.make_payment(2), '1000')
+        # Rates are read once per cache period, not per summary
+        currency_rates.currencies()
+    
+    def test_summaries(self):
+        with self.assertNumQueries(1):
+            summaries = batch_payment_summaries([str(self.batch.pk), self.empty_batch.pk])
+        
+        summary = summaries[self.batch.pk]
+        self.assertEqual(summary['total_students'], 2)
+        self.assertEqual(
+            (summary['total_amount'], summary['total_paid'], summary['total_remaining']),
+            (Decimal('2000'), Decimal('1400'), Decimal('600'))
+        )
+        self.assertEqual((summary['completed_payments'], summary['partial_payments']), (1, 1))
+        self.assertEqual(summary['completion_percentage'], 70.0)
+        
+        empty = summaries[self.empty_batch.pk]
+        self.assertEqual((empty['total_students'], empty['total_amount'], empty['completion_percentage']), (0, 0, 0))
+    
+    def test_converted_to_reporting_currency(self):
+        taka = Currency.objects.create(code='BDT', name='Taka', symbol='৳', exchange_rate=110)
+        payment = self.make_payment(3, total_amount=11000)
+        payment.currency = taka
+        payment.save()
+        record_payment(payment, '5500')
+        
+        summary = batch_payment_summaries([self.batch.pk])[self.batch.pk]
+        self.assertEqual(summary['currency'], 'USD')
+        self.assertEqual((summary['total_amount'], summary['total_paid']), (Decimal('2100'), Decimal('1450')))
+
+
+class BatchExportTests(PaymentTestCase):
+    """The write-only workbook holds one row per payment"""
+    
+    def read(self, fileobj):
+        fileobj.seek(0)
+        return [list(row) for row in load_workbook(fileobj, read_only=True).active.iter_rows(values_only=True)]
+    
+    def test_rows(self):
+        record_payment(self.payment, '300')
+        record_payment(self.payment, '200')
+        self.make_payment(2)
+        
+        export_file = BytesIO()
+        self.assertEqual(write_batch_payments(self.batch, export_file), 2)
+        header, first, second = self.read(export_file)
+        
+        self.assertEqual(header, BATCH_PAYMENT_COLUMNS)
+        row = dict(zip(header, first))
+        self.assertEqual(row['Student ID'], self.payment.student.student_id)
+        self.assertEqual((row['Total Paid'], row['Remaining Amount'], row['Progress (%)']), (500, 500, 50))
+        self.assertEqual((row['First Installment Amount'], row['Second Installment Amount']), (300, 200))
+        self.assertEqual(dict(zip(header, second))['Total Paid'], 0)
+    
+    def test_progress(self):
+        for number in range(2, 6):
+            self.make_payment(number)
+        progress = mock.Mock()
+        with mock.patch('fees.exports.EXPORT_CHUNK_SIZE', 2):
+            write_batch_payments(self.batch, BytesIO(), progress=progress)
+        self.assertEqual(progress.call_args_list[-1], mock.call(5))
+    
+    def test_table(self):
+        export_file = BytesIO()
+        write_table(['Batch', 'Total'], [['Batch 57', 1000.0]], export_file, 'Aging')
+        self.assertEqual(self.read(export_file), [['Batch', 'Total'], ['Batch 57', 1000]])
+
+
+class PaymentImportTests(PaymentTestCase):
+    """The import applies valid rows in bulk and logs every rejected one"""
+    
+    def test_rows(self):
+        record_payment(self.payment, '300')
+        second, third, fourth = [self.make_payment(number).student.student_id for number in (2, 3, 4)]
+        frame = pd.DataFrame({
+            'Student ID': [self.payment.student.student_id, second, 'STU-2026-9999', third, third, fourth],
+            'Total Amount': [1500, 'abc', 100, 700, 800, 900],
+            'Currency ID': ['', '', '', 'EUR', 'usd', 'GBP'],
+        })
+        import_record = PaymentImport.objects.create(batch=self.batch, file_name='fees.xlsx', imported_by=self.admin)
+        
+        PaymentImporter(import_record, self.admin).run([frame])
+        import_record.refresh_from_db()
+        self.assertEqual(import_record.status, 'completed')
+        self.assertEqual((import_record.total_rows, import_record.successful_imports, import_record.failed_imports), (6, 2, 4))
+        errors = dict(line.split(': ', 1) for line in import_record.error_log.splitlines())
+        self.assertEqual(sorted(errors), ['Row 3', 'Row 4', 'Row 5', 'Row 7'])
+        self.assertIn('Invalid total amount', errors['Row 3'])
+        self.assertIn('not found', errors['Row 4'])
+        self.assertIn('appears again', errors['Row 5'])
+        self.assertIn('Currency not found', errors['Row 7'])
+        
+        # An existing balance keeps its payments against the new total
+        self.assertLedger(self.payment, '300', 1, 'partial')
+        self.assertEqual(self.payment.total_amount, Decimal('1500'))
+        self.assertEqual(StudentPayment.objects.get(student__student_id=third).total_amount, Decimal('800'))
+        self.assertEqual(StudentPayment.objects.get(student__student_id=second).total_amount, Decimal('1000'))
+
+
+class ReceiptNumberTests(TransactionTestCase):
+    """Receipt numbers stay unique when several threads take them at once"""
+    
+    def test_concurrent(self):
+        allocator = SequenceAllocator('TST', width=6, block_size=10)
+        taken = []
+        
+        def allocate():
+            try:
+                for _ in range(5):
+                    taken.extend(allocator.allocate(5))
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        year = timezone.localdate().year
+        self.assertEqual(sorted(taken), [f'TST-{year}-{number:06d}' for number in range(1, 101)])
+    
+    def test_rolled_back_number_reused(self):
+        # One at a time, a number is reserved in the caller's transaction and goes back if it rolls back
+        allocator = SequenceAllocator('TST', width=6)
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                first = allocator.allocate()
+                raise ValueError
+        self.assertEqual(allocator.allocate(), first)
+    
+    def test_per_year(self):
+        allocator = SequenceAllocator('TST', width=6, block_size=10)
+        self.assertEqual(allocator.allocate(2, year=2025), ['TST-2025-000001', 'TST-2025-000002'])
+        self.assertEqual(allocator.allocate(1, year=2026), ['TST-2026-000001'])
+        # Whatever a process held in memory, a new one continues after its block
+        self.assertEqual(SequenceAllocator('TST', width=6).allocate(1, year=2025), ['TST-2025-000011'])
+    
+    def test_assign_keeps_existing(self):
+        transactions = assign_receipt_numbers([
+            PaymentTransaction(receipt_number='RCP-2025-000042'), PaymentTransaction(), PaymentTransaction()
+        ])
+        numbers = [payment_transaction.receipt_number for payment_transaction in transactions]
+        self.assertEqual(numbers[0], 'RCP-2025-000042')
+        self.assertEqual(len(set(numbers)), 3)
+        self.assertTrue(all(number.startswith(f'RCP-{timezone.localdate().year}-') for number in numbers[1:]))
+
+
+class ReconciliationTests(PaymentTestCase):
+    """Statement lines find their bank transfers by reference first, then by amount and date"""
+    
+    COLUMNS = ['Date', 'Amount', 'Reference', 'Description']
+    
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.payments = [self.payment] + [self.make_payment(number) for number in (2, 3, 4, 5)]
+        self.transfers = [
+            record_payment(payment, amount, payment_method='bank_transfer')
+            for payment, amount in zip(self.payments, ['300', '250', '400', '500', '500'])
+        ]
+        # Cash is never on a bank statement
+        record_payment(self.payment, '400', payment_method='cash')
+    
+    def reconcile(self, *rows):
+        statement = BankStatement.objects.create(file_name='statement.csv', uploaded_by=self.admin)
+        StatementReconciler(statement).run(
+            [dict(zip(self.COLUMNS, row)) for row in rows], self.COLUMNS
+        )
+        return statement, list(statement.lines.values_list('status', 'match_method', 'transaction_id', 'exception_reason'))
+    
+    def test_matching(self):
+        receipt = self.transfers[0].receipt_number
+        student_id = self.payments[3].student.student_id
+        # A digit dropped while typing the student ID
+        typo = student_id[:-2] + student_id[-1]
+        
+        statement, lines = self.reconcile(
+            (self.today, '999.00', receipt, ''),
+            (self.today.strftime('%d/%m/%Y'), '300.00', '', f'Transfer {receipt.lower()[:6]} {receipt[6:]}'),
+            (self.today, '250', '', f'Fees {self.payments[1].student.student_id}'),
+            (self.today - timedelta(days=2), '400', '', 'School fees'),
+            (self.today, '500', '', f'Fees {typo}'),
+            (self.today, '(120.00)', 'Bank charges', ''),
+            ('yesterday', '100', '', ''),
+        )
+        self.assertEqual([line[:3] for line in lines[1:6]], [
+            ('matched', 'receipt', self.transfers[0].pk),
+            ('matched', 'student', self.transfers[1].pk),
+            ('matched', 'amount_date', self.transfers[2].pk),
+            ('matched', 'fuzzy', self.transfers[3].pk),
+            ('ignored', '', None),
+        ])
+        self.assertEqual(lines[0][0], 'exception')
+        self.assertIn('was recorded for 300', lines[0][3])
+        self.assertEqual(lines[6][::3], ('exception', 'Unreadable date or amount.'))
+        self.assertEqual(
+            (statement.status, statement.total_lines, statement.matched_lines, statement.exception_lines, statement.ignored_lines),
+            ('completed', 7, 4, 2, 1)
+        )
+    
+    def test_ambiguous_and_reconciled(self):
+        _, lines = self.reconcile(
+            (self.today, '500', '', 'School fees'),
+            (self.today + timedelta(days=5), '250', '', ''),
+        )
+        self.assertEqual([line[0] for line in lines], ['exception', 'exception'])
+        self.assertIn('2 bank transfers of 500', lines[0][3])
+        self.assertIn('within 3 days', lines[1][3])
+        
+        # A transfer matched on one statement is not offered to the next
+        self.reconcile((self.today, '250', '', ''))
+        _, lines = self.reconcile((self.today, '250', '', ''))
+        self.assertEqual(lines[0][0], 'exception')
+
+
+class IntegrityTests(PaymentTestCase):
+    """Drifted stored balances are found and rewritten from the transactions"""
+    
+    def setUp(self):
+        super().setUp()
+        self.other_payment = self.make_payment(2)
+        record_payment(self.payment, '300')
+        record_payment(self.other_payment, '1000')
+        # Writes that bypassed the ledger, e.g. a manual fix in the database shell
+        StudentPayment.objects.filter(pk=self.payment.pk).update(total_paid=0, remaining_amount=1000, status='pending')
+        StudentPayment.objects.filter(pk=self.other_payment.pk).update(transaction_count=3)
+    
+    def test_check(self):
+        drift = payment_drift()
+        self.assertEqual(drift['drifted'], 2)
+        row = drift['sample'][0]
+        self.assertEqual(row['student_id'], self.payment.student.student_id)
+        self.assertEqual((row['stored_total_paid'], row['total_paid']), (Decimal('0'), Decimal('300')))
+        self.assertEqual((row['stored_status'], row['status']), ('pending', 'partial'))
+        self.assertEqual(payment_drift(batch_id=Batch.objects.create(name='Batch 58', code='B58').pk)['drifted'], 0)
+    
+    def test_recompute(self):
+        self.assertEqual(recompute_payments(), 2)
+        self.assertLedger(self.payment, '300', 1, 'partial')
+        self.assertLedger(self.other_payment, '1000', 1, 'completed')
+        self.assertEqual(recompute_payments(), 0)
+    
+    def test_keeps_overdue(self):
+        StudentPayment.objects.filter(pk=self.payment.pk).update(status='overdue')
+        recompute_payments()
+        self.assertLedger(self.payment, '300', 1, 'overdue')
+    
+    def test_in_chunks(self):
+        self.make_payment(3)
+        self.assertEqual(run_in_chunks(check=True, chunk_size=1)['drifted'], 2)
+        self.assertEqual(run_in_chunks(chunk_size=1), 2)
+        self.assertEqual(payment_drift()['drifted'], 0)
+
+
+class BulkDocumentTests(PaymentTestCase):
+    """A batch's receipts or summaries come out as one PDF or a ZIP of them"""
+    
+    def setUp(self):
+        super().setUp()
+        self.other_payment = self.make_payment(2)
+        self.transactions = [
+            record_payment(self.payment, '300'), record_payment(self.payment, '200'), record_payment(self.other_payment, '100')
+        ]
+    
+    def test_merged_pdf(self):
+        merged = BytesIO()
+        progress = mock.Mock()
+        self.assertEqual(write_bulk_documents('receipts', 'pdf', merged, batch=self.batch, workers=1, progress=progress), 3)
+        progress.assert_called_with(3, 3)
+        
+        # Every receipt starts on a page of its own, and was rendered through the cache
+        receipts = [
+            get_receipt_pdf(payment_transaction, render=False)
+            for payment_transaction in PaymentTransaction.objects.filter(pk__in=[recorded.pk for recorded in self.transactions])
+        ]
+        self.assertNotIn(None, receipts)
+        pages = sum(len(PdfReader(BytesIO(receipt)).pages) for receipt in receipts)
+        self.assertEqual(len(PdfReader(merged).pages), pages)
+    
+    def test_zip(self):
+        archive = BytesIO()
+        self.assertEqual(write_bulk_documents('summaries', 'zip', archive, batch=self.batch, workers=1), 2)
+        names = zipfile.ZipFile(archive).namelist()
+        self.assertEqual(names, [
+            f'payment_summary_{payment.student.student_id}.pdf' for payment in (self.payment, self.other_payment)
+        ])
+    
+    def test_nothing_to_write(self):
+        merged = BytesIO()
+        self.assertEqual(write_bulk_documents('receipts', 'pdf', merged, batch=Batch.objects.create(name='Batch 58', code='B58'), workers=1), 0)
+        self.assertEqual(merged.getvalue(), b'')
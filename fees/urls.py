@@ -12,8 +12,18 @@ urlpatterns = [
     path('payment/<uuid:payment_id>/add-transaction/', views.add_payment_transaction, name='add_payment_transaction'),
     path('payment/<uuid:payment_id>/print-summary/', views.generate_payment_summary_pdf, name='print_payment_summary'),
     path('transaction/<uuid:transaction_id>/print-receipt/', views.generate_receipt_pdf, name='print_receipt'),
+    path('installments/', views.installment_list, name='installment_list'),
+    path('installments/<uuid:installment_id>/', views.installment_detail, name='installment_detail'),
     path('excel-import/', views.excel_import, name='excel_import'),
+    path('import/<uuid:import_id>/progress/', views.import_progress, name='import_progress'),
     path('download-template/', views.download_template, name='download_template'),
     path('export-batch/', views.export_batch_payments, name='export_batch_payments'),
+    path('reports/aging/', views.aging_report, name='aging_report'),
+    path('reports/aging/export/', views.export_aging_report, name='export_aging_report'),
+    path('reconciliation/', views.bank_reconciliation, name='bank_reconciliation'),
+    path('reconciliation/<uuid:statement_id>/', views.statement_detail, name='statement_detail'),
+    path('bulk-documents/', views.bulk_documents, name='bulk_documents'),
     path('api/payment/', views.PaymentAPI.as_view(), name='payment_api'),
+    path('api/batch-summary/', views.batch_summary_api, name='batch_summary_api'),
+    path('api/revenue-series/', views.revenue_series_api, name='revenue_series_api'),
 ]
\ No newline at end of file
@@ -2,33 +2,46 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Sum, Count
+from django.db.models import Sum, Count
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.dateparse import parse_date
+from django.core.exceptions import ValidationError
+from datetime import timedelta
 import pandas as pd
 import json
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from io import BytesIO
+import csv
+from decimal import Decimal
 
-from .models import StudentPayment, PaymentTransaction, PaymentImport
-from students.models import Student
+from .models import StudentPayment, PaymentTransaction, PaymentImport, FeeInstallment, BankStatement, BankStatementLine
+from .services import payment_summary, batch_payment_summary, batch_payment_summaries
+from .services import record_payment, record_payments, PaymentRejected, PaymentBatchRejected
+from .imports import REQUIRED_COLUMNS
+from .exports import write_table
+from .reports import AGING_BUCKETS, get_ar_aging, ar_aging_table
+from .rollups import MAX_SERIES_POINTS, revenue_series
+from .reconciliation import REQUIRED_COLUMNS as STATEMENT_COLUMNS, REFERENCE_COLUMNS
+from .bulk_documents import DOCUMENT_KINDS, OUTPUT_FORMATS
+from .pdf import receipt_etag, payment_summary_etag, get_receipt_pdf, get_payment_summary_pdf
+from students.search import search
 from batches.models import Batch
 from core.models import Currency
+from core.currency import currency_rates
+from core.jobs import enqueue
+from core.idempotency import idempotent_json_response
+from core.uploads import UploadReader, UploadFormatError
+from core.pagination import CursorPaginator
 
 @login_required
 def payment_dashboard(request):
     """Simple payment dashboard"""
     # Get payment records
-    payments = StudentPayment.objects.filter(is_active=True).select_related(
+    payments = StudentPayment.objects.filter(is_active=True).with_totals().select_related(
         'student', 'student__user', 'batch', 'currency'
     ).order_by('-created_at')
     
@@ -45,22 +58,14 @@ def payment_dashboard(request):
     # Search functionality
     search_query = request.GET.get('search', '')
     if search_query:
-        payments = payments.filter(
-            Q(student__user__first_name__icontains=search_query) |
-            Q(student__user__last_name__icontains=search_query) |
-            Q(student__student_id__icontains=search_query)
-        )
+        payments = search(payments, search_query, field='student_id')
     
     # Pagination
-    paginator = Paginator(payments, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(payments, 20, approximate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Statistics
-    total_payments = StudentPayment.objects.filter(is_active=True).count()
-    completed_payments = StudentPayment.objects.filter(is_active=True, status='completed').count()
-    partial_payments = StudentPayment.objects.filter(is_active=True, status='partial').count()
-    pending_payments = StudentPayment.objects.filter(is_active=True, status='pending').count()
+    summary = payment_summary()
     
     # Get selected batch for display
     selected_batch = None
@@ -78,10 +83,10 @@ def payment_dashboard(request):
         'batch_filter': batch_filter,
         'status_filter': status_filter,
         'selected_batch': selected_batch,
-        'total_payments': total_payments,
-        'completed_payments': completed_payments,
-        'partial_payments': partial_payments,
-        'pending_payments': pending_payments,
+        'total_payments': summary['total_students'],
+        'completed_payments': summary['completed_payments'],
+        'partial_payments': summary['partial_payments'],
+        'pending_payments': summary['pending_payments'],
     }
     
     return render(request, 'fees/payment_dashboard.html', context)
@@ -95,31 +100,17 @@ def batch_payment_overview(request, batch_id):
     payments = StudentPayment.objects.filter(
         batch=batch, 
         is_active=True
-    ).select_related('student', 'student__user', 'currency').order_by('student__student_id')
-    
-    # Calculate batch statistics
-    total_students = payments.count()
-    completed_payments = payments.filter(status='completed').count()
-    partial_payments = payments.filter(status='partial').count()
-    pending_payments = payments.filter(status='pending').count()
+    ).with_totals().select_related('student', 'student__user', 'currency').order_by('student__student_id')
     
-    # Calculate total amounts
-    total_amount = sum(payment.total_amount for payment in payments)
-    total_paid = sum(payment.get_total_paid() for payment in payments)
-    total_remaining = total_amount - total_paid
+    # Calculate batch statistics and totals in a single grouped query
+    summary = batch_payment_summary(batch.id)
     
     context = {
         'title': f'Payment Overview - {batch.name}',
         'batch': batch,
         'payments': payments,
-        'total_students': total_students,
-        'completed_payments': completed_payments,
-        'partial_payments': partial_payments,
-        'pending_payments': pending_payments,
-        'total_amount': total_amount,
-        'total_paid': total_paid,
-        'total_remaining': total_remaining,
-        'completion_percentage': (total_paid / total_amount * 100) if total_amount > 0 else 0,
+        'reporting_currency': currency_rates.reporting_currency(),
+        **summary,
     }
     
     return render(request, 'fees/batch_payment_overview.html', context)
@@ -140,6 +131,49 @@ def payment_detail(request, payment_id):
     
     return render(request, 'fees/payment_detail.html', context)
 
+@login_required
+def installment_list(request):
+    """Installment schedule across batches, filterable by batch and status"""
+    installments = FeeInstallment.objects.filter(is_active=True).select_related(
+        'student', 'student__user', 'currency'
+    )
+    
+    batch_filter = request.GET.get('batch', '')
+    if batch_filter:
+        installments = installments.filter(batch_id=batch_filter)
+    
+    status_filter = request.GET.get('status', '')
+    if status_filter:
+        installments = installments.filter(status=status_filter)
+    
+    paginator = Paginator(installments, 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    context = {
+        'title': 'Fee Installments',
+        'page_obj': page_obj,
+        'batch_filter': batch_filter,
+        'status_filter': status_filter,
+    }
+    
+    return render(request, 'fees/installment_list.html', context)
+
+@login_required
+def installment_detail(request, installment_id):
+    """Detailed view of one installment"""
+    installment = get_object_or_404(
+        FeeInstallment.objects.select_related('student', 'student__user', 'currency'),
+        id=installment_id,
+        is_active=True
+    )
+    
+    context = {
+        'title': f'Installment {installment.installment_number} - {installment.student.get_full_name()}',
+        'installment': installment,
+    }
+    
+    return render(request, 'fees/installment_detail.html', context)
+
 @login_required
 def edit_payment(request, payment_id):
     """Edit payment record"""
@@ -185,7 +219,7 @@ def delete_payment(request, payment_id):
             payment.save()
             
             # Also deactivate all related transactions
-            payment.transactions.update(is_active=False)
+            payment.transactions.deactivate()
             
             messages.success(request, f'Payment record for {student_name} deleted successfully!')
             return redirect('fees:payment_dashboard')
@@ -208,32 +242,19 @@ def add_payment_transaction(request, payment_id):
         notes = request.POST.get('notes', '')
         
         try:
-            amount = float(amount)
-            if amount <= 0:
-                messages.error(request, 'Payment amount must be greater than 0.')
-                return redirect('fees:payment_detail', payment_id=payment.id)
-            
-            # Check if payment exceeds remaining amount
-            remaining = payment.get_remaining_amount()
-            # Use a small tolerance for floating point comparison
-            tolerance = 0.01
-            if amount > remaining + tolerance:
-                messages.error(request, f'Payment amount cannot exceed remaining amount of {remaining:.2f}.')
-                return redirect('fees:payment_detail', payment_id=payment.id)
-            
-            # Create transaction
-            transaction = PaymentTransaction.objects.create(
-                payment=payment,
-                amount=amount,
+            # Balance check, insert and status update happen under one row lock
+            transaction = record_payment(
+                payment,
+                amount,
                 payment_method=payment_method,
                 notes=notes,
                 processed_by=request.user  # Use User directly, not profile
             )
             
-            messages.success(request, f'Payment of {amount} recorded successfully!')
+            messages.success(request, f'Payment of {transaction.amount} recorded successfully!')
             
-        except ValueError:
-            messages.error(request, 'Invalid payment amount.')
+        except PaymentRejected as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f'Error recording payment: {str(e)}')
     
@@ -253,89 +274,125 @@ def excel_import(request):
             
             batch = get_object_or_404(Batch, id=batch_id)
             
-            # Read Excel file
-            df = pd.read_excel(excel_file)
-            
-            # Validate required columns
-            required_columns = ['Student ID', 'Total Amount']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            
-            if missing_columns:
-                messages.error(request, f'Missing required columns: {", ".join(missing_columns)}')
+            # Check the header row now so a wrong file is rejected straight away
+            try:
+                UploadReader(excel_file, excel_file.name, REQUIRED_COLUMNS).close()
+            except UploadFormatError as e:
+                messages.error(request, str(e))
                 return redirect('fees:payment_dashboard')
+            excel_file.seek(0)
             
-            # Create import record
+            # Create import record; the worker fills in the row counts as it goes
             import_record = PaymentImport.objects.create(
                 batch=batch,
                 file_name=excel_file.name,
-                imported_by=request.user.profile if hasattr(request.user, 'profile') else None,
-                total_rows=len(df),
+                imported_by=request.user,
                 status='processing'
             )
             
-            successful_imports = 0
-            failed_imports = 0
-            error_log = []
-            
-            # Process each row
-            for index, row in df.iterrows():
-                try:
-                    student_id = str(row['Student ID']).strip()
-                    total_amount = float(row['Total Amount'])
-                    
-                    # Get student
-                    student = Student.objects.get(student_id=student_id, is_active=True)
-                    
-                    # Get currency
-                    currency_id = row.get('Currency ID', 1)
-                    currency = Currency.objects.get(id=currency_id)
-                    
-                    # Create or update payment
-                    payment, created = StudentPayment.objects.get_or_create(
-                        student=student,
-                        batch=batch,
-                        defaults={
-                            'total_amount': total_amount,
-                            'currency': currency,
-                            'created_by': request.user.profile if hasattr(request.user, 'profile') else None,
-                            'notes': f'Imported from {excel_file.name}'
-                        }
-                    )
-                    
-                    if not created:
-                        # Update existing payment
-                        payment.total_amount = total_amount
-                        payment.currency = currency
-                        payment.created_by = request.user.profile if hasattr(request.user, 'profile') else None
-                        payment.notes = f'Imported from {excel_file.name}'
-                        payment.save()
-                    
-                    successful_imports += 1
-                    
-                except Student.DoesNotExist:
-                    error_log.append(f"Row {index + 2}: Student ID '{student_id}' not found")
-                    failed_imports += 1
-                except Exception as e:
-                    error_log.append(f"Row {index + 2}: {str(e)}")
-                    failed_imports += 1
-            
-            # Update import record
-            import_record.successful_imports = successful_imports
-            import_record.failed_imports = failed_imports
-            import_record.status = 'completed' if failed_imports == 0 else 'completed'
-            import_record.error_log = '\n'.join(error_log)
-            import_record.save()
+            job = enqueue(
+                'fees.import_payments',
+                {'import_id': str(import_record.id)},
+                user=request.user,
+                label=f'Import {excel_file.name} into {batch.name}',
+                input_file=excel_file
+            )
             
-            if successful_imports > 0:
-                messages.success(request, f'Successfully imported {successful_imports} payments for {batch.name}.')
-            if failed_imports > 0:
-                messages.warning(request, f'{failed_imports} payments failed to import. Check the error log.')
+            messages.info(request, f'Import of {excel_file.name} has been queued. Progress is shown below.')
+            return redirect('core:job_status', job_id=job.id)
             
         except Exception as e:
             messages.error(request, f'Error importing Excel file: {str(e)}')
     
     return redirect('fees:payment_dashboard')
 
+@login_required
+def bank_reconciliation(request):
+    """Upload a bank statement for reconciliation and list earlier ones"""
+    if request.method == 'POST':
+        statement_file = request.FILES.get('statement_file')
+        if not statement_file:
+            messages.error(request, 'Please upload a bank statement (CSV or Excel).')
+            return redirect('fees:bank_reconciliation')
+        
+        # Check the header row now so a wrong file is rejected straight away
+        try:
+            UploadReader(statement_file, statement_file.name, STATEMENT_COLUMNS).close()
+        except UploadFormatError as e:
+            messages.error(request, str(e))
+            return redirect('fees:bank_reconciliation')
+        statement_file.seek(0)
+        
+        statement = BankStatement.objects.create(
+            file_name=statement_file.name,
+            uploaded_by=request.user
+        )
+        job = enqueue(
+            'fees.reconcile_statement',
+            {'statement_id': str(statement.id)},
+            user=request.user,
+            label=f'Reconcile {statement_file.name}',
+            input_file=statement_file
+        )
+        
+        messages.info(request, f'Reconciliation of {statement_file.name} has been queued.')
+        return redirect('core:job_status', job_id=job.id)
+    
+    statements = BankStatement.objects.filter(is_active=True).select_related('uploaded_by')
+    paginator = Paginator(statements, 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    context = {
+        'title': 'Bank Reconciliation',
+        'page_obj': page_obj,
+        'required_columns': STATEMENT_COLUMNS,
+        'reference_columns': REFERENCE_COLUMNS,
+    }
+    
+    return render(request, 'fees/bank_reconciliation.html', context)
+
+@login_required
+def statement_detail(request, statement_id):
+    """Matched lines and exceptions of one reconciled statement"""
+    statement = get_object_or_404(BankStatement, id=statement_id, is_active=True)
+    
+    lines = statement.lines.select_related(
+        'transaction', 'transaction__payment__student', 'transaction__payment__student__user'
+    )
+    status_filter = request.GET.get('status', '')
+    if status_filter:
+        lines = lines.filter(status=status_filter)
+    
+    paginator = Paginator(lines, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    context = {
+        'title': f'Statement {statement.file_name}',
+        'statement': statement,
+        'page_obj': page_obj,
+        'status_filter': status_filter,
+        'status_choices': BankStatementLine.STATUS_CHOICES,
+    }
+    
+    return render(request, 'fees/statement_detail.html', context)
+
+@login_required
+def import_progress(request, import_id):
+    """Poll the row counts of a payment import"""
+    import_record = get_object_or_404(PaymentImport, id=import_id)
+    
+    return JsonResponse({
+        'id': str(import_record.id),
+        'status': import_record.status,
+        'file_name': import_record.file_name,
+        'total_rows': import_record.total_rows,
+        'successful_imports': import_record.successful_imports,
+        'failed_imports': import_record.failed_imports,
+        'processed_rows': import_record.successful_imports + import_record.failed_imports,
+        'success_rate': round(import_record.get_success_rate(), 1),
+        'error_log': import_record.error_log if import_record.status != 'processing' else '',
+    })
+
 @login_required
 def download_template(request):
     """Download Excel template for payment import"""
@@ -343,7 +400,7 @@ def download_template(request):
     template_data = {
         'Student ID': ['STU-2025-0001', 'STU-2025-0002'],
         'Total Amount': [50000, 75000],
-        'Currency ID': [2, 2],  # BDT
+        'Currency ID': ['BDT', 'BDT'],  # Currency code (or ID); blank uses the default currency
         'Notes': ['Payment for student', 'Payment for student']
     }
     
@@ -368,104 +425,20 @@ def export_batch_payments(request):
     try:
         batch = Batch.objects.get(id=batch_id, is_active=True)
         
-        # Get all payments for this batch
-        payments = StudentPayment.objects.filter(
-            batch=batch, 
-            is_active=True
-        ).select_related('student', 'student__user', 'currency').order_by('student__student_id')
-        
-        if not payments.exists():
+        if not StudentPayment.objects.filter(batch=batch, is_active=True).exists():
             messages.warning(request, f'No payment records found for {batch.name}.')
             return redirect('fees:payment_dashboard')
         
-        # Prepare data for Excel
-        excel_data = []
-        
-        for payment in payments:
-            student = payment.student
-            user = student.user
-            
-            # Get transactions ordered by date
-            transactions = payment.transactions.filter(is_active=True).order_by('payment_date')
-            
-            # First installment
-            first_transaction = transactions.first() if transactions.exists() else None
-            first_amount = first_transaction.amount if first_transaction else 0
-            first_date = first_transaction.payment_date.date() if first_transaction else None
-            
-            # Second installment
-            second_transaction = transactions[1] if len(transactions) > 1 else None
-            second_amount = second_transaction.amount if second_transaction else 0
-            second_date = second_transaction.payment_date.date() if second_transaction else None
-            
-            # Calculate remaining installments
-            remaining_amount = payment.get_remaining_amount()
-            total_paid = payment.get_total_paid()
-            
-            excel_data.append({
-                'Student ID': student.student_id,
-                'Student Name': user.get_full_name(),
-                'Email': user.email if user.email else '',
-                'Phone': student.phone if student.phone else '',
-                'Batch': batch.name,
-                'Total Amount': float(payment.total_amount),
-                'Currency': payment.currency.code,
-                'Payment Method': payment.get_payment_method_display(),
-                'Status': payment.get_status_display(),
-                'First Installment Amount': float(first_amount),
-                'First Installment Date': first_date.strftime('%Y-%m-%d') if first_date else '',
-                'Second Installment Amount': float(second_amount),
-                'Second Installment Date': second_date.strftime('%Y-%m-%d') if second_date else '',
-                'Total Paid': float(total_paid),
-                'Remaining Amount': float(remaining_amount),
-                'Progress (%)': round(payment.get_completion_percentage(), 2),
-                'Notes': payment.notes if payment.notes else '',
-                'Created Date': payment.created_at.strftime('%Y-%m-%d'),
-            })
-        
-        # Create DataFrame
-        df = pd.DataFrame(excel_data)
-        
-        # Create response
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        filename = f'batch_payments_{batch.name.replace(" ", "_")}_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        # Write to Excel with formatting
-        with pd.ExcelWriter(response, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Batch Payments', index=False)
-            
-            # Get the workbook and worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['Batch Payments']
-            
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-            
-            # Add header formatting
-            from openpyxl.styles import Font, PatternFill, Alignment
-            
-            header_font = Font(bold=True, color='FFFFFF')
-            header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-            header_alignment = Alignment(horizontal='center', vertical='center')
-            
-            for cell in worksheet[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
+        # The workbook is written by a worker and kept on the job for download
+        job = enqueue(
+            'fees.export_batch_payments',
+            {'batch_id': str(batch.id)},
+            user=request.user,
+            label=f'Export payments for {batch.name}'
+        )
         
-        messages.success(request, f'Successfully exported {len(excel_data)} payment records for {batch.name}.')
-        return response
+        messages.info(request, f'Export for {batch.name} has been queued.')
+        return redirect('core:job_status', job_id=job.id)
         
     except Batch.DoesNotExist:
         messages.error(request, 'Selected batch not found.')
@@ -474,350 +447,256 @@ def export_batch_payments(request):
         messages.error(request, f'Error exporting data: {str(e)}')
         return redirect('fees:payment_dashboard')
 
+@login_required
+def aging_report(request):
+    """Outstanding balances per batch and currency, bucketed by age"""
+    report = get_ar_aging()
+    
+    context = {
+        'title': 'Accounts Receivable Aging',
+        'buckets': AGING_BUCKETS,
+        **report,
+    }
+    
+    return render(request, 'fees/aging_report.html', context)
+
+@login_required
+def export_aging_report(request):
+    """Download the aging report as Excel or CSV"""
+    export_format = request.GET.get('format', 'xlsx')
+    report = get_ar_aging()
+    columns, rows = ar_aging_table(report)
+    filename = f'ar_aging_{report["as_of"].strftime("%Y%m%d")}'
+    
+    if export_format == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        return response
+    
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+    write_table(columns, rows, response, 'AR Aging')
+    return response
+
+@login_required
+def batch_summary_api(request):
+    """Compare the payment summaries of several batches"""
+    batch_ids = request.GET.getlist('batch')
+    if not batch_ids:
+        return JsonResponse({'error': 'Please select at least one batch.'}, status=400)
+    
+    try:
+        summaries = batch_payment_summaries(batch_ids)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    batch_names = dict(Batch.objects.filter(id__in=summaries.keys()).values_list('id', 'name'))
+    
+    return JsonResponse({
+        'batches': [
+            {
+                'batch_id': str(batch_id),
+                'batch_name': batch_names.get(batch_id),
+                **{key: float(value) if isinstance(value, Decimal) else value for key, value in summary.items()},
+            }
+            for batch_id, summary in summaries.items()
+        ]
+    })
+
+@login_required
+def revenue_series_api(request):
+    """Collections over time for the dashboard charts, read from the daily revenue rollup"""
+    try:
+        date_from = parse_date(request.GET['from']) if request.GET.get('from') else None
+        date_to = parse_date(request.GET['to']) if request.GET.get('to') else None
+        max_points = int(request.GET.get('points', MAX_SERIES_POINTS))
+        result = revenue_series(
+            granularity=request.GET.get('granularity', 'day'),
+            date_from=date_from,
+            date_to=date_to,
+            batch_id=request.GET.get('batch') or None,
+            currency_code=request.GET.get('currency') or None,
+            payment_method=request.GET.get('method') or None,
+            max_points=max(max_points, 1)
+        )
+    except (ValueError, ValidationError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'granularity': result['granularity'],
+        'from': result['date_from'].isoformat(),
+        'to': result['date_to'].isoformat(),
+        'series': [
+            {
+                'currency': series['currency'],
+                'points': [
+                    {'period': point['period'].isoformat(), 'amount': float(point['amount']), 'count': point['count']}
+                    for point in series['points']
+                ],
+            }
+            for series in result['series']
+        ]
+    })
+
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentAPI(View):
     """API for payment operations"""
     
     def post(self, request):
-        """Create payment transaction via API"""
+        """Create one payment transaction, or many from {"transactions": [...]}, via API"""
         try:
             data = json.loads(request.body)
             
-            payment_id = data.get('payment_id')
-            amount = float(data.get('amount'))
-            payment_method = data.get('payment_method', 'cash')
-            notes = data.get('notes', '')
-            
-            payment = StudentPayment.objects.get(id=payment_id)
-            
-            # Check if payment exceeds remaining amount
-            remaining = payment.get_remaining_amount()
-            # Use a small tolerance for floating point comparison
-            tolerance = 0.01
-            if amount > remaining + tolerance:
-                return JsonResponse({'error': f'Payment amount cannot exceed remaining amount of {remaining:.2f}'}, status=400)
-            
-            # Create transaction
-            transaction = PaymentTransaction.objects.create(
-                payment=payment,
-                amount=amount,
-                payment_method=payment_method,
-                notes=notes,
-                processed_by=request.user  # Use User directly, not profile
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'transaction_id': transaction.id,
-                'receipt_number': transaction.receipt_number,
-                'remaining_amount': payment.get_remaining_amount()
-            })
+            # Retries carrying the same Idempotency-Key get the first response back
+            if isinstance(data, list) or (isinstance(data, dict) and 'transactions' in data):
+                entries = data if isinstance(data, list) else data['transactions']
+                if not isinstance(entries, list):
+                    return JsonResponse({'error': 'transactions must be a list'}, status=400)
+                return idempotent_json_response(request, lambda: self.record_many(entries, request.user))
+            return idempotent_json_response(request, lambda: self.record_one(data, request.user))
             
+        except PaymentBatchRejected as e:
+            return JsonResponse({'error': str(e), 'errors': e.errors}, status=400)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
+    
+    def record_one(self, data, user):
+        transaction = record_payment(
+            data.get('payment_id'),
+            data.get('amount'),
+            payment_method=data.get('payment_method', 'cash'),
+            notes=data.get('notes', ''),
+            processed_by=user  # Use User directly, not profile
+        )
+        payment = transaction.payment
+        
+        return {
+            'success': True,
+            'transaction_id': transaction.id,
+            'receipt_number': transaction.receipt_number,
+            'remaining_amount': payment.get_remaining_amount()
+        }
+    
+    def record_many(self, entries, user):
+        transactions = record_payments(entries, processed_by=user)
+        
+        payments = {transaction.payment_id: transaction.payment for transaction in transactions}
+        return {
+            'success': True,
+            'transactions': [
+                {
+                    'transaction_id': transaction.id,
+                    'payment_id': transaction.payment_id,
+                    'receipt_number': transaction.receipt_number,
+                }
+                for transaction in transactions
+            ],
+            'payments': [
+                {
+                    'payment_id': payment.id,
+                    'status': payment.status,
+                    'remaining_amount': payment.get_remaining_amount(),
+                }
+                for payment in payments.values()
+            ],
+        }
 
 @login_required
-def generate_receipt_pdf(request, transaction_id):
-    """Generate PDF receipt for a payment transaction"""
-    transaction = get_object_or_404(PaymentTransaction, id=transaction_id)
-    payment = transaction.payment
-    student = payment.student
-    
-    # Create PDF buffer
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
+def bulk_documents(request):
+    """Queue receipts or payment summaries for a whole batch and/or date range"""
+    kind = request.GET.get('kind', 'receipts')
+    output_format = request.GET.get('format', 'pdf')
+    batch_id = request.GET.get('batch')
     
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=6,
-        alignment=TA_LEFT
-    )
+    if kind not in dict(DOCUMENT_KINDS) or output_format not in dict(OUTPUT_FORMATS):
+        messages.error(request, 'Please choose receipts or summaries, as a PDF or a ZIP.')
+        return redirect('fees:payment_dashboard')
     
-    # Build PDF content
-    story = []
+    try:
+        date_from = parse_date(request.GET.get('date_from') or '')
+        date_to = parse_date(request.GET.get('date_to') or '')
+    except ValueError:
+        messages.error(request, 'Please enter valid dates.')
+        return redirect('fees:payment_dashboard')
     
-    # Company Header
-    story.append(Paragraph("Shahriar's Medical Academy", title_style))
-    story.append(Spacer(1, 12))
+    if not batch_id and not (date_from or date_to):
+        messages.error(request, 'Please select a batch or a date range.')
+        return redirect('fees:payment_dashboard')
     
-    # Add logo if available
-    try:
-        logo_path = '/Users/istemamahmed/Desktop/Student Management System/static/images/sma-logo.jpg'
-        if os.path.exists(logo_path):
-            logo = Image(logo_path, width=2*inch, height=1*inch)
-            logo.hAlign = 'CENTER'
-            story.append(logo)
-            story.append(Spacer(1, 12))
-    except:
-        pass  # Logo is optional
-    
-    story.append(Paragraph("PAYMENT RECEIPT", heading_style))
-    story.append(Spacer(1, 12))
-    
-    # Receipt details
-    receipt_data = [
-        ['Receipt Number:', transaction.receipt_number],
-        ['Date:', transaction.payment_date.strftime('%B %d, %Y at %I:%M %p')],
-        ['Student ID:', student.student_id],
-        ['Student Name:', student.user.get_full_name()],
-        ['Batch:', payment.batch.name],
-        ['Phone:', student.phone if student.phone else 'N/A'],
-        ['Address:', student.address if student.address else 'N/A'],
-    ]
-    
-    # Payment details table
-    payment_table = Table(receipt_data, colWidths=[2*inch, 4*inch])
-    payment_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(payment_table)
-    story.append(Spacer(1, 20))
-    
-    # Payment summary
-    story.append(Paragraph("PAYMENT SUMMARY", heading_style))
-    
-    payment_summary_data = [
-        ['Description', 'Amount'],
-        ['Total Course Fee', f"{payment.currency.code} {payment.total_amount:,.2f}"],
-        ['Amount Paid Previously', f"{payment.currency.code} {payment.get_total_paid() - float(transaction.amount):,.2f}"],
-        ['Current Payment', f"{payment.currency.code} {transaction.amount:,.2f}"],
-        ['Total Paid', f"{payment.currency.code} {payment.get_total_paid():,.2f}"],
-        ['Remaining Balance', f"{payment.currency.code} {payment.get_remaining_amount():,.2f}"],
-    ]
-    
-    summary_table = Table(payment_summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 20))
-    
-    # Payment method and notes
-    story.append(Paragraph(f"Payment Method: {transaction.get_payment_method_display()}", normal_style))
-    if transaction.notes:
-        story.append(Paragraph(f"Notes: {transaction.notes}", normal_style))
-    
-    story.append(Spacer(1, 30))
-    
-    # Footer
-    story.append(Paragraph("Thank you for your payment!", normal_style))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("Shahriar's Medical Academy", normal_style))
-    story.append(Paragraph("Contact: info@shahriaracademy.com", normal_style))
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Get PDF content
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Create HTTP response
+    batch = get_object_or_404(Batch, id=batch_id) if batch_id else None
+    
+    label = f'{dict(DOCUMENT_KINDS)[kind]} for {batch.name if batch else "all batches"}'
+    if date_from or date_to:
+        label += f' ({date_from or "start"} to {date_to or "today"})'
+    
+    job = enqueue(
+        'fees.bulk_documents',
+        {
+            'kind': kind,
+            'format': output_format,
+            'batch_id': str(batch.id) if batch else None,
+            'date_from': date_from.isoformat() if date_from else None,
+            'date_to': date_to.isoformat() if date_to else None,
+        },
+        user=request.user,
+        label=label
+    )
+    return redirect('core:job_status', job_id=job.id)
+
+def pdf_response(request, pdf_content, etag, filename):
+    """Serve PDF bytes with an ETag so reprints can be answered with 304"""
     response = HttpResponse(pdf_content, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="receipt_{transaction.receipt_number}.pdf"'
-    
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['ETag'] = quote_etag(etag)
+    # Let the browser keep the file but check back before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 @login_required
-def generate_payment_summary_pdf(request, payment_id):
-    """Generate PDF summary for a student's payment record"""
-    payment = get_object_or_404(StudentPayment, id=payment_id)
-    student = payment.student
-    transactions = payment.transactions.all().order_by('payment_date')
-    
-    # Create PDF buffer
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.darkblue
+def generate_receipt_pdf(request, transaction_id):
+    """PDF receipt for a payment transaction, from the cache or rendered on the spot"""
+    transaction = get_object_or_404(
+        PaymentTransaction.objects.select_related('payment', 'payment__student', 'payment__student__user', 'payment__batch', 'payment__currency'),
+        id=transaction_id
     )
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        alignment=TA_LEFT,
-        textColor=colors.darkblue
-    )
+    # Unchanged since the browser last downloaded it
+    etag = receipt_etag(transaction)
+    not_modified = get_conditional_response(request, etag=quote_etag(etag))
+    if not_modified is not None:
+        not_modified['ETag'] = quote_etag(etag)
+        return not_modified
     
-    normal_style = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=6,
-        alignment=TA_LEFT
+    # One page renders in well under a second, so a miss is rendered here rather than queued
+    pdf_content = get_receipt_pdf(transaction)
+    return pdf_response(request, pdf_content, etag, f'receipt_{transaction.receipt_number}.pdf')
+
+@login_required
+def generate_payment_summary_pdf(request, payment_id):
+    """PDF summary for a student's payment record, from the cache or queued for rendering"""
+    payment = get_object_or_404(
+        StudentPayment.objects.select_related('student', 'student__user', 'batch', 'currency'),
+        id=payment_id
     )
     
-    # Build PDF content
-    story = []
-    
-    # Company Header
-    story.append(Paragraph("Shahriar's Medical Academy", title_style))
-    story.append(Spacer(1, 12))
-    
-    # Add logo if available
-    try:
-        logo_path = '/Users/istemamahmed/Desktop/Student Management System/static/images/sma-logo.jpg'
-        if os.path.exists(logo_path):
-            logo = Image(logo_path, width=2*inch, height=1*inch)
-            logo.hAlign = 'CENTER'
-            story.append(logo)
-            story.append(Spacer(1, 12))
-    except:
-        pass  # Logo is optional
-    
-    story.append(Paragraph("PAYMENT SUMMARY REPORT", heading_style))
-    story.append(Spacer(1, 12))
-    
-    # Student details
-    student_data = [
-        ['Student ID:', student.student_id],
-        ['Student Name:', student.user.get_full_name()],
-        ['Batch:', payment.batch.name],
-        ['Phone:', student.phone if student.phone else 'N/A'],
-        ['Address:', student.address if student.address else 'N/A'],
-        ['Enrollment Date:', payment.student.enrollment_date.strftime('%B %d, %Y')],
-    ]
-    
-    student_table = Table(student_data, colWidths=[2*inch, 4*inch])
-    student_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(student_table)
-    story.append(Spacer(1, 20))
-    
-    # Payment transactions table
-    story.append(Paragraph("PAYMENT TRANSACTIONS", heading_style))
-    
-    transaction_data = [['Receipt #', 'Date', 'Amount', 'Method', 'Notes']]
-    
-    for transaction in transactions:
-        transaction_data.append([
-            transaction.receipt_number,
-            transaction.payment_date.strftime('%B %d, %Y'),
-            f"{payment.currency.code} {transaction.amount:,.2f}",
-            transaction.get_payment_method_display(),
-            transaction.notes[:30] + '...' if len(transaction.notes) > 30 else transaction.notes
-        ])
-    
-    transaction_table = Table(transaction_data, colWidths=[1.2*inch, 1.2*inch, 1*inch, 1*inch, 1.6*inch])
-    transaction_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(transaction_table)
-    story.append(Spacer(1, 20))
-    
-    # Payment summary
-    story.append(Paragraph("PAYMENT SUMMARY", heading_style))
-    
-    summary_data = [
-        ['Total Course Fee', f"{payment.currency.code} {payment.total_amount:,.2f}"],
-        ['Total Paid', f"{payment.currency.code} {payment.get_total_paid():,.2f}"],
-        ['Remaining Balance', f"{payment.currency.code} {payment.get_remaining_amount():,.2f}"],
-        ['Payment Progress', f"{payment.get_completion_percentage():.1f}%"],
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 30))
-    
-    # Footer
-    story.append(Paragraph("Generated on: " + datetime.now().strftime('%B %d, %Y at %I:%M %p'), normal_style))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph("Shahriar's Medical Academy", normal_style))
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Get PDF content
-    pdf_content = buffer.getvalue()
-    buffer.close()
-    
-    # Create HTTP response
-    response = HttpResponse(pdf_content, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="payment_summary_{student.student_id}.pdf"'
-    
-    return response
\ No newline at end of file
+    # Unchanged since the browser last downloaded it
+    etag = payment_summary_etag(payment)
+    not_modified = get_conditional_response(request, etag=quote_etag(etag))
+    if not_modified is not None:
+        not_modified['ETag'] = quote_etag(etag)
+        return not_modified
+    
+    pdf_content = get_payment_summary_pdf(payment, render=False)
+    if pdf_content is not None:
+        return pdf_response(request, pdf_content, etag, f'payment_summary_{payment.student.student_id}.pdf')
+    
+    job = enqueue(
+        'fees.payment_summary_pdf',
+        {'payment_id': str(payment.id)},
+        user=request.user,
+        label=f'Payment summary for {payment.student.student_id}'
+    )
+    return redirect('core:job_status', job_id=job.id)
@@ -7,11 +7,22 @@ echo "Starting deployment process..."
 echo "Running migrations..."
 python manage.py migrate
 
+echo "Creating cache tables..."
+python manage.py createcachetable
+
+echo "Building student summaries..."
+python manage.py rebuild_student_summaries --if-empty
+
 echo "Creating admin user..."
 python manage.py create_admin
 
 echo "Collecting static files..."
 python manage.py collectstatic --noinput --clear
 
+# Imports, exports and bulk documents run as queued jobs; the workers share this instance's
+# disk (MEDIA_ROOT) with the web process, which serves the uploaded and generated files
+echo "Starting background workers..."
+python manage.py run_workers --workers ${JOB_WORKERS:-2} &
+
 echo "Starting server..."
 exec gunicorn student_management.wsgi:application --bind 0.0.0.0:$PORT --workers 2 --timeout 60
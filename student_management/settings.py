@@ -187,6 +187,33 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered receipts and payment summaries live in a database table (python manage.py createcachetable),
+# so web and worker instances share them. Expired entries go first; past PDF_CACHE_MAX_ENTRIES Django
+# culls a third of the rest in key order, so the cap is a count of documents, not bytes, and not LRU
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pdf': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'fees_pdf_cache',
+        'TIMEOUT': int(os.getenv('PDF_CACHE_TIMEOUT_DAYS', '30')) * 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('PDF_CACHE_MAX_ENTRIES', '2000')),
+        },
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'fees_report_cache',
+    },
+}
+
+# How long a retried API request with the same Idempotency-Key gets the stored response
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '48'))
+
+# Country calling code assumed for phone numbers written without one, e.g. 01712345678
+PHONE_DEFAULT_COUNTRY_CODE = os.getenv('PHONE_DEFAULT_COUNTRY_CODE', '880')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -249,6 +276,12 @@ CORS_ALLOW_CREDENTIALS = True
 # Currency API Configuration
 CURRENCY_API_KEY = os.getenv('CURRENCY_API_KEY')
 
+# Currency code totals across currencies are converted to ('' = the default Currency)
+REPORTING_CURRENCY = os.getenv('REPORTING_CURRENCY', '')
+
+# Exchange rates are re-read at least this often; saving a Currency also clears this process's copy
+CURRENCY_RATE_CACHE_SECONDS = int(os.getenv('CURRENCY_RATE_CACHE_SECONDS', '300'))
+
 # Login URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
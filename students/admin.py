@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Student, StudentDocument, StudentApplication
+from .models import Student, StudentDocument, StudentApplication, StudentImport
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
@@ -71,4 +71,11 @@ class StudentApplicationAdmin(admin.ModelAdmin):
     
     def get_full_name(self, obj):
         return obj.get_full_name()
-    get_full_name.short_description = 'Full Name'
\ No newline at end of file
+    get_full_name.short_description = 'Full Name'
+
+@admin.register(StudentImport)
+class StudentImportAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'batch', 'status', 'total_rows', 'successful_imports', 'failed_imports', 'invitations_issued', 'created_at']
+    list_filter = ['status', 'batch', 'created_at']
+    search_fields = ['file_name', 'batch__name']
+    readonly_fields = ['created_at', 'updated_at']
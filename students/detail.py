@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.db.models import Max, Count, Subquery, OuterRef
+from decimal import Decimal
+import hashlib
+
+from batches.models import BatchGrade, BatchAttendance
+from fees.models import StudentPayment, PaymentTransaction, FeeInstallment
+from .models import Student
+
+# Versions are keyed on the rows themselves; the TTL only bounds what no version covers, like a currency's symbol
+DETAIL_CACHE_TTL = 60 * 60
+
+# Rows shown in the recent attendance and transaction lists
+RECENT_ATTENDANCE = 10
+RECENT_TRANSACTIONS = 10
+
+# (name, rows of every student, field pointing at the student) that the detail page shows
+RELATED_ROWS = [
+    ('grades', BatchGrade.objects.all(), 'student'),
+    ('attendance', BatchAttendance.objects.all(), 'student'),
+    ('payments', StudentPayment.objects.all(), 'student'),
+    ('transactions', PaymentTransaction.objects.all(), 'payment__student'),
+    ('installments', FeeInstallment.objects.all(), 'student'),
+]
+
+
+class TotalPayment:
+    """A student's payments added up, in the currency of the latest one"""
+    
+    def __init__(self, total_amount, total_paid, currency, last_payment_date=None):
+        self.total_amount = Decimal(str(total_amount or 0))
+        self.total_paid = Decimal(str(total_paid or 0))
+        self.currency = currency
+        self.last_payment_date = last_payment_date
+        self.remaining = self.total_amount - self.total_paid
+        self.status = 'completed' if self.total_paid >= self.total_amount else 'partial'
+    
+    def get_status_display(self):
+        if self.total_paid >= self.total_amount:
+            return 'Completed'
+        elif self.total_paid > 0:
+            return 'Partial'
+        else:
+            return 'Pending'
+
+
+def _changes(name, queryset, field):
+    """Latest updated_at and row count of a student's related rows, as subqueries"""
+    rows = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return {
+        f'{name}_changed': Subquery(rows.annotate(changed=Max('updated_at')).values('changed')),
+        f'{name}_rows': Subquery(rows.annotate(rows=Count('pk')).values('rows')),
+    }
+
+
+def detail_version(student_id):
+    """(pk, version) of an active student in one query; the version moves whenever a shown row changes"""
+    annotations = {}
+    for name, queryset, field in RELATED_ROWS:
+        annotations.update(_changes(name, queryset, field))
+    
+    # Users carry no updated_at, so the shown fields stand in for it; row counts catch hard deletes
+    row = Student.objects.filter(student_id=student_id, is_active=True).values(
+        'pk', 'updated_at', 'user__first_name', 'user__last_name', 'user__email', 'batch__updated_at', **annotations
+    ).first()
+    if row is None:
+        raise Student.DoesNotExist(f'No active student {student_id}')
+    
+    version = hashlib.md5(repr(sorted(row.items())).encode()).hexdigest()
+    return row['pk'], version
+
+
+def build_detail_context(pk):
+    """Everything the detail page shows, with each related table read once"""
+    student = Student.objects.select_related('user', 'batch').get(pk=pk)
+    
+    grades = list(BatchGrade.objects.filter(student=student).select_related('course', 'semester').order_by(
+        '-semester__start_date'
+    ))
+    attendance = list(BatchAttendance.objects.filter(student=student).select_related('course').order_by(
+        '-date'
+    )[:RECENT_ATTENDANCE])
+    payments = list(StudentPayment.objects.filter(student=student).with_totals().select_related(
+        'batch', 'currency'
+    ).order_by('-created_at'))
+    recent_transactions = list(PaymentTransaction.objects.filter(payment__student=student).select_related(
+        'payment__currency'
+    ).order_by('-payment_date')[:RECENT_TRANSACTIONS])
+    first_installment = FeeInstallment.objects.filter(student=student, is_active=True).select_related(
+        'currency'
+    ).order_by('due_date', 'installment_number').first()
+    
+    total_payment = None
+    if payments:
+        active_dates = [
+            payment_transaction.payment_date for payment_transaction in recent_transactions
+            if payment_transaction.is_active
+        ]
+        total_payment = TotalPayment(
+            sum(payment.total_amount for payment in payments),
+            sum(payment.get_total_paid() for payment in payments),
+            payments[0].currency,
+            active_dates[0] if active_dates else None
+        )
+    
+    return {
+        'title': f'Student - {student.user.get_full_name()}',
+        'student': student,
+        'grades': grades,
+        'attendance': attendance,
+        'payments': payments,
+        'recent_transactions': recent_transactions,
+        'first_installment': first_installment,
+        'total_payment': total_payment,
+    }
+
+
+def get_detail_context(student_id):
+    """The detail page context of an active student, from the cache while none of its rows has changed"""
+    pk, version = detail_version(student_id)
+    key = f'students:detail:{pk}:{version}'
+    context = cache.get(key)
+    if context is None:
+        context = build_detail_context(pk)
+        cache.set(key, context, DETAIL_CACHE_TTL)
+    return context
@@ -0,0 +1,220 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from difflib import SequenceMatcher
+import re
+import unicodedata
+
+from .models import Student, DuplicateKey
+
+# Student rows read, and keys written, per statement while indexing
+KEY_BATCH_SIZE = 1000
+
+# Students fetched per key looked up; a very common name stops here instead of scanning on
+MAX_CANDIDATES_PER_KEY = 100
+
+# Candidates returned to the caller, best first
+MAX_DUPLICATE_RESULTS = 10
+
+# Name similarity below which a phonetic or shared-word match is a different person
+PHONETIC_THRESHOLD = 0.7
+
+# Name words two students must share for a word match, so "Md Rahim Khan" finds "Rahim Khan"
+MIN_SHARED_TOKENS = 2
+
+# Words shorter than this (initials) are not indexed on their own
+MIN_TOKEN_LENGTH = 2
+
+# Share of the score carried by the name when both a name and a phone number are given
+NAME_WEIGHT = 0.6
+
+# Soundex digit of each letter; vowels (0) separate repeated digits, h and w do not
+SOUNDEX_CODES = {
+    letter: str(code)
+    for code, letters in enumerate(['aeiouy', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'])
+    for letter in letters
+}
+
+# E.164 numbers carry at most 15 digits; anything under 8 is a fragment, not a number
+MIN_PHONE_DIGITS = 8
+MAX_PHONE_DIGITS = 15
+
+
+def name_tokens(name):
+    """Case-folded words of a name, without digits or punctuation"""
+    return re.findall(r'[^\W\d_]+', (name or '').casefold())
+
+
+def name_key(name):
+    """Words of a name sorted and joined, so "Rahman  Karim" and "karim rahman" compare equal"""
+    return ''.join(sorted(name_tokens(name)))[:255]
+
+
+def token_keys(name):
+    """Distinct words of a name long enough to be indexed one by one"""
+    return sorted({token[:255] for token in name_tokens(name) if len(token) >= MIN_TOKEN_LENGTH})
+
+
+def soundex(token):
+    """Four-character Soundex code of a word; words without Latin letters are their own code"""
+    letters = [
+        character for character in unicodedata.normalize('NFKD', token)
+        if 'a' <= character <= 'z'
+    ]
+    if not letters:
+        return token
+    
+    digits = []
+    previous = SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        if letter in 'hw':
+            continue
+        code = SOUNDEX_CODES[letter]
+        if code != '0' and code != previous:
+            digits.append(code)
+        previous = code
+    return (letters[0] + ''.join(digits) + '000')[:4]
+
+
+def phonetic_key(name):
+    """Sorted Soundex codes of a name's words, so Mohammad Rahman and Muhammad Rehman compare equal"""
+    return ' '.join(sorted(soundex(token) for token in name_tokens(name)))[:255]
+
+
+def phone_key(phone, country_code=None):
+    """Digits of a phone number in E.164 form, without the plus; '' for fragments"""
+    text = str(phone or '').strip()
+    digits = re.sub(r'\D', '', text)
+    if not text.startswith('+'):
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif digits.startswith('0') or len(digits) <= 10:
+            # A trunk prefix or a bare subscriber number: the local country's
+            country_code = country_code or settings.PHONE_DEFAULT_COUNTRY_CODE
+            digits = country_code + digits.removeprefix('0')
+    if not MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS:
+        return ''
+    return digits
+
+
+def duplicate_keys(first_name, last_name, phone):
+    """(kind, value) of each key a student with these details is indexed under"""
+    full_name = f'{first_name or ""} {last_name or ""}'
+    keys = [
+        ('name', name_key(full_name)),
+        ('phonetic', phonetic_key(full_name)),
+        ('phone', phone_key(phone)),
+    ] + [('token', token) for token in token_keys(full_name)]
+    return [(kind, value) for kind, value in keys if value]
+
+
+def build_keys(rows):
+    """Unsaved DuplicateKeys for (pk, first_name, last_name, phone) rows"""
+    for pk, first_name, last_name, phone in rows:
+        for kind, value in duplicate_keys(first_name, last_name, phone):
+            yield DuplicateKey(student_id=pk, kind=kind, value=value)
+
+
+def write_keys(keys):
+    batch = []
+    written = 0
+    for key in keys:
+        batch.append(key)
+        if len(batch) >= KEY_BATCH_SIZE:
+            DuplicateKey.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    DuplicateKey.objects.bulk_create(batch)
+    return written + len(batch)
+
+
+def key_rows(queryset):
+    return queryset.values_list('pk', 'user__first_name', 'user__last_name', 'phone').iterator(
+        chunk_size=KEY_BATCH_SIZE
+    )
+
+
+def update_duplicate_keys(student_ids):
+    """Re-key the given students; inactive or deleted ones drop out of the index"""
+    student_ids = list(student_ids)
+    if not student_ids:
+        return 0
+    with transaction.atomic():
+        DuplicateKey.objects.filter(student_id__in=student_ids).delete()
+        return write_keys(build_keys(key_rows(Student.objects.filter(pk__in=student_ids, is_active=True))))
+
+
+def rebuild_duplicate_keys():
+    """Rewrite every key from the students table; returns the keys written"""
+    with transaction.atomic():
+        DuplicateKey.objects.all().delete()
+        return write_keys(build_keys(key_rows(Student.objects.filter(is_active=True))))
+
+
+def find_duplicates(first_name='', last_name='', phone='', limit=MAX_DUPLICATE_RESULTS):
+    """Active students who may be the person described, as dicts of student, score and match_type, best first"""
+    keys = duplicate_keys(first_name, last_name, phone)
+    if not keys:
+        return []
+    
+    # One bounded lookup per whole-name and phone key on the (kind, value) index
+    matched = {}
+    for kind, value in keys:
+        if kind == 'token':
+            continue
+        student_ids = DuplicateKey.objects.filter(kind=kind, value=value).values_list(
+            'student_id', flat=True
+        )[:MAX_CANDIDATES_PER_KEY]
+        for student_id in student_ids:
+            matched.setdefault(student_id, set()).add(kind)
+    
+    # One grouped lookup for students sharing enough name words, those sharing the most first
+    tokens = [value for kind, value in keys if kind == 'token']
+    if len(tokens) >= MIN_SHARED_TOKENS:
+        student_ids = DuplicateKey.objects.filter(kind='token', value__in=tokens).values('student_id').annotate(
+            shared=Count('pk')
+        ).filter(shared__gte=MIN_SHARED_TOKENS).order_by('-shared').values_list(
+            'student_id', flat=True
+        )[:MAX_CANDIDATES_PER_KEY]
+        for student_id in student_ids:
+            matched.setdefault(student_id, set()).add('token')
+    if not matched:
+        return []
+    
+    wanted_name = ' '.join(sorted(name_tokens(f'{first_name} {last_name}')))
+    has_phone = any(kind == 'phone' for kind, _ in keys)
+    
+    candidates = []
+    students = Student.objects.filter(pk__in=matched, is_active=True).select_related('user', 'batch')
+    for student in students:
+        kinds = matched[student.pk]
+        if 'name' in kinds:
+            name_similarity = 1.0
+        elif wanted_name:
+            name = ' '.join(sorted(name_tokens(student.user.get_full_name())))
+            name_similarity = SequenceMatcher(None, wanted_name, name).ratio()
+        else:
+            name_similarity = 0.0
+        
+        # Names that only sound alike or share some words must still be spelled alike enough
+        if not kinds & {'name', 'phone'} and name_similarity < PHONETIC_THRESHOLD:
+            continue
+        
+        phone_match = 1.0 if 'phone' in kinds else 0.0
+        if not wanted_name:
+            score = phone_match
+        elif not has_phone:
+            score = name_similarity
+        else:
+            score = NAME_WEIGHT * name_similarity + (1 - NAME_WEIGHT) * phone_match
+        
+        if 'phone' in kinds:
+            match_type = 'name_and_phone' if kinds & {'name', 'phonetic', 'token'} else 'phone'
+        elif 'name' in kinds:
+            match_type = 'name'
+        else:
+            match_type = 'phonetic' if 'phonetic' in kinds else 'partial_name'
+        candidates.append({'student': student, 'score': round(score, 3), 'match_type': match_type})
+    
+    candidates.sort(key=lambda candidate: (-candidate['score'], candidate['student'].student_id))
+    return candidates[:limit]
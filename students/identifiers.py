@@ -0,0 +1,27 @@
+from django.utils import timezone
+
+from core.sequences import SequenceAllocator
+
+STUDENT_ID_PREFIX = 'STU'
+
+student_ids = SequenceAllocator(STUDENT_ID_PREFIX, width=4)
+
+
+def enrollment_year(student):
+    return student.enrollment_date.year if student.enrollment_date else timezone.localdate().year
+
+
+def next_student_id(year=None):
+    return student_ids.allocate(1, year)[0]
+
+
+def assign_student_ids(students):
+    """Fill in missing student IDs on unsaved students, one reservation per enrollment year, e.g. before bulk_create"""
+    by_year = {}
+    for student in students:
+        if not student.student_id:
+            by_year.setdefault(enrollment_year(student), []).append(student)
+    for year, missing in sorted(by_year.items()):
+        for student, student_id in zip(missing, student_ids.allocate(len(missing), year)):
+            student.student_id = student_id
+    return students
@@ -0,0 +1,379 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+import operator
+import re
+
+from accounts.models import UserProfile
+from core.jobs import enqueue
+from core.models import Currency
+from core.processes import django_process_pool, default_worker_count
+from fees.models import StudentPayment
+from fees.reports import invalidate_ar_aging
+from .identifiers import assign_student_ids
+from .models import Student, StudentImport
+from .search import update_search_index
+from .duplicates import update_duplicate_keys
+from .summaries import refresh_student_summaries
+
+REQUIRED_COLUMNS = ['First Name', 'Last Name']
+OPTIONAL_COLUMNS = ['Email', 'Username', 'Password', 'Phone', 'Enrollment Date', 'Total Amount', 'Currency', 'Note']
+
+# Rows committed (and reported as progress) at a time; also the bulk_create batch size
+IMPORT_CHUNK_SIZE = 500
+
+# Columns of the invitation links file stored on the job
+INVITATION_COLUMNS = ['Student ID', 'Name', 'Username', 'Email', 'Invitation Link', 'Link Expires']
+
+# Tries at inserting a chunk's users when a concurrent import takes one of their usernames first
+USERNAME_ATTEMPTS = 3
+
+# Tried after ISO dates; day-first formats before month-first ones
+DATE_FORMATS = ['%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%m/%d/%Y']
+
+
+class RowRejected(ValueError):
+    """A sheet row that can't be enrolled"""
+
+
+def cell_text(row, column):
+    value = row.get(column)
+    if value is None:
+        return ''
+    # Excel stores phone numbers and amounts typed as numbers as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_enrollment_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    
+    text = str(value or '').strip()
+    if not text:
+        return timezone.localdate()
+    try:
+        parsed = parse_date(text[:10])
+    except ValueError:
+        parsed = None
+    if parsed:
+        return parsed
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise RowRejected(f'Invalid enrollment date "{text}".')
+
+
+def base_username(first_name, last_name):
+    """first.last, as add_student builds it, without characters usernames can't contain"""
+    username = f"{first_name.lower().replace(' ', '')}.{last_name.lower().replace(' ', '')}"
+    return re.sub(r'[^\w.@+-]', '', username)[:140] or 'student'
+
+
+def allocate_usernames(requested):
+    """Unique usernames for the wanted ones, suffixed 1, 2, ... like add_student, from one prefix query"""
+    wanted = set(requested)
+    if not wanted:
+        return []
+    
+    prefixes = reduce(operator.or_, (Q(username__startswith=username) for username in wanted))
+    taken = set(User.objects.filter(prefixes).values_list('username', flat=True))
+    
+    usernames = []
+    for wanted_username in requested:
+        username = wanted_username
+        counter = 1
+        while username in taken:
+            username = f"{wanted_username}{counter}"
+            counter += 1
+        taken.add(username)
+        usernames.append(username)
+    return usernames
+
+
+def invitation_days():
+    """Days an invitation link works for: Django's PASSWORD_RESET_TIMEOUT, counted from when it is issued"""
+    return settings.PASSWORD_RESET_TIMEOUT // (24 * 60 * 60)
+
+
+def invitation_path(user):
+    """Set-your-password link for a user created without a usable password; it stops working once used or expired"""
+    return reverse('accounts:accept_invitation', kwargs={
+        'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
+        'token': default_token_generator.make_token(user),
+    })
+
+
+class StudentImporter:
+    """Enroll a sheet of students into one batch with bulk writes, chunk by chunk"""
+    
+    def __init__(self, import_record, user, site_url='', workers=None):
+        self.import_record = import_record
+        self.batch = import_record.batch
+        self.user = user
+        self.site_url = site_url.rstrip('/')
+        self.workers = workers or default_worker_count()
+        self.notes = f'Enrolled from {import_record.file_name}'
+        self.successful_imports = 0
+        self.failed_imports = 0
+        self.error_log = []
+        self.invitations = []
+        self.currencies = None
+        self.default_currency = None
+        self._stack = None
+        self._pool = None
+    
+    def run(self, chunks, progress=None):
+        """Import chunk by chunk, committing and recording progress after each one"""
+        self.currencies = {currency.code.upper(): currency for currency in Currency.objects.all()}
+        self.default_currency = (
+            Currency.objects.filter(is_default=True).first() or Currency.objects.first()
+        )
+        
+        row_offset = 0
+        with ExitStack() as self._stack:
+            try:
+                for rows in chunks:
+                    # A failing chunk leaves no trace, so keep what the earlier ones counted
+                    counts = (self.successful_imports, self.failed_imports, len(self.error_log), len(self.invitations))
+                    try:
+                        self.process_chunk(rows, row_offset)
+                    except Exception:
+                        self.successful_imports, self.failed_imports = counts[:2]
+                        del self.error_log[counts[2]:]
+                        del self.invitations[counts[3]:]
+                        raise
+                    row_offset += len(rows)
+                    self._save_progress(row_offset)
+                    if progress:
+                        progress(row_offset)
+            except Exception as e:
+                self.import_record.status = 'failed'
+                self.error_log.append(
+                    f'Import stopped at row {row_offset + 2}; rows above it were saved: {str(e)}'
+                )
+                self._save_record(max(self.import_record.total_rows, row_offset))
+                raise
+        
+        self.import_record.status = 'completed'
+        self._save_record(row_offset)
+        return self.import_record
+    
+    def _save_progress(self, rows_done):
+        """Publish the running counts without touching the rest of the record"""
+        self.import_record.total_rows = max(self.import_record.total_rows, rows_done)
+        StudentImport.objects.filter(pk=self.import_record.pk).update(
+            total_rows=self.import_record.total_rows,
+            successful_imports=self.successful_imports,
+            failed_imports=self.failed_imports,
+            invitations_issued=len(self.invitations),
+            updated_at=timezone.now()
+        )
+    
+    def _save_record(self, total_rows):
+        self.import_record.total_rows = total_rows
+        self.import_record.successful_imports = self.successful_imports
+        self.import_record.failed_imports = self.failed_imports
+        self.import_record.invitations_issued = len(self.invitations)
+        self.import_record.error_log = '\n'.join(self.error_log)
+        self.import_record.save()
+    
+    def _fail(self, row_number, message):
+        self.error_log.append(f"Row {row_number}: {message}")
+        self.failed_imports += 1
+    
+    def parse_row(self, row):
+        first_name = cell_text(row, 'First Name')
+        last_name = cell_text(row, 'Last Name')
+        if not first_name or not last_name:
+            raise RowRejected('First Name and Last Name are required.')
+        
+        email = cell_text(row, 'Email').lower()
+        if email:
+            try:
+                validate_email(email)
+            except ValidationError:
+                raise RowRejected(f'Invalid email "{email}".')
+        
+        phone = re.sub(r'[\s\-()]', '', cell_text(row, 'Phone'))
+        if phone:
+            try:
+                Student.phone_regex(phone)
+            except ValidationError:
+                raise RowRejected(f'Invalid phone number "{phone}".')
+        
+        amount_text = cell_text(row, 'Total Amount').replace(',', '')
+        try:
+            total_amount = Decimal(amount_text or '0').quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise RowRejected(f'Invalid total amount "{amount_text}".')
+        if total_amount < 0:
+            raise RowRejected(f'Invalid total amount "{amount_text}".')
+        
+        currency_code = cell_text(row, 'Currency').upper()
+        currency = self.currencies.get(currency_code) if currency_code else self.default_currency
+        if currency is None:
+            raise RowRejected(f'Currency "{currency_code}" not found.' if currency_code else 'No currency is set up.')
+        
+        return {
+            'first_name': first_name[:150],
+            'last_name': last_name[:150],
+            'email': email,
+            'username': re.sub(r'[^\w.@+-]', '', cell_text(row, 'Username'))[:140],
+            'password': cell_text(row, 'Password'),
+            'phone': phone,
+            'enrollment_date': parse_enrollment_date(row.get('Enrollment Date')),
+            'total_amount': total_amount,
+            'currency': currency,
+            'note': cell_text(row, 'Note'),
+        }
+    
+    def _drop_duplicate_emails(self, entries):
+        """Skip rows whose email is already a user's, or appeared further up the sheet, in one query"""
+        # Sheet emails are lowercased; existing users may have been saved with capitals
+        emails = [entry['email'] for _, entry in entries if entry['email']]
+        taken = set(
+            User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).values_list('email_lower', flat=True)
+        ) if emails else set()
+        kept = []
+        for row_number, entry in entries:
+            if entry['email'] and entry['email'] in taken:
+                self._fail(row_number, f"A user with email {entry['email']} already exists.")
+                continue
+            if entry['email']:
+                taken.add(entry['email'])
+            kept.append((row_number, entry))
+        return kept
+    
+    def hash_passwords(self, passwords):
+        """make_password for each, spread over worker processes when there are several"""
+        if len(passwords) < 2 or self.workers < 2:
+            return [make_password(password) for password in passwords]
+        
+        # One pool serves the whole import, since spawning workers costs about a second
+        if self._pool is None:
+            self._pool = self._stack.enter_context(django_process_pool(self.workers))
+        return list(self._pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (self.workers * 4))))
+    
+    def create_users(self, users, requested):
+        """Insert users under free usernames, allocating them again if a concurrent import took one first"""
+        for attempt in range(USERNAME_ATTEMPTS):
+            for user, username in zip(users, allocate_usernames(requested)):
+                user.username = username
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users, batch_size=IMPORT_CHUNK_SIZE)
+                return
+            except IntegrityError:
+                if attempt == USERNAME_ATTEMPTS - 1:
+                    raise
+    
+    def process_chunk(self, rows, row_offset=0):
+        """Validate a chunk of rows and enroll what is left with one bulk insert per table"""
+        entries = []
+        # Excel row numbers: header is row 1
+        for row_number, row in enumerate(rows, start=row_offset + 2):
+            try:
+                entries.append((row_number, self.parse_row(row)))
+            except RowRejected as e:
+                self._fail(row_number, str(e))
+        entries = self._drop_duplicate_emails(entries)
+        if not entries:
+            return
+        
+        # Hashing is the slow part, so it happens before any row is locked; everyone
+        # without a password in the sheet gets an unusable one and an invitation link
+        hashes = iter(self.hash_passwords([entry['password'] for _, entry in entries if entry['password']]))
+        users = [
+            User(
+                email=entry['email'],
+                first_name=entry['first_name'],
+                last_name=entry['last_name'],
+                password=next(hashes) if entry['password'] else make_password(None)
+            )
+            for _, entry in entries
+        ]
+        
+        with transaction.atomic():
+            # Usernames are picked in the transaction that inserts them, so they are checked against
+            # what other imports have committed by then
+            self.create_users(users, [
+                entry['username'] or base_username(entry['first_name'], entry['last_name'])
+                for _, entry in entries
+            ])
+            UserProfile.objects.bulk_create([
+                UserProfile(user=user, role='student', phone=entry['phone'])
+                for (_, entry), user in zip(entries, users)
+            ], batch_size=IMPORT_CHUNK_SIZE)
+            
+            students = assign_student_ids([
+                Student(
+                    user=user,
+                    batch=self.batch,
+                    phone=entry['phone'],
+                    enrollment_date=entry['enrollment_date'],
+                    note=entry['note']
+                )
+                for (_, entry), user in zip(entries, users)
+            ])
+            Student.objects.bulk_create(students, batch_size=IMPORT_CHUNK_SIZE)
+            
+            StudentPayment.objects.bulk_create([
+                StudentPayment(
+                    student=student,
+                    batch=self.batch,
+                    total_amount=entry['total_amount'],
+                    remaining_amount=entry['total_amount'],
+                    currency=entry['currency'],
+                    payment_method='installments',
+                    created_by=self.user,
+                    notes=self.notes
+                )
+                for (_, entry), student in zip(entries, students)
+            ], batch_size=IMPORT_CHUNK_SIZE)
+            
+            # The bulk inserts skip the post_save signals, so the search index, duplicate keys and
+            # summaries are written here and Firestore is brought up to date by a job
+            update_search_index('student', [student.pk for student in students])
+            update_duplicate_keys([student.pk for student in students])
+            refresh_student_summaries([student.pk for student in students])
+            enqueue(
+                'students.sync_students_to_firebase',
+                {'student_ids': [str(student.pk) for student in students]},
+                user=self.user,
+                label=f'Firebase sync of {len(students)} enrolled students'
+            )
+            transaction.on_commit(invalidate_ar_aging)
+        
+        expires = timezone.localtime() + timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+        for (_, entry), student in zip(entries, students):
+            if not entry['password']:
+                self.invitations.append([
+                    student.student_id,
+                    student.user.get_full_name(),
+                    student.user.username,
+                    student.user.email,
+                    f'{self.site_url}{invitation_path(student.user)}',
+                    expires.strftime('%Y-%m-%d %H:%M'),
+                ])
+        self.successful_imports += len(students)
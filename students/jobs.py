@@ -0,0 +1,63 @@
+from django.core.files.base import ContentFile
+import csv
+import io
+
+from core.jobs import register_job
+from core.uploads import UploadReader
+from core.firebase_utils import student_firebase_manager
+from accounts.models import UserProfile
+from .models import Student, StudentImport
+from .imports import StudentImporter, REQUIRED_COLUMNS, INVITATION_COLUMNS, IMPORT_CHUNK_SIZE
+from .summaries import rebuild_student_summaries as rebuild_summaries
+
+
+@register_job('students.import_students', retry=False)
+def import_students(job):
+    """Enroll an uploaded sheet of students into its batch and store their invitation links"""
+    import_record = StudentImport.objects.select_related('batch', 'imported_by').get(pk=job.payload['import_id'])
+    
+    with job.input_file.open('rb') as upload:
+        try:
+            reader = UploadReader(upload, import_record.file_name, REQUIRED_COLUMNS, chunk_size=IMPORT_CHUNK_SIZE)
+        except Exception as e:
+            import_record.status = 'failed'
+            import_record.error_log = str(e)
+            import_record.save()
+            raise
+        
+        with reader:
+            import_record.total_rows = reader.row_count_hint or 0
+            import_record.save(update_fields=['total_rows', 'updated_at'])
+            job.set_progress(0, import_record.total_rows)
+            
+            importer = StudentImporter(import_record, import_record.imported_by, site_url=job.payload.get('site_url', ''))
+            importer.run(reader.chunks(), progress=job.set_progress)
+    
+    if importer.invitations:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(INVITATION_COLUMNS)
+        writer.writerows(importer.invitations)
+        job.result_file.save(
+            f'invitations_{import_record.batch.code}.csv', ContentFile(output.getvalue().encode('utf-8')), save=False
+        )
+
+
+@register_job('students.sync_students_to_firebase')
+def sync_students_to_firebase(job):
+    """Push bulk-enrolled students and their user profiles to Firestore in batched writes"""
+    student_ids = job.payload['student_ids']
+    students = list(Student.objects.filter(pk__in=student_ids).select_related('user', 'batch'))
+    profiles = list(UserProfile.objects.filter(user__student_profile__in=student_ids).select_related('user'))
+    job.set_progress(0, len(students))
+    student_firebase_manager.sync_students_to_firestore(students)
+    student_firebase_manager.sync_user_profiles_to_firestore(profiles)
+    job.set_progress(len(students))
+
+
+@register_job('students.rebuild_student_summaries')
+def rebuild_student_summaries(job):
+    """Rewrite every student summary after a change that touches them all"""
+    job.set_progress(0)
+    written = rebuild_summaries()
+    job.set_progress(written, written)
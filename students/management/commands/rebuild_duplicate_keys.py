@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from students.duplicates import rebuild_duplicate_keys
+
+class Command(BaseCommand):
+    help = 'Rebuild the name, phonetic and phone keys used to spot duplicate students'
+    
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding duplicate keys...')
+        
+        try:
+            written = rebuild_duplicate_keys()
+        except Exception as e:
+            raise CommandError(f'Error rebuilding duplicate keys: {str(e)}')
+        
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} duplicate keys.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from students.search import DOCUMENT_FIELDS, rebuild_search_index
+
+class Command(BaseCommand):
+    help = 'Rebuild the student and contact search index from their tables'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=list(DOCUMENT_FIELDS), help='Only rebuild this kind; default: all')
+    
+    def handle(self, *args, **options):
+        kinds = [options['kind']] if options['kind'] else None
+        self.stdout.write('Rebuilding search index...')
+        
+        try:
+            written = rebuild_search_index(kinds)
+        except Exception as e:
+            raise CommandError(f'Error rebuilding search index: {str(e)}')
+        
+        for kind, count in written.items():
+            self.stdout.write(self.style.SUCCESS(f'Indexed {count} {kind} documents.'))
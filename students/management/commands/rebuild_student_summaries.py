@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.processes import default_worker_count
+from students.models import Student, StudentSummary
+from students.summaries import rebuild_student_summaries, SUMMARY_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-student summary rows behind the student lists and dashboards'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=SUMMARY_CHUNK_SIZE, help='Students per chunk')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=f'Chunks processed in parallel (0 = {default_worker_count()} on this machine)'
+        )
+        parser.add_argument(
+            '--if-empty',
+            action='store_true',
+            help='Only rebuild when there are students but no summaries yet, as after the first migrate'
+        )
+    
+    def handle(self, *args, **options):
+        if options['if_empty'] and (StudentSummary.objects.exists() or not Student.objects.exists()):
+            self.stdout.write('Student summaries are already built.')
+            return
+        
+        workers = options['workers'] or default_worker_count()
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite takes one writer at a time, so parallel chunks would only queue up
+            self.stdout.write('SQLite database: processing chunks one at a time.')
+            workers = 1
+        
+        self.stdout.write('Rebuilding student summaries...')
+        
+        try:
+            written = rebuild_student_summaries(chunk_size=options['chunk_size'], workers=workers)
+        except Exception as e:
+            raise CommandError(f'Error rebuilding student summaries: {str(e)}')
+        
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} student summaries.'))
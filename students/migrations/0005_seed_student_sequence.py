@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:31
+
+from django.db import migrations
+import re
+
+STUDENT_ID_PATTERN = re.compile(r'^STU-(\d{4})-(\d+)$')
+
+
+def seed_sequence(apps, schema_editor):
+    # Start each year's sequence after the highest ID already given out
+    Student = apps.get_model('students', 'Student')
+    Sequence = apps.get_model('core', 'Sequence')
+    last_values = {}
+    for student_id in Student.objects.values_list('student_id', flat=True).iterator():
+        match = STUDENT_ID_PATTERN.match(student_id)
+        if match:
+            year, number = int(match.group(1)), int(match.group(2))
+            last_values[year] = max(last_values.get(year, 0), number)
+    for year, last_value in last_values.items():
+        Sequence.objects.update_or_create(
+            prefix='STU', year=year,
+            defaults={'last_value': last_value}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_sequence'),
+        ('students', '0004_student_note'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop),
+    ]
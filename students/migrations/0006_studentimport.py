@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:33
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0006_fix_batch_code_constraint'),
+        ('students', '0005_seed_student_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentImport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('file_name', models.CharField(max_length=200)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('successful_imports', models.PositiveIntegerField(default=0)),
+                ('failed_imports', models.PositiveIntegerField(default=0)),
+                ('invitations_issued', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='processing', max_length=20)),
+                ('error_log', models.TextField(blank=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_imports', to='batches.batch')),
+                ('imported_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:37
+
+from django.db import migrations, models
+
+TABLE = 'students_searchdocument'
+
+POSTGRES_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f"ALTER TABLE {TABLE} ADD COLUMN search_vector tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED",
+    f'CREATE INDEX {TABLE}_vector ON {TABLE} USING GIN (search_vector)',
+    f'CREATE INDEX {TABLE}_trgm ON {TABLE} USING GIN (document gin_trgm_ops)',
+]
+
+# External-content FTS5 table kept in step with the documents by triggers
+SQLITE_INDEX = [
+    f"CREATE VIRTUAL TABLE {TABLE}_fts USING fts5("
+    f"document, content='{TABLE}', content_rowid='id', tokenize='trigram case_sensitive 0')",
+    f'CREATE TRIGGER {TABLE}_ai AFTER INSERT ON {TABLE} BEGIN '
+    f'INSERT INTO {TABLE}_fts(rowid, document) VALUES (new.id, new.document); END',
+    f'CREATE TRIGGER {TABLE}_ad AFTER DELETE ON {TABLE} BEGIN '
+    f"INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, document) VALUES ('delete', old.id, old.document); END",
+    f'CREATE TRIGGER {TABLE}_au AFTER UPDATE ON {TABLE} BEGIN '
+    f"INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, document) VALUES ('delete', old.id, old.document); "
+    f'INSERT INTO {TABLE}_fts(rowid, document) VALUES (new.id, new.document); END',
+]
+
+SQLITE_DROP = [
+    f'DROP TRIGGER IF EXISTS {TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {TABLE}_ai',
+    f'DROP TABLE IF EXISTS {TABLE}_fts',
+]
+
+DOCUMENT_FIELDS = {
+    ('students', 'Student'): ('student', ['student_id', 'user__first_name', 'user__last_name', 'user__email', 'phone']),
+    ('contacts', 'Contact'): ('contact', ['name', 'email', 'phone', 'notes']),
+}
+
+
+def create_index(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_INDEX, 'sqlite': SQLITE_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+    
+    # Index the rows that already exist
+    SearchDocument = apps.get_model('students', 'SearchDocument')
+    for (app_label, model_name), (kind, fields) in DOCUMENT_FIELDS.items():
+        rows = apps.get_model(app_label, model_name).objects.filter(is_active=True).values_list('pk', *fields)
+        SearchDocument.objects.bulk_create([
+            SearchDocument(kind=kind, object_id=pk, document=' '.join(str(value) for value in values if value))
+            for pk, *values in rows.iterator()
+        ], batch_size=1000)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0002_alter_contact_phone'),
+        ('students', '0006_studentimport'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('document', models.TextField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='students_searchdocument_key')],
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:42
+
+import django.db.models.deletion
+import re
+import unicodedata
+from django.conf import settings
+from django.db import migrations, models
+
+# Copies of the key functions in students.duplicates as they were when this migration was written,
+# so later changes there don't alter what it backfills
+SOUNDEX_CODES = {
+    letter: str(code)
+    for code, letters in enumerate(['aeiouy', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'])
+    for letter in letters
+}
+
+
+def name_tokens(name):
+    return re.findall(r'[^\W\d_]+', (name or '').casefold())
+
+
+def soundex(token):
+    letters = [
+        character for character in unicodedata.normalize('NFKD', token)
+        if 'a' <= character <= 'z'
+    ]
+    if not letters:
+        return token
+    
+    digits = []
+    previous = SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        if letter in 'hw':
+            continue
+        code = SOUNDEX_CODES[letter]
+        if code != '0' and code != previous:
+            digits.append(code)
+        previous = code
+    return (letters[0] + ''.join(digits) + '000')[:4]
+
+
+def phone_key(phone):
+    text = str(phone or '').strip()
+    digits = re.sub(r'\D', '', text)
+    if not text.startswith('+'):
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif digits.startswith('0') or len(digits) <= 10:
+            digits = settings.PHONE_DEFAULT_COUNTRY_CODE + digits.removeprefix('0')
+    if not 8 <= len(digits) <= 15:
+        return ''
+    return digits
+
+
+def duplicate_keys(first_name, last_name, phone):
+    tokens = name_tokens(f'{first_name or ""} {last_name or ""}')
+    keys = [
+        ('name', ''.join(sorted(tokens))[:255]),
+        ('phonetic', ' '.join(sorted(soundex(token) for token in tokens))[:255]),
+        ('phone', phone_key(phone)),
+    ]
+    return [(kind, value) for kind, value in keys if value]
+
+
+def backfill_keys(apps, schema_editor):
+    Student = apps.get_model('students', 'Student')
+    DuplicateKey = apps.get_model('students', 'DuplicateKey')
+    rows = Student.objects.filter(is_active=True).values_list('pk', 'user__first_name', 'user__last_name', 'phone')
+    DuplicateKey.objects.bulk_create([
+        DuplicateKey(student_id=pk, kind=kind, value=value)
+        for pk, first_name, last_name, phone in rows.iterator()
+        for kind, value in duplicate_keys(first_name, last_name, phone)
+    ], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0007_searchdocument'),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='DuplicateKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('name', 'Name'), ('phonetic', 'Phonetic'), ('phone', 'Phone')], max_length=10)),
+                ('value', models.CharField(max_length=255)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_keys', to='students.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'value'], name='students_duplicatekey_lookup')],
+            },
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
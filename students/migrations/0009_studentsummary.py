@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('batches', '0007_keyset_pagination_indexes'),
+        ('students', '0008_duplicatekey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSummary',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='students.student')),
+                ('student_code', models.CharField(max_length=20, unique=True)),
+                ('first_name', models.CharField(blank=True, max_length=150)),
+                ('last_name', models.CharField(blank=True, max_length=150)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('note', models.TextField(blank=True)),
+                ('batch_name', models.CharField(blank=True, max_length=200)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('inactive', 'Inactive'), ('graduated', 'Graduated'), ('suspended', 'Suspended'), ('withdrawn', 'Withdrawn')], max_length=20)),
+                ('amount_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount_remaining', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('currency_code', models.CharField(blank=True, max_length=3)),
+                ('payment_status', models.CharField(choices=[('none', 'No Payment'), ('pending', 'Pending'), ('partial', 'Partial'), ('completed', 'Completed'), ('overdue', 'Overdue')], default='none', max_length=10)),
+                ('last_payment_date', models.DateTimeField(blank=True, null=True)),
+                ('attendance_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('current_gpa', models.DecimalField(decimal_places=2, default=0, max_digits=3)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='batches.batch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['batch', 'student_code'], name='students_summary_batch'), models.Index(fields=['status', 'student_code'], name='students_summary_status'), models.Index(fields=['payment_status', 'student_code'], name='students_summary_payment')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:18
+
+import re
+from django.db import migrations, models
+
+
+# Copy of students.duplicates.token_keys as it was when this migration was written
+def token_keys(name):
+    return sorted({token[:255] for token in re.findall(r'[^\W\d_]+', (name or '').casefold()) if len(token) >= 2})
+
+
+def backfill_token_keys(apps, schema_editor):
+    Student = apps.get_model('students', 'Student')
+    DuplicateKey = apps.get_model('students', 'DuplicateKey')
+    rows = Student.objects.filter(is_active=True).values_list('pk', 'user__first_name', 'user__last_name')
+    DuplicateKey.objects.bulk_create([
+        DuplicateKey(student_id=pk, kind='token', value=token)
+        for pk, first_name, last_name in rows.iterator()
+        for token in token_keys(f'{first_name or ""} {last_name or ""}')
+    ], batch_size=1000)
+
+
+def remove_token_keys(apps, schema_editor):
+    apps.get_model('students', 'DuplicateKey').objects.filter(kind='token').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_studentsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='duplicatekey',
+            name='kind',
+            field=models.CharField(choices=[('name', 'Name'), ('phonetic', 'Phonetic'), ('token', 'Name Word'), ('phone', 'Phone')], max_length=10),
+        ),
+        migrations.RunPython(backfill_token_keys, remove_token_keys),
+    ]
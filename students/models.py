@@ -5,6 +5,15 @@ from core.models import BaseModel, Currency
 from batches.models import Batch
 import uuid
 
+# GPA points of each letter grade; anything else counts as 0
+GRADE_POINTS = {
+    'A+': 4.0, 'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0, 'D-': 0.7,
+    'F': 0.0
+}
+
 class Student(BaseModel):
     """Student model"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
@@ -61,24 +70,9 @@ class Student(BaseModel):
     
     def save(self, *args, **kwargs):
         if not self.student_id:
-            # Generate student ID based on enrollment year or current year
-            if self.enrollment_date:
-                year = self.enrollment_date.year
-            else:
-                from datetime import date
-                year = date.today().year
-            
-            last_student = Student.objects.filter(
-                enrollment_date__year=year
-            ).order_by('-student_id').first()
-            
-            if last_student:
-                last_num = int(last_student.student_id.split('-')[-1])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-            
-            self.student_id = f"STU-{year}-{new_num:04d}"
+            # Numbered per enrollment year (or this year) from the shared sequence table
+            from .identifiers import enrollment_year, next_student_id
+            self.student_id = next_student_id(enrollment_year(self))
         
         super().save(*args, **kwargs)
     
@@ -87,7 +81,7 @@ class Student(BaseModel):
     
     def get_current_gpa(self):
         """Calculate current GPA"""
-        grades = self.grades.filter(semester__is_current=True)
+        grades = self.grades.filter(semester__is_current=True).select_related('course')
         if not grades:
             return 0.0
         
@@ -104,14 +98,7 @@ class Student(BaseModel):
     
     def grade_to_points(self, letter_grade):
         """Convert letter grade to GPA points"""
-        grade_points = {
-            'A+': 4.0, 'A': 4.0, 'A-': 3.7,
-            'B+': 3.3, 'B': 3.0, 'B-': 2.7,
-            'C+': 2.3, 'C': 2.0, 'C-': 1.7,
-            'D+': 1.3, 'D': 1.0, 'D-': 0.7,
-            'F': 0.0
-        }
-        return grade_points.get(letter_grade, 0.0)
+        return GRADE_POINTS.get(letter_grade, 0.0)
 
 class StudentDocument(BaseModel):
     """Student document model"""
@@ -193,4 +180,113 @@ class StudentApplication(BaseModel):
         return f"{self.first_name} {self.last_name} - Application"
     
     def get_full_name(self):
-        return f"{self.first_name} {self.last_name}"
\ No newline at end of file
+        return f"{self.first_name} {self.last_name}"
+
+class StudentImport(BaseModel):
+    """Track bulk enrollment imports"""
+    batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='student_imports')
+    file_name = models.CharField(max_length=200)
+    imported_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='student_imports')
+    
+    # Import Statistics
+    total_rows = models.PositiveIntegerField(default=0)
+    successful_imports = models.PositiveIntegerField(default=0)
+    failed_imports = models.PositiveIntegerField(default=0)
+    invitations_issued = models.PositiveIntegerField(default=0)
+    
+    STATUS_CHOICES = [
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    error_log = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Import {self.batch.name} - {self.file_name} ({self.status})"
+
+
+class SearchDocument(models.Model):
+    """Searchable text of one student or contact, kept in step by students.search"""
+    kind = models.CharField(max_length=20)
+    object_id = models.UUIDField()
+    document = models.TextField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='students_searchdocument_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class DuplicateKey(models.Model):
+    """Normalized name, phonetic, name word and phone key of a student, kept in step by students.duplicates"""
+    KIND_CHOICES = [
+        ('name', 'Name'),
+        ('phonetic', 'Phonetic'),
+        ('token', 'Name Word'),
+        ('phone', 'Phone'),
+    ]
+    
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='duplicate_keys')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=255)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'value'], name='students_duplicatekey_lookup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.value}"
+
+
+class StudentSummary(models.Model):
+    """One list row per active student, kept in step by students.summaries"""
+    PAYMENT_STATUS_CHOICES = [
+        ('none', 'No Payment'),
+        ('pending', 'Pending'),
+        ('partial', 'Partial'),
+        ('completed', 'Completed'),
+        ('overdue', 'Overdue'),
+    ]
+    
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    student_code = models.CharField(max_length=20, unique=True)
+    first_name = models.CharField(max_length=150, blank=True)
+    last_name = models.CharField(max_length=150, blank=True)
+    email = models.EmailField(blank=True)
+    note = models.TextField(blank=True)
+    batch = models.ForeignKey(Batch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    batch_name = models.CharField(max_length=200, blank=True)
+    status = models.CharField(max_length=20, choices=Student.STATUS_CHOICES)
+    
+    # Across the student's active payments, in the reporting currency
+    amount_billed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount_remaining = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    currency_code = models.CharField(max_length=3, blank=True)
+    payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default='none')
+    last_payment_date = models.DateTimeField(null=True, blank=True)
+    
+    attendance_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    current_gpa = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['batch', 'student_code'], name='students_summary_batch'),
+            models.Index(fields=['status', 'student_code'], name='students_summary_status'),
+            models.Index(fields=['payment_status', 'student_code'], name='students_summary_payment'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student_code} - {self.get_full_name()}"
+    
+    def get_full_name(self):
+        return f"{self.first_name} {self.last_name}".strip()
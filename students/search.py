@@ -0,0 +1,209 @@
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, IntegerField
+import re
+import uuid
+
+from .models import Student, SearchDocument
+
+# Fields joined into each kind's document, read with values_list from its active rows
+DOCUMENT_FIELDS = {
+    'student': ['student_id', 'user__first_name', 'user__last_name', 'user__email', 'phone'],
+    'contact': ['name', 'email', 'phone', 'notes'],
+}
+
+# Best matches a search narrows a queryset to; broader queries show only these
+MAX_SEARCH_RESULTS = 500
+
+# Documents written per bulk statement while indexing
+INDEX_BATCH_SIZE = 1000
+
+# SQLite's trigram tokenizer can't match anything shorter
+MIN_TRIGRAM_LENGTH = 3
+
+
+def search_terms(query):
+    """Lower-cased words of a query; "STU-2026-0042" becomes stu, 2026, 0042"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def source_queryset(kind):
+    """Active rows of a kind, the only ones that are indexed"""
+    if kind == 'student':
+        return Student.objects.filter(is_active=True)
+    if kind == 'contact':
+        from contacts.models import Contact
+        return Contact.objects.filter(is_active=True)
+    raise ValueError(f'Unknown search kind: {kind}')
+
+
+def build_documents(kind, queryset):
+    """Unsaved SearchDocuments for the rows of ``queryset``"""
+    for pk, *values in queryset.values_list('pk', *DOCUMENT_FIELDS[kind]).iterator(chunk_size=INDEX_BATCH_SIZE):
+        yield SearchDocument(kind=kind, object_id=pk, document=' '.join(str(value) for value in values if value))
+
+
+def write_documents(documents):
+    """Insert or replace documents in bulk"""
+    batch = []
+    written = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= INDEX_BATCH_SIZE:
+            written += _upsert(batch)
+            batch = []
+    return written + _upsert(batch)
+
+
+def _upsert(documents):
+    if not documents:
+        return 0
+    SearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['document']
+    )
+    return len(documents)
+
+
+def update_search_index(kind, pks):
+    """Re-index the given rows of a kind; inactive or deleted ones drop out of the index"""
+    pks = list(pks)
+    if not pks:
+        return 0
+    with transaction.atomic():
+        active = source_queryset(kind).filter(pk__in=pks)
+        written = write_documents(build_documents(kind, active))
+        if written < len(pks):
+            SearchDocument.objects.filter(kind=kind, object_id__in=pks).exclude(
+                object_id__in=active.values('pk')
+            ).delete()
+    return written
+
+
+def remove_from_search_index(kind, pks):
+    SearchDocument.objects.filter(kind=kind, object_id__in=list(pks)).delete()
+
+
+def rebuild_search_index(kinds=None):
+    """Rewrite the index of each kind from its table; returns the documents written per kind"""
+    written = {}
+    for kind in kinds or DOCUMENT_FIELDS:
+        with transaction.atomic():
+            SearchDocument.objects.filter(kind=kind).delete()
+            written[kind] = write_documents(build_documents(kind, source_queryset(kind)))
+    return written
+
+
+class SearchBackend:
+    """Unranked substring search, for databases without a dedicated index"""
+    
+    def matches(self, kind, terms, limit=MAX_SEARCH_RESULTS, scope=None):
+        """(object_id, rank) of the best documents containing every term, best first"""
+        # ``scope`` is a one-column queryset of the ids to search among; the limit applies within it
+        documents = SearchDocument.objects.filter(kind=kind)
+        if scope is not None:
+            documents = documents.filter(object_id__in=scope)
+        for term in terms:
+            documents = documents.filter(document__icontains=term)
+        return [(object_id, 0) for object_id in documents.order_by('pk').values_list('object_id', flat=True)[:limit]]
+    
+    def _scope_sql(self, scope, column):
+        """SQL condition keeping ``column`` within the ids of ``scope``, and its params"""
+        if scope is None:
+            return '', []
+        sql, params = scope.query.sql_with_params()
+        return f' AND {column} IN ({sql})', list(params)
+    
+    def _fetch(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            # SQLite hands UUIDs back as 32 hex digits
+            return [(uuid.UUID(str(object_id)), rank) for object_id, rank in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Generated tsvector column ranked with ts_rank, and pg_trgm for substring matches"""
+    
+    def matches(self, kind, terms, limit=MAX_SEARCH_RESULTS, scope=None):
+        table = connection.ops.quote_name(SearchDocument._meta.db_table)
+        in_scope, scope_params = self._scope_sql(scope, 'object_id')
+        # Each term must appear somewhere (the trigram index serves ILIKE); whole-word
+        # and prefix hits on the tsvector rank above plain substrings
+        contains_all = ' AND '.join(['document ILIKE %s'] * len(terms))
+        sql = (
+            f'SELECT object_id, ts_rank(search_vector, query) + word_similarity(%s, document) AS rank '
+            f"FROM {table}, to_tsquery('simple', %s) AS query "
+            f'WHERE kind = %s AND (search_vector @@ query OR ({contains_all})){in_scope} '
+            f'ORDER BY rank DESC, object_id LIMIT %s'
+        )
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        params = [' '.join(terms), tsquery, kind] + [like_pattern(term) for term in terms] + scope_params + [limit]
+        return self._fetch(sql, params)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 trigram shadow table over SearchDocument, ranked with bm25"""
+    
+    def matches(self, kind, terms, limit=MAX_SEARCH_RESULTS, scope=None):
+        quote_name = connection.ops.quote_name
+        table = quote_name(SearchDocument._meta.db_table)
+        fts_table = quote_name(f'{SearchDocument._meta.db_table}_fts')
+        
+        indexed = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH]
+        short = [term for term in terms if len(term) < MIN_TRIGRAM_LENGTH]
+        contains_short = ''.join(" AND d.document LIKE %s ESCAPE '\\'" for _ in short)
+        short_params = [like_pattern(term) for term in short]
+        in_scope, scope_params = self._scope_sql(scope, 'd.object_id')
+        
+        if not indexed:
+            # Nothing long enough for the trigram index; scanning the documents is still
+            # cheaper than the joins the views would otherwise do
+            sql = (
+                f'SELECT d.object_id, 0 FROM {table} d WHERE d.kind = %s{contains_short}{in_scope} '
+                f'ORDER BY d.id LIMIT %s'
+            )
+            return self._fetch(sql, [kind] + short_params + scope_params + [limit])
+        
+        sql = (
+            f'SELECT d.object_id, bm25({fts_table}) AS rank FROM {fts_table} '
+            f'JOIN {table} d ON d.id = {fts_table}.rowid '
+            f'WHERE {fts_table} MATCH %s AND d.kind = %s{contains_short}{in_scope} '
+            f'ORDER BY rank LIMIT %s'
+        )
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in indexed)
+        return self._fetch(sql, [match, kind] + short_params + scope_params + [limit])
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    return SearchBackend()
+
+
+def search(queryset, query, kind='student', field='pk', limit=MAX_SEARCH_RESULTS):
+    """Narrow ``queryset`` to the best matches for ``query``, annotated with ``search_position`` (0 is best)"""
+    # ``field`` is the queryset's field holding the kind's primary key, e.g. student_id for payments;
+    # the queryset's own filters go into the search, so the limit counts only rows it could return
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    
+    scope = queryset.order_by().values(field)
+    object_ids = [object_id for object_id, _ in get_search_backend().matches(kind, terms, limit, scope)]
+    if not object_ids:
+        return queryset.none()
+    
+    position = Case(
+        *[When(**{field: object_id}, then=Value(index)) for index, object_id in enumerate(object_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(**{f'{field}__in': object_ids}).annotate(search_position=position).order_by(
+        'search_position', *(queryset.query.order_by or queryset.model._meta.ordering)
+    )
@@ -0,0 +1,225 @@
+from django.db import transaction
+from django.db.models import Q, F, Sum, Count, Max, Case, When, Value, FloatField
+from decimal import Decimal
+
+from batches.models import BatchAttendance, BatchGrade
+from core.currency import currency_rates
+from core.jobs import enqueue
+from core.models import BackgroundJob
+from core.processes import django_process_pool
+from fees.models import StudentPayment, PaymentTransaction
+from .models import Student, StudentSummary, GRADE_POINTS
+
+# Students refreshed per chunk; also the bulk upsert batch size
+SUMMARY_CHUNK_SIZE = 2000
+
+# Attendance that counts towards the rate; excused days count neither way
+ATTENDED_STATUSES = ['present', 'late']
+
+SUMMARY_FIELDS = [
+    'student_code', 'first_name', 'last_name', 'email', 'note', 'batch', 'batch_name', 'status',
+    'amount_billed', 'amount_paid', 'amount_remaining', 'currency_code', 'payment_status',
+    'last_payment_date', 'attendance_rate', 'current_gpa', 'refreshed_at',
+]
+
+
+def _money(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def payment_status(totals):
+    """One status for all of a student's payments: overdue wins, then anything short of paid up"""
+    if not totals or not totals['payments']:
+        return 'none'
+    if totals['overdue']:
+        return 'overdue'
+    if totals['completed'] == totals['payments']:
+        return 'completed'
+    return 'partial' if totals['started'] else 'pending'
+
+
+def _payment_totals(student_ids):
+    rows = StudentPayment.objects.filter(student_id__in=student_ids, is_active=True).order_by().values(
+        'student_id'
+    ).annotate(
+        billed=Sum(currency_rates.converted('total_amount')),
+        paid=Sum(currency_rates.converted('total_paid')),
+        remaining=Sum(currency_rates.converted('remaining_amount')),
+        payments=Count('pk'),
+        completed=Count('pk', filter=Q(status='completed')),
+        overdue=Count('pk', filter=Q(status='overdue')),
+        started=Count('pk', filter=Q(total_paid__gt=0)),
+    )
+    return {row.pop('student_id'): row for row in rows}
+
+
+def _last_payment_dates(student_ids):
+    rows = PaymentTransaction.objects.filter(
+        payment__student_id__in=student_ids,
+        payment__is_active=True,
+        is_active=True
+    ).order_by().values('payment__student_id').annotate(last=Max('payment_date'))
+    return {row['payment__student_id']: row['last'] for row in rows}
+
+
+def _attendance_rates(student_ids):
+    rows = BatchAttendance.objects.filter(student_id__in=student_ids, is_active=True).order_by().values(
+        'student_id'
+    ).annotate(
+        counted=Count('pk', filter=~Q(status='excused')),
+        attended=Count('pk', filter=Q(status__in=ATTENDED_STATUSES)),
+    )
+    return {
+        row['student_id']: Decimal(row['attended'] * 100 / row['counted']).quantize(Decimal('0.01'))
+        for row in rows if row['counted']
+    }
+
+
+def _current_gpas(student_ids):
+    """Credit-weighted GPA over the current semester, as Student.get_current_gpa computes it"""
+    points = Case(
+        *[When(letter_grade=grade, then=Value(value)) for grade, value in GRADE_POINTS.items()],
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    rows = BatchGrade.objects.filter(student_id__in=student_ids, semester__is_current=True).order_by().values(
+        'student_id'
+    ).annotate(
+        points=Sum(points * F('course__credits'), output_field=FloatField()),
+        credits=Sum('course__credits'),
+    )
+    return {
+        row['student_id']: Decimal(str(round(row['points'] / row['credits'], 2)))
+        for row in rows if row['credits']
+    }
+
+
+def build_summaries(students):
+    """Unsaved StudentSummary rows for a queryset of students, in one query per source table"""
+    rows = list(students.filter(is_active=True).values(
+        'pk', 'student_id', 'user__first_name', 'user__last_name', 'user__email', 'note',
+        'batch_id', 'batch__name', 'status'
+    ))
+    student_ids = [row['pk'] for row in rows]
+    if not student_ids:
+        return []
+    
+    payments = _payment_totals(student_ids)
+    last_payments = _last_payment_dates(student_ids)
+    attendance = _attendance_rates(student_ids)
+    gpas = _current_gpas(student_ids)
+    currency_code = currency_rates.reporting_currency()['code']
+    
+    summaries = []
+    for row in rows:
+        totals = payments.get(row['pk'])
+        summaries.append(StudentSummary(
+            student_id=row['pk'],
+            student_code=row['student_id'],
+            first_name=row['user__first_name'],
+            last_name=row['user__last_name'],
+            email=row['user__email'],
+            note=row['note'],
+            batch_id=row['batch_id'],
+            batch_name=row['batch__name'] or '',
+            status=row['status'],
+            amount_billed=_money(totals and totals['billed']),
+            amount_paid=_money(totals and totals['paid']),
+            amount_remaining=_money(totals and totals['remaining']),
+            currency_code=currency_code,
+            payment_status=payment_status(totals),
+            last_payment_date=last_payments.get(row['pk']),
+            attendance_rate=attendance.get(row['pk']),
+            current_gpa=gpas.get(row['pk'], Decimal('0')),
+        ))
+    return summaries
+
+
+def write_summaries(summaries):
+    """Insert or replace summary rows in bulk"""
+    StudentSummary.objects.bulk_create(
+        summaries,
+        batch_size=SUMMARY_CHUNK_SIZE,
+        update_conflicts=True,
+        unique_fields=['student'],
+        update_fields=SUMMARY_FIELDS
+    )
+    return len(summaries)
+
+
+def refresh_student_summaries(student_ids):
+    """Rewrite the summaries of the given students; inactive or deleted ones drop out"""
+    student_ids = list(set(student_ids))
+    if not student_ids:
+        return 0
+    written = 0
+    for start in range(0, len(student_ids), SUMMARY_CHUNK_SIZE):
+        chunk = student_ids[start:start + SUMMARY_CHUNK_SIZE]
+        with transaction.atomic():
+            summaries = build_summaries(Student.objects.filter(pk__in=chunk))
+            written += write_summaries(summaries)
+            if len(summaries) < len(chunk):
+                kept = {summary.student_id for summary in summaries}
+                StudentSummary.objects.filter(student_id__in=[pk for pk in chunk if pk not in kept]).delete()
+    return written
+
+
+def refresh_summaries_on_commit(student_ids):
+    """Refresh once the current transaction commits, so the summaries see what it wrote"""
+    student_ids = [student_id for student_id in student_ids if student_id]
+    if student_ids:
+        # Robust: a failed refresh is logged and left to the rebuild, never failing the write itself
+        transaction.on_commit(lambda: refresh_student_summaries(student_ids), robust=True)
+
+
+def refresh_summaries_for_payments(payment_ids):
+    student_ids = StudentPayment.objects.filter(pk__in=list(payment_ids)).values_list('student_id', flat=True)
+    refresh_summaries_on_commit(list(student_ids))
+
+
+def queue_summary_rebuild():
+    """Queue a full rebuild for changes that touch every summary, unless one is already waiting"""
+    waiting = BackgroundJob.objects.filter(
+        kind='students.rebuild_student_summaries',
+        status='queued',
+        is_active=True
+    ).exists()
+    if not waiting:
+        enqueue('students.rebuild_student_summaries', label='Rebuild of student summaries')
+
+
+def student_chunks(chunk_size=SUMMARY_CHUNK_SIZE):
+    """(pk_from, pk_to) ranges of about ``chunk_size`` students each, covering every student"""
+    boundaries = [None]
+    pks = Student.objects.order_by('pk').values_list('pk', flat=True)
+    for position, pk in enumerate(pks.iterator(chunk_size=chunk_size)):
+        if position and position % chunk_size == 0:
+            boundaries.append(pk)
+    boundaries.append(None)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _rebuild_chunk(bounds):
+    pk_from, pk_to = bounds
+    students = Student.objects.all()
+    if pk_from is not None:
+        students = students.filter(pk__gte=pk_from)
+    if pk_to is not None:
+        students = students.filter(pk__lt=pk_to)
+    with transaction.atomic():
+        written = write_summaries(build_summaries(students))
+        # Summaries whose student left the range's active set
+        StudentSummary.objects.filter(
+            student__in=students.filter(is_active=False)
+        ).delete()
+    return written
+
+
+def rebuild_student_summaries(chunk_size=SUMMARY_CHUNK_SIZE, workers=1):
+    """Rewrite every summary chunk by chunk, on ``workers`` processes; returns the rows written"""
+    tasks = student_chunks(chunk_size)
+    if workers > 1 and len(tasks) > 1:
+        # Each chunk commits on its own, so a failure leaves the finished chunks in place
+        with django_process_pool(workers) as pool:
+            return sum(pool.map(_rebuild_chunk, tasks))
+    return sum(_rebuild_chunk(task) for task in tasks)
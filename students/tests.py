@@ -1,3 +1,375 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+import tempfile
 
-# Create your tests here.
+from batches.models import Batch
+from core.jobs import enqueue, load_job_handlers, run_job
+from core.models import Currency
+from core.pagination import CursorPaginator
+from fees.models import StudentPayment
+from fees.services import record_payment
+from .detail import build_detail_context, get_detail_context
+from .duplicates import find_duplicates
+from .identifiers import assign_student_ids
+from .imports import StudentImporter, allocate_usernames
+from .models import Student, StudentSummary, StudentImport
+from .search import search
+
+
+class StudentTestCase(TestCase):
+    """Students in two batches, with the on-commit index and summary updates run as they'd be in production"""
+    
+    def setUp(self):
+        Currency.objects.create(code='USD', name='US Dollar', symbol='$', exchange_rate=1, is_default=True)
+        self.batch = Batch.objects.create(name='Batch 57', code='B57', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        self.other_batch = Batch.objects.create(name='Batch 58', code='B58', start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+        self.count = 0
+    
+    def make_student(self, first_name, last_name, phone='', batch=None):
+        self.count += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(
+                f'student{self.count}', f's{self.count}@example.com', 'pw', first_name=first_name, last_name=last_name
+            )
+            return Student.objects.create(
+                user=user, batch=batch or self.batch, enrollment_date=date(2026, 1, 1), phone=phone
+            )
+
+
+class SearchTests(StudentTestCase):
+    """search() narrows a queryset to the best matches"""
+    
+    def setUp(self):
+        super().setUp()
+        self.rahim = self.make_student('Rahim', 'Khan', '01711111111')
+        self.karim = self.make_student('Karim', 'Khan', '01722222222', batch=self.other_batch)
+        self.nusrat = self.make_student('Nusrat', 'Jahan', '01733333333')
+    
+    def test_name(self):
+        self.assertEqual(list(search(Student.objects.all(), 'rahim')), [self.rahim])
+        self.assertEqual(set(search(Student.objects.all(), 'Khan')), {self.rahim, self.karim})
+    
+    def test_every_term(self):
+        self.assertEqual(list(search(Student.objects.all(), 'karim khan')), [self.karim])
+        self.assertFalse(search(Student.objects.all(), 'karim jahan').exists())
+    
+    def test_student_id_and_phone(self):
+        self.assertEqual(list(search(Student.objects.all(), self.nusrat.student_id)), [self.nusrat])
+        self.assertEqual(list(search(Student.objects.all(), '01722222222')), [self.karim])
+    
+    def test_scope_before_limit(self):
+        # The caller's filter is applied inside the search, so a tight limit still finds the batch's match
+        results = search(Student.objects.filter(batch=self.other_batch), 'khan', limit=1)
+        self.assertEqual(list(results), [self.karim])
+    
+    def test_related_field(self):
+        payments = search(StudentPayment.objects.all(), 'nusrat', field='student_id')
+        self.assertEqual([payment.student for payment in payments], [self.nusrat])
+    
+    def test_edit_reindexes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rahim.user.first_name = 'Rahman'
+            self.rahim.user.save()
+            self.rahim.save()
+        self.assertFalse(search(Student.objects.all(), 'rahim').exists())
+        self.assertEqual(list(search(Student.objects.all(), 'rahman')), [self.rahim])
+    
+    def test_empty_query(self):
+        self.assertFalse(search(Student.objects.all(), '  ').exists())
+
+
+class DuplicateTests(StudentTestCase):
+    """find_duplicates() ranks students who may be the person being added"""
+    
+    def setUp(self):
+        super().setUp()
+        self.rahim = self.make_student('Rahim', 'Khan', '01711111111')
+        self.mohammad = self.make_student('Mohammad', 'Rahman', '01722222222')
+    
+    def matches(self, first_name='', last_name='', phone=''):
+        return [
+            (candidate['student'], candidate['match_type'])
+            for candidate in find_duplicates(first_name, last_name, phone)
+        ]
+    
+    def test_name(self):
+        self.assertEqual(self.matches('khan', 'RAHIM'), [(self.rahim, 'name')])
+    
+    def test_phonetic(self):
+        self.assertEqual(self.matches('Muhammad', 'Rehman'), [(self.mohammad, 'phonetic')])
+    
+    def test_partial_name(self):
+        self.assertEqual(self.matches('Md Rahim', 'Khan'), [(self.rahim, 'partial_name')])
+        self.assertEqual(self.matches('Rahim Uddin', 'Khan'), [(self.rahim, 'partial_name')])
+        self.assertEqual(self.matches('Abdul', 'Khan'), [])
+    
+    def test_phone(self):
+        # Local, international and 00-prefixed forms of one number
+        for phone in ['01711111111', '+8801711111111', '008801711111111']:
+            self.assertEqual(self.matches(phone=phone), [(self.rahim, 'phone')])
+        self.assertEqual(self.matches('Rahim', 'Khan', '+880 1711-111111'), [(self.rahim, 'name_and_phone')])
+    
+    def test_ranking(self):
+        md_rahim = self.make_student('Md Rahim', 'Khan')
+        candidates = find_duplicates('Rahim', 'Khan')
+        self.assertEqual([candidate['student'] for candidate in candidates], [self.rahim, md_rahim])
+        self.assertGreater(candidates[0]['score'], candidates[1]['score'])
+        
+        # With a phone number given, the student it belongs to outranks a same-named one without it
+        candidates = find_duplicates('Md Rahim', 'Khan', '01711111111')
+        self.assertEqual([candidate['student'] for candidate in candidates], [self.rahim, md_rahim])
+    
+    def test_inactive_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rahim.is_active = False
+            self.rahim.save()
+        self.assertEqual(self.matches('Rahim', 'Khan'), [])
+
+
+class CursorPaginatorTests(StudentTestCase):
+    """Keyset pages over the student list's summary rows"""
+    
+    def setUp(self):
+        super().setUp()
+        for number in range(5):
+            self.make_student(f'Student{number}', 'Khan')
+        self.queryset = StudentSummary.objects.order_by('student_code')
+        self.students = list(self.queryset)
+    
+    def test_next_and_previous(self):
+        paginator = CursorPaginator(self.queryset, per_page=2)
+        first = paginator.get_page()
+        self.assertEqual(list(first), self.students[:2])
+        self.assertFalse(first.has_previous())
+        self.assertIsNone(first.previous_cursor)
+        
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual(list(second), self.students[2:4])
+        self.assertEqual((second.start_index(), second.end_index()), (3, 4))
+        
+        last = paginator.get_page(second.next_cursor)
+        self.assertEqual(list(last), self.students[4:])
+        self.assertFalse(last.has_next())
+        self.assertIsNone(last.next_cursor)
+        
+        back = paginator.get_page(last.previous_cursor)
+        self.assertEqual(list(back), self.students[2:4])
+        self.assertEqual(back.start_index(), 3)
+        self.assertEqual(list(paginator.get_page(back.previous_cursor)), self.students[:2])
+    
+    def test_stable_under_inserts(self):
+        paginator = CursorPaginator(self.queryset, per_page=2)
+        first = paginator.get_page()
+        # A student added while paging neither shifts the page a cursor points at nor gets skipped
+        self.make_student('Newest', 'Khan')
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual(list(second), self.students[2:4])
+        self.assertEqual(len(paginator.get_page(second.next_cursor)), 2)
+    
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(self.queryset, per_page=2)
+        self.assertEqual(list(paginator.get_page('tampered')), self.students[:2])
+        self.assertEqual(paginator.count, 5)
+
+
+class SummaryTests(StudentTestCase):
+    """StudentSummary rows follow the students and payments they summarize"""
+    
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_student('Rahim', 'Khan')
+        self.payment = StudentPayment.objects.get(student=self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.total_amount = 1000
+            self.payment.save()
+    
+    def test_created(self):
+        summary = StudentSummary.objects.get(student=self.student)
+        self.assertEqual(summary.student_code, self.student.student_id)
+        self.assertEqual(summary.batch_name, 'Batch 57')
+        self.assertEqual(summary.amount_billed, Decimal('1000'))
+        self.assertEqual(summary.payment_status, 'pending')
+    
+    def test_payment(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_payment(self.payment, '400')
+        summary = StudentSummary.objects.get(student=self.student)
+        self.assertEqual(summary.amount_paid, Decimal('400'))
+        self.assertEqual(summary.amount_remaining, Decimal('600'))
+        self.assertEqual(summary.payment_status, 'partial')
+        self.assertIsNotNone(summary.last_payment_date)
+    
+    def test_name_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.user.last_name = 'Uddin'
+            self.student.user.save()
+        self.assertEqual(StudentSummary.objects.get(student=self.student).last_name, 'Uddin')
+    
+    def test_deactivated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.is_active = False
+            self.student.save()
+        self.assertFalse(StudentSummary.objects.filter(student=self.student).exists())
+
+
+class StudentIdTests(StudentTestCase):
+    """Student IDs come from a per-year sequence, never from the highest ID still on file"""
+    
+    def test_sequential(self):
+        first, second = self.make_student('Rahim', 'Khan'), self.make_student('Karim', 'Khan')
+        self.assertEqual([first.student_id, second.student_id], ['STU-2026-0001', 'STU-2026-0002'])
+    
+    def test_not_reused_after_delete(self):
+        self.make_student('Rahim', 'Khan')
+        self.make_student('Karim', 'Khan').delete()
+        self.assertEqual(self.make_student('Nusrat', 'Jahan').student_id, 'STU-2026-0003')
+    
+    def test_per_enrollment_year(self):
+        self.make_student('Rahim', 'Khan')
+        students = assign_student_ids([
+            Student(enrollment_date=date(2025, 9, 1)),
+            Student(enrollment_date=date(2026, 9, 1)),
+            Student(enrollment_date=date(2025, 9, 1), student_id='STU-2025-0099'),
+            Student(enrollment_date=date(2025, 10, 1)),
+        ])
+        self.assertEqual(
+            [student.student_id for student in students],
+            ['STU-2025-0001', 'STU-2026-0002', 'STU-2025-0099', 'STU-2025-0002']
+        )
+
+
+class StudentDetailTests(StudentTestCase):
+    """The detail page loads in a fixed number of queries and is cached until something it shows changes"""
+    
+    def setUp(self):
+        super().setUp()
+        self.student = self.make_student('Rahim', 'Khan')
+        self.payment = StudentPayment.objects.get(student=self.student)
+        self.payment.total_amount = 1000
+        self.payment.save()
+    
+    def test_cached(self):
+        get_detail_context(self.student.student_id)
+        # Only the version query runs while nothing has changed
+        with self.assertNumQueries(1):
+            context = get_detail_context(self.student.student_id)
+        self.assertEqual(context['student'], self.student)
+    
+    def test_invalidated(self):
+        get_detail_context(self.student.student_id)
+        record_payment(self.payment, '400')
+        context = get_detail_context(self.student.student_id)
+        self.assertEqual(context['total_payment'].total_paid, Decimal('400'))
+        self.assertEqual(len(context['recent_transactions']), 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.user.first_name = 'Rahman'
+            self.student.user.save()
+        self.assertEqual(get_detail_context(self.student.student_id)['title'], 'Student - Rahman Khan')
+    
+    def test_queries_constant(self):
+        record_payment(self.payment, '100')
+        with CaptureQueriesContext(connection) as one_transaction:
+            build_detail_context(self.student.pk)
+        for _ in range(4):
+            record_payment(self.payment, '100')
+        with CaptureQueriesContext(connection) as five_transactions:
+            context = build_detail_context(self.student.pk)
+        self.assertEqual(len(context['recent_transactions']), 5)
+        self.assertEqual(len(five_transactions), len(one_transaction))
+    
+    def test_inactive(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.is_active = False
+            self.student.save()
+        with self.assertRaises(Student.DoesNotExist):
+            get_detail_context(self.student.student_id)
+
+
+class StudentImportTests(StudentTestCase):
+    """Bulk enrollment creates students in bulk and rejects rows it can't enroll"""
+    
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.import_record = StudentImport.objects.create(batch=self.batch, file_name='students.csv', imported_by=self.admin)
+    
+    def enroll(self, rows):
+        importer = StudentImporter(self.import_record, self.admin, site_url='https://sma.example/', workers=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            importer.run([rows])
+        return importer
+    
+    def test_rows(self):
+        User.objects.create_user('existing', 'Taken@Example.com', 'pw')
+        importer = self.enroll([
+            {'First Name': 'Rahim', 'Last Name': 'Khan', 'Email': 'Rahim@Example.com', 'Total Amount': 1000},
+            {'First Name': 'Karim', 'Last Name': 'Khan', 'Email': 'taken@example.com'},
+            {'First Name': 'Rahim', 'Last Name': 'Khan', 'Password': 'secret-pass', 'Total Amount': '1,500'},
+            {'First Name': 'Nusrat', 'Last Name': ''},
+            {'First Name': 'Nusrat', 'Last Name': 'Jahan', 'Total Amount': 'abc'},
+        ])
+        
+        self.import_record.refresh_from_db()
+        self.assertEqual((self.import_record.successful_imports, self.import_record.failed_imports), (2, 3))
+        self.assertEqual(
+            sorted(line.split(':')[0] for line in self.import_record.error_log.splitlines()), ['Row 3', 'Row 5', 'Row 6']
+        )
+        self.assertIn('already exists', self.import_record.error_log)
+        
+        first, second = Student.objects.filter(batch=self.batch).order_by('student_id')
+        self.assertEqual((first.user.username, second.user.username), ('rahim.khan', 'rahim.khan1'))
+        self.assertEqual(first.user.email, 'rahim@example.com')
+        self.assertFalse(first.user.has_usable_password())
+        self.assertTrue(second.user.check_password('secret-pass'))
+        self.assertEqual(StudentPayment.objects.get(student=second).total_amount, Decimal('1500'))
+        self.assertEqual(StudentSummary.objects.filter(student__in=[first, second]).count(), 2)
+        
+        # Only the student without a password is invited, with the date the link stops working
+        [invitation] = importer.invitations
+        self.assertEqual(invitation[:3], [first.student_id, 'Rahim Khan', 'rahim.khan'])
+        self.assertTrue(invitation[4].startswith('https://sma.example/'))
+        self.assertTrue(invitation[5])
+    
+    def test_username_taken_concurrently(self):
+        def allocate_then_lose_the_race(requested):
+            usernames = allocate_usernames(requested)
+            if not User.objects.filter(username='rahim.khan').exists():
+                # Another import commits the same username between allocation and insert
+                User.objects.create_user('rahim.khan', '', 'pw')
+            return usernames
+        
+        with mock.patch('students.imports.allocate_usernames', side_effect=allocate_then_lose_the_race):
+            self.enroll([{'First Name': 'Rahim', 'Last Name': 'Khan'}])
+        self.assertEqual(Student.objects.get(batch=self.batch).user.username, 'rahim.khan1')
+    
+    def test_upload_deleted(self):
+        load_job_handlers()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root.name))
+        for content, status in [
+            (b'First Name,Last Name,Password\nRahim,Khan,secret-pass\n', 'completed'),
+            (b'First Name,Password\nRahim,secret-pass\n', 'failed'),
+        ]:
+            with self.subTest(status=status):
+                job = enqueue(
+                    'students.import_students', {'import_id': str(self.import_record.pk)},
+                    user=self.admin, input_file=ContentFile(content, name='students.csv')
+                )
+                storage, name = job.input_file.storage, job.input_file.name
+                self.assertTrue(storage.exists(name))
+                
+                with mock.patch('core.jobs.close_old_connections'), mock.patch('core.jobs.logger'):
+                    with self.captureOnCommitCallbacks(execute=True):
+                        self.assertEqual(run_job(job.pk), status)
+                
+                job.refresh_from_db()
+                self.assertFalse(job.input_file)
+                self.assertFalse(storage.exists(name))
@@ -6,6 +6,8 @@ app_name = 'students'
 urlpatterns = [
     path('', views.student_list, name='student_list'),
     path('add/', views.add_student, name='add_student'),
+    path('import/', views.import_students, name='import_students'),
+    path('import/template/', views.download_student_template, name='download_student_template'),
     path('apply/', views.student_application_form, name='application_form'),
     path('apply/success/<uuid:application_id>/', views.application_success, name='application_success'),
     path('applications/', views.student_application_list, name='application_list'),
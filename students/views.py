@@ -1,34 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Q, F
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import Student, StudentApplication, StudentDocument
+from .models import Student, StudentApplication, StudentDocument, StudentImport, StudentSummary
+from .imports import REQUIRED_COLUMNS, OPTIONAL_COLUMNS, invitation_days
+from .search import search
+from .duplicates import find_duplicates
+from .detail import get_detail_context
 from core.models import Currency
+from core.jobs import enqueue
+from core.pagination import CursorPaginator
+from core.uploads import UploadReader, UploadFormatError
 from batches.models import Batch
+import pandas as pd
 import json
 
 @login_required
 def student_list(request):
     """List all students with filtering and search"""
-    students = Student.objects.filter(is_active=True).select_related('user', 'batch').order_by('student_id')
-    
-    # Search functionality
-    search_query = request.GET.get('search', '')
-    if search_query:
-        students = students.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(student_id__icontains=search_query) |
-            Q(user__email__icontains=search_query)
-        )
+    # Summary rows carry the names, batch, balances and rates, so a page is one indexed query
+    students = StudentSummary.objects.order_by('student_code')
     
     # Filter by batch
     batch_filter = request.GET.get('batch', '')
@@ -40,10 +39,14 @@ def student_list(request):
     if status_filter:
         students = students.filter(status=status_filter)
     
+    # Search functionality, within the filters above
+    search_query = request.GET.get('search', '')
+    if search_query:
+        students = search(students, search_query)
+    
     # Pagination
-    paginator = Paginator(students, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(students, 20, approximate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Get selected batch for display
     selected_batch = None
@@ -60,7 +63,7 @@ def student_list(request):
         'search_query': search_query,
         'batch_filter': batch_filter,
         'status_filter': status_filter,
-        'total_students': students.count(),
+        'total_students': paginator.count,
         'selected_batch': selected_batch,
     }
     
@@ -70,63 +73,8 @@ def student_list(request):
 def student_detail(request, student_id):
     """Student detail view"""
     try:
-        student = Student.objects.get(student_id=student_id, is_active=True)
-        
-        # Get student's grades
-        from batches.models import BatchGrade, BatchAttendance
-        from fees.models import StudentPayment, PaymentTransaction
-        
-        grades = BatchGrade.objects.filter(student=student).order_by('-semester__start_date')
-        attendance = BatchAttendance.objects.filter(student=student).order_by('-date')[:10]
-        
-        # Get payment information
-        payments = StudentPayment.objects.filter(student=student).order_by('-created_at')
-        recent_transactions = PaymentTransaction.objects.filter(
-            payment__student=student
-        ).order_by('-payment_date')[:10]
-        
-        # Calculate total payment information
-        total_paid = sum(payment.get_total_paid() for payment in payments)
-        total_amount = sum(payment.total_amount for payment in payments)
-        
-        # Create total payment object
-        class TotalPayment:
-            def __init__(self, total_amount, total_paid, currency, status):
-                from decimal import Decimal
-                self.total_amount = Decimal(str(total_amount or 0))
-                self.total_paid = Decimal(str(total_paid or 0))
-                self.currency = currency
-                self.status = status
-                self.remaining = self.total_amount - self.total_paid
-            
-            def get_status_display(self):
-                if self.total_paid >= self.total_amount:
-                    return 'Completed'
-                elif self.total_paid > 0:
-                    return 'Partial'
-                else:
-                    return 'Pending'
-        
-        total_payment = None
-        if payments.exists():
-            latest_payment = payments.first()
-            total_payment = TotalPayment(
-                total_amount,
-                total_paid,
-                latest_payment.currency,
-                'completed' if total_paid >= total_amount else 'partial'
-            )
-        
-        context = {
-            'title': f'Student - {student.user.get_full_name()}',
-            'student': student,
-            'grades': grades,
-            'attendance': attendance,
-            'payments': payments,
-            'recent_transactions': recent_transactions,
-            'total_payment': total_payment,
-        }
-        
+        # Built in a fixed handful of queries and cached until one of the student's rows changes
+        context = get_detail_context(student_id)
         return render(request, 'students/student_detail.html', context)
     except Student.DoesNotExist:
         return redirect('students:student_not_found')
@@ -337,7 +285,8 @@ def add_student(request):
             
             if total_amount and float(total_amount) > 0:
                 from core.models import Currency
-                from fees.models import StudentPayment, PaymentTransaction
+                from fees.models import StudentPayment
+                from fees.services import record_payment
                 from accounts.models import UserProfile
                 
                 try:
@@ -388,9 +337,9 @@ def add_student(request):
                     
                     # If first installment is provided, create a transaction
                     if first_installment > 0:
-                        PaymentTransaction.objects.create(
-                            payment=payment,
-                            amount=first_installment,
+                        record_payment(
+                            payment,
+                            first_installment,
                             payment_method='cash',
                             notes=f'First installment payment',
                             processed_by=request.user  # Use User instance, not UserProfile
@@ -418,6 +367,91 @@ def add_student(request):
     
     return render(request, 'students/add_student.html', context)
 
+def is_admin_user(user):
+    if user.is_superuser:
+        return True
+    profile = getattr(user, 'profile', None)
+    return profile is not None and profile.role == 'admin'
+
+@login_required
+def import_students(request):
+    """Bulk enrollment from a CSV or Excel sheet (Admin only)"""
+    if not is_admin_user(request.user):
+        messages.error(request, 'You do not have permission to add students.')
+        return redirect('students:student_list')
+    
+    if request.method == 'POST':
+        batch_id = request.POST.get('batch')
+        student_file = request.FILES.get('student_file')
+        if not batch_id or not student_file:
+            messages.error(request, 'Please select a batch and upload a CSV or Excel file.')
+            return redirect('students:import_students')
+        
+        batch = get_object_or_404(Batch, id=batch_id, is_active=True)
+        
+        # Check the header row now so a wrong file is rejected straight away
+        try:
+            UploadReader(student_file, student_file.name, REQUIRED_COLUMNS).close()
+        except UploadFormatError as e:
+            messages.error(request, str(e))
+            return redirect('students:import_students')
+        student_file.seek(0)
+        
+        import_record = StudentImport.objects.create(
+            batch=batch,
+            file_name=student_file.name,
+            imported_by=request.user
+        )
+        job = enqueue(
+            'students.import_students',
+            {'import_id': str(import_record.id), 'site_url': request.build_absolute_uri('/')},
+            user=request.user,
+            label=f'Enroll {student_file.name} into {batch.name}',
+            input_file=student_file
+        )
+        
+        messages.info(request, f'Enrollment of {student_file.name} has been queued. Invitation links can be downloaded once it finishes.')
+        return redirect('core:job_status', job_id=job.id)
+    
+    imports = StudentImport.objects.filter(is_active=True).select_related('batch', 'imported_by')
+    paginator = Paginator(imports, 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    context = {
+        'title': 'Import Students',
+        'page_obj': page_obj,
+        'batches': Batch.objects.filter(is_active=True).exclude(status='completed'),
+        'required_columns': REQUIRED_COLUMNS,
+        'optional_columns': OPTIONAL_COLUMNS,
+        'invitation_days': invitation_days(),
+    }
+    
+    return render(request, 'students/import_students.html', context)
+
+@login_required
+def download_student_template(request):
+    """Download Excel template for bulk enrollment"""
+    template_data = {
+        'First Name': ['Ayesha', 'Rahim'],
+        'Last Name': ['Khan', 'Uddin'],
+        'Email': ['ayesha@example.com', ''],
+        'Username': ['', ''],  # Blank builds first.last
+        'Password': ['', ''],  # Blank sends an invitation link instead
+        'Phone': ['+8801700000001', '+8801700000002'],
+        'Enrollment Date': ['2025-01-15', '2025-01-15'],
+        'Total Amount': [50000, 50000],
+        'Currency': ['BDT', 'BDT'],  # Currency code; blank uses the default currency
+        'Note': ['', ''],
+    }
+    
+    df = pd.DataFrame(template_data)
+    
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = 'attachment; filename=student_import_template.xlsx'
+    
+    df.to_excel(response, index=False)
+    return response
+
 @login_required
 def edit_student(request, student_id):
     """Edit student (Admin only)"""
@@ -450,29 +484,20 @@ def edit_student(request, student_id):
             if request.POST.get('update_status') == 'true':
                 # Handle payment status update
                 payment_status = request.POST.get('payment_status')
+                from fees.models import FeeInstallment
                 if payment_status == 'complete':
                     # Mark all pending installments as paid
-                    from fees.models import FeeInstallment
-                    pending_installments = FeeInstallment.objects.filter(
+                    FeeInstallment.objects.filter(
                         student=student,
-                        status='pending'
-                    )
-                    for installment in pending_installments:
-                        installment.status = 'paid'
-                        installment.payment_date = timezone.now().date()
-                        installment.save()
+                        status__in=['pending', 'partial', 'overdue']
+                    ).update(status='paid', paid_amount=F('amount'), paid_date=timezone.now().date())
                     messages.success(request, f'All pending installments for {student.get_full_name()} marked as complete!')
                 else:
                     # Mark all paid installments as pending (remaining)
-                    from fees.models import FeeInstallment
-                    paid_installments = FeeInstallment.objects.filter(
+                    FeeInstallment.objects.filter(
                         student=student,
                         status='paid'
-                    )
-                    for installment in paid_installments:
-                        installment.status = 'pending'
-                        installment.payment_date = None
-                        installment.save()
+                    ).update(status='pending', paid_amount=0, paid_date=None)
                     messages.success(request, f'Payment status for {student.get_full_name()} updated to remaining!')
                 
                 return redirect('students:edit_student', student_id=student.student_id)
@@ -484,32 +509,22 @@ def edit_student(request, student_id):
                 currency_id = request.POST.get('installment_currency')
                 
                 if installment_amount and installment_count:
-                    from fees.models import FeeInstallment
+                    from fees.models import StudentPayment
+                    from fees.installments import append_installments
                     from core.models import Currency
-                    from datetime import datetime, timedelta
                     
                     try:
                         currency = Currency.objects.get(id=currency_id)
                         amount = float(installment_amount)
                         count = int(installment_count)
+                        payment = StudentPayment.objects.get(student=student, batch=student.batch)
                         
-                        # Create installments
-                        for i in range(count):
-                            # Calculate due date (30 days apart)
-                            due_date = timezone.now().date() + timedelta(days=30 * (i + 1))
-                            
-                            FeeInstallment.objects.create(
-                                student=student,
-                                batch=student.batch,
-                                amount=amount,
-                                currency=currency,
-                                due_date=due_date,
-                                status='pending'
-                            )
+                        # Create installments, 30 days apart
+                        append_installments(payment, amount, count, currency)
                         
                         messages.success(request, f'Successfully created {count} installments of {amount} {currency.code} each for {student.get_full_name()}!')
                         
-                    except (ValueError, Currency.DoesNotExist) as e:
+                    except (ValueError, Currency.DoesNotExist, StudentPayment.DoesNotExist) as e:
                         messages.error(request, f'Error creating installments: {str(e)}')
                 else:
                     messages.error(request, 'Please provide both amount and count for installments.')
@@ -655,58 +670,20 @@ def check_duplicate_student(request):
         last_name = data.get('last_name', '').strip()
         phone = data.get('phone', '').strip()
         
+        # Indexed key lookups, re-ranked by name similarity
         duplicates = []
-        
-        # Check by name - improved case-insensitive matching
-        if first_name and last_name:
-            # Create multiple search patterns for better matching
-            search_patterns = [
-                Q(user__first_name__iexact=first_name) & Q(user__last_name__iexact=last_name),
-                Q(user__first_name__icontains=first_name) & Q(user__last_name__icontains=last_name),
-                Q(user__first_name__iexact=last_name) & Q(user__last_name__iexact=first_name),
-                Q(user__first_name__icontains=last_name) & Q(user__last_name__icontains=first_name),
-            ]
-            
-            # Combine all patterns with OR
-            combined_query = search_patterns[0]
-            for pattern in search_patterns[1:]:
-                combined_query |= pattern
-            
-            name_matches = Student.objects.filter(
-                combined_query,
-                is_active=True
-            ).select_related('user', 'batch')
-            
-            for student in name_matches:
-                duplicates.append({
-                    'id': student.student_id,
-                    'name': student.user.get_full_name(),
-                    'email': student.user.email,
-                    'phone': student.phone,
-                    'batch': student.batch.name if student.batch else 'Not Assigned',
-                    'status': student.get_status_display(),
-                    'match_type': 'name'
-                })
-        
-        # Check by phone
-        if phone:
-            phone_matches = Student.objects.filter(
-                phone__icontains=phone,
-                is_active=True
-            ).select_related('user', 'batch')
-            
-            for student in phone_matches:
-                # Avoid duplicates if already found by name
-                if not any(d['id'] == student.student_id for d in duplicates):
-                    duplicates.append({
-                        'id': student.student_id,
-                        'name': student.user.get_full_name(),
-                        'email': student.user.email,
-                        'phone': student.phone,
-                        'batch': student.batch.name if student.batch else 'Not Assigned',
-                        'status': student.get_status_display(),
-                        'match_type': 'phone'
-                    })
+        for candidate in find_duplicates(first_name, last_name, phone):
+            student = candidate['student']
+            duplicates.append({
+                'id': student.student_id,
+                'name': student.user.get_full_name(),
+                'email': student.user.email,
+                'phone': student.phone,
+                'batch': student.batch.name if student.batch else 'Not Assigned',
+                'status': student.get_status_display(),
+                'match_type': candidate['match_type'],
+                'score': candidate['score']
+            })
         
         return JsonResponse({
             'duplicates': duplicates,